@@ -0,0 +1,159 @@
+# Cache semântico de respostas para perguntas quase idênticas
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from chatbot.vectorstore import embed_query_cached, get_collection_version
+
+ANSWER_CACHE_SIZE = getattr(settings, 'ANSWER_CACHE_SIZE', 512)
+ANSWER_CACHE_THRESHOLD = getattr(settings, 'ANSWER_CACHE_THRESHOLD', 0.95)
+
+
+class SemanticAnswerCache:
+    """
+    Guarda respostas já geradas em uma matriz NumPy de embeddings normalizados.
+    A busca é um único produto matriz-vetor restrito às entradas do mesmo
+    provedor e da mesma versão da base de conhecimento; quando a versão muda,
+    as entradas das versões anteriores são descartadas.
+
+    Args:
+        capacity (int): Número máximo de respostas; a menos usada recentemente é substituída
+        threshold (float): Similaridade de cosseno mínima para considerar a pergunta repetida
+    """
+
+    def __init__(self, capacity=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._namespaces = np.full(capacity, -1, dtype=np.int32)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._hit_counts = np.zeros(capacity, dtype=np.int64)
+        self._questions = [None] * capacity
+        self._answers = [None] * capacity
+        self._namespace_ids = {}
+        self._next_namespace = 0
+        self._kb_version = None
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _namespace_id(self, provider, kb_version):
+        key = (provider, kb_version)
+        if key not in self._namespace_ids:
+            self._namespace_ids[key] = self._next_namespace
+            self._next_namespace += 1
+        return self._namespace_ids[key]
+
+    def _set_version(self, kb_version):
+        """Ao trocar a versão da base, libera os slots e namespaces das versões anteriores."""
+        if kb_version == self._kb_version:
+            return
+        self._kb_version = kb_version
+        for key, namespace in list(self._namespace_ids.items()):
+            if key[1] != kb_version:
+                self._namespaces[self._namespaces == namespace] = -1
+                del self._namespace_ids[key]
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def lookup(self, embedding, provider, kb_version):
+        """Retorna a resposta da pergunta mais parecida acima do limiar, ou None."""
+        if self.capacity <= 0:
+            return None
+        query = self._normalize(embedding)
+        with self._lock:
+            namespace = self._namespace_ids.get((provider, kb_version))
+            if self._matrix is None or namespace is None:
+                self.misses += 1
+                return None
+            scores = self._matrix @ query
+            scores[self._namespaces != namespace] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self._hit_counts[best] += 1
+            self.hits += 1
+            return self._answers[best]
+
+    def store(self, embedding, question, answer, provider, kb_version):
+        """Insere uma resposta, ocupando um slot livre ou o menos usado recentemente."""
+        if self.capacity <= 0:
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._set_version(kb_version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            free = np.flatnonzero(self._namespaces < 0)
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+            self._clock += 1
+            self._matrix[slot] = vector
+            self._namespaces[slot] = self._namespace_id(provider, kb_version)
+            self._last_used[slot] = self._clock
+            self._hit_counts[slot] = 0
+            self._questions[slot] = question
+            self._answers[slot] = answer
+
+    def clear(self):
+        """Remove todas as respostas armazenadas."""
+        with self._lock:
+            self._namespaces[:] = -1
+            self._last_used[:] = 0
+            self._hit_counts[:] = 0
+            self._questions = [None] * self.capacity
+            self._answers = [None] * self.capacity
+            self._namespace_ids.clear()
+            self._kb_version = None
+
+    def stats(self):
+        """Contadores do cache e as perguntas mais reaproveitadas."""
+        with self._lock:
+            used = np.flatnonzero(self._namespaces >= 0)
+            top = used[np.argsort(-self._hit_counts[used], kind='stable')][:10]
+            return {
+                'size': int(used.size),
+                'capacity': self.capacity,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'top_questions': [
+                    {'question': self._questions[i], 'hits': int(self._hit_counts[i])} for i in top
+                ],
+            }
+
+
+ANSWER_CACHE = SemanticAnswerCache()
+
+
+def is_cacheable_answer(answer):
+    """Mensagens de erro/indisponibilidade do provedor não devem ser reaproveitadas."""
+    return bool(answer) and not answer.lstrip().startswith(('⚠️', '❌'))
+
+
+def get_cached_answer(provider, question):
+    """
+    Consulta o cache antes de chamar o LLM, no namespace do provedor preferido.
+
+    Returns:
+        tuple: (resposta ou None, embedding da pergunta, versão da base de conhecimento)
+    """
+    embedding = embed_query_cached(question)
+    kb_version = get_collection_version()
+    return ANSWER_CACHE.lookup(embedding, provider, kb_version), embedding, kb_version
+
+
+def cache_answer(provider, question, answer, embedding, kb_version):
+    """
+    Armazena a resposta gerada para reaproveitamento em perguntas quase idênticas, no namespace
+    do provedor que de fato respondeu (o roteador pode ter trocado o preferido).
+    """
+    if is_cacheable_answer(answer):
+        ANSWER_CACHE.store(embedding, question, answer, provider, kb_version)
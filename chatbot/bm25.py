@@ -0,0 +1,144 @@
+# Índice invertido BM25 para busca lexical (siglas, leis, números de decretos)
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from chatbot.textmatch import fold_text
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# Mantém números com pontuação interna ("12.527") como um único termo; a barra separa
+# número e ano ("12.527/2011" -> "12.527", "2011")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.-][a-z0-9]+)*")
+# Muda quando a tokenização muda: índices gravados com outra versão são reconstruídos
+TOKENIZER_VERSION = 2
+
+STOPWORDS = {
+    "a", "o", "e", "as", "os", "de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas",
+    "um", "uma", "uns", "umas", "para", "por", "com", "sem", "que", "se", "ao", "aos", "ou",
+    "como", "mais", "sobre", "qual", "quais", "sao", "ser", "este", "esta", "isso", "pelo",
+    "pela", "pelos", "pelas", "entre", "ja", "nao", "sim", "ha", "tem", "ter", "foi",
+}
+
+
+def tokenize(text):
+    """
+    Quebra o texto em termos para o BM25. Números com pontuação geram também
+    a forma sem pontuação, para que "Lei nº 12.527/2011", "Lei 12.527" e "lei 12527"
+    se encontrem.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(fold_text(text)):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        tokens.append(token)
+        compact = re.sub(r"[.-]", "", token)
+        if compact != token and compact.isdigit():
+            tokens.append(compact)
+    return tokens
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 persistido em JSON ao lado da coleção do Chroma.
+
+    Args:
+        ids (list): IDs dos chunks, na mesma ordem de doc_lengths
+        postings (dict): termo -> (índices dos documentos, frequências do termo)
+        doc_lengths (list): número de termos de cada chunk
+        version (str): versão da coleção a partir da qual o índice foi construído
+    """
+
+    def __init__(self, ids, postings, doc_lengths, version=None):
+        self.ids = list(ids)
+        self.postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(freqs, dtype=np.float32))
+            for term, (docs, freqs) in postings.items()
+        }
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.version = version
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, ids, texts, version=None):
+        """Constrói o índice a partir dos textos dos chunks."""
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                postings[term][0].append(position)
+                postings[term][1].append(freq)
+        return cls(ids, postings, doc_lengths, version=version)
+
+    def search(self, query, k=10):
+        """Retorna até k pares (id, score) ordenados por relevância BM25."""
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        n_docs = len(self.ids)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, freqs = self.postings[term]
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / max(self.avg_length, 1e-9))
+            scores[docs] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in candidates]
+
+    def save(self, path):
+        """Grava o índice de forma atômica (arquivo temporário + rename)."""
+        data = {
+            "version": self.version,
+            "tokenizer": TOKENIZER_VERSION,
+            "ids": self.ids,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {
+                term: [docs.tolist(), freqs.astype(int).tolist()]
+                for term, (docs, freqs) in sorted(self.postings.items())
+            },
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Carrega o índice gravado; None se foi gerado com outra tokenização (deve ser reconstruído)."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("tokenizer") != TOKENIZER_VERSION:
+            return None
+        return cls(data["ids"], data["postings"], data["doc_lengths"], version=data.get("version"))
+
+
+def bm25_index_path(persist_directory, collection_name):
+    """Caminho do índice BM25 de uma coleção, dentro do diretório do Chroma."""
+    return os.path.join(persist_directory, f"bm25_{collection_name}.json")
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Combina listas ranqueadas de IDs pela fusão de ranks recíprocos (RRF).
+
+    Returns:
+        list: IDs ordenados pelo score fundido (empates mantêm a ordem de chegada)
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
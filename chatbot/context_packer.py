@@ -0,0 +1,130 @@
+# Montagem do prompt por orçamento de tokens (substitui o corte por número de caracteres)
+import os
+import threading
+
+from django.conf import settings
+
+LLM_TOKENIZER = getattr(settings, 'LLM_TOKENIZER', 'unsloth/Llama-3.3-70B-Instruct')
+# tokenizer.json local, baixado na implantação (python manage.py download_tokenizer);
+# nada é baixado durante as requisições nem na ingestão
+LLM_TOKENIZER_PATH = str(getattr(settings, 'LLM_TOKENIZER_PATH', os.path.join('tokenizers', 'tokenizer.json')))
+# Folga no orçamento para modelos com outro tokenizador: o roteador pode enviar o mesmo
+# prompt ao endpoint do Databricks, que usa outro modelo
+LLM_TOKENIZER_MARGIN = getattr(settings, 'LLM_TOKENIZER_MARGIN', 0.1)
+# Orçamento do prompt inteiro (template + histórico + contexto + pergunta)
+LLM_PROMPT_TOKEN_BUDGET = getattr(settings, 'LLM_PROMPT_TOKEN_BUDGET', 24000)
+# Parte do orçamento reservada ao histórico da conversa
+LLM_HISTORY_TOKEN_BUDGET = getattr(settings, 'LLM_HISTORY_TOKEN_BUDGET', 2000)
+
+HISTORY_HEADER = "HISTÓRICO DA CONVERSA:\n"
+CHUNK_SEPARATOR = "\n\n"
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+_tokenizer_failed = False
+
+
+def get_tokenizer():
+    """
+    Tokenizador do modelo de destino, lido de LLM_TOKENIZER_PATH uma vez por processo
+    (os workers o carregam na inicialização, em core/asgi.py).
+    Retorna None se não puder ser carregado; nesse caso a contagem é estimada pelos caracteres.
+    """
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is None and not _tokenizer_failed:
+        with _tokenizer_lock:
+            if _tokenizer is None and not _tokenizer_failed:
+                try:
+                    from tokenizers import Tokenizer
+                    _tokenizer = Tokenizer.from_file(LLM_TOKENIZER_PATH)
+                except Exception as e:
+                    _tokenizer_failed = True
+                    print(f"⚠️ Tokenizador indisponível em {LLM_TOKENIZER_PATH} "
+                          f"(python manage.py download_tokenizer), usando estimativa: {e}")
+    return _tokenizer
+
+
+def count_tokens_batch(texts):
+    """Conta os tokens de vários textos de uma vez."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # Estimativa conservadora para português (~3 caracteres por token)
+        return [len(text) // 3 + 1 for text in texts]
+    return [len(encoding.ids) for encoding in tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+
+
+def count_tokens(text):
+    return count_tokens_batch([text])[0]
+
+
+def _truncate_to_tokens(text, max_tokens):
+    """Corta um texto no limite de tokens (usado só quando nem um trecho inteiro cabe)."""
+    tokenizer = get_tokenizer()
+    if max_tokens <= 0:
+        return ""
+    if tokenizer is None:
+        return text[:max_tokens * 3]
+    encoding = tokenizer.encode(text, add_special_tokens=False)
+    if len(encoding.ids) <= max_tokens:
+        return text
+    return text[:encoding.offsets[max_tokens - 1][1]]
+
+
+def pack_prompt(template, question, chunks, history_turns=None,
+                budget=None, history_budget=LLM_HISTORY_TOKEN_BUDGET):
+    """
+    Preenche o template com o máximo de trechos inteiros que cabem no orçamento de tokens,
+    descontada a folga LLM_TOKENIZER_MARGIN.
+
+    Args:
+        template (str): Template com os campos {context} e {question}
+        question (str): Pergunta do usuário
+        chunks (list): Trechos de contexto já ordenados do mais para o menos relevante
+        history_turns (list): Turnos do histórico, do mais antigo para o mais recente
+        budget (int): Limite de tokens do prompt completo (padrão: LLM_PROMPT_TOKEN_BUDGET)
+        history_budget (int): Limite de tokens do histórico (dentro de budget)
+
+    Returns:
+        tuple: (prompt montado, número de tokens do prompt)
+    """
+    budget = LLM_PROMPT_TOKEN_BUDGET if budget is None else budget
+    chunks = [chunk for chunk in chunks if chunk and chunk.strip()]
+    history_turns = [turn for turn in (history_turns or []) if turn and turn.strip()]
+    counts = count_tokens_batch(
+        [template.format(context="", question=question), HISTORY_HEADER, CHUNK_SEPARATOR]
+        + history_turns + chunks
+    )
+    base_tokens, header_tokens, separator_tokens = counts[:3]
+    history_counts = counts[3:3 + len(history_turns)]
+    chunk_counts = counts[3 + len(history_turns):]
+
+    # Histórico: turnos mais recentes primeiro, sempre inteiros
+    history = []
+    used = header_tokens
+    for turn, tokens in zip(reversed(history_turns), reversed(history_counts)):
+        if used + tokens + 1 > history_budget:
+            break
+        history.insert(0, turn)
+        used += tokens + 1
+    history_tokens = used if history else 0
+
+    # Contexto: trechos inteiros, em ordem de relevância, até esgotar o orçamento
+    remaining = int(budget * (1 - LLM_TOKENIZER_MARGIN)) - base_tokens - history_tokens
+    selected = []
+    for chunk, tokens in zip(chunks, chunk_counts):
+        cost = tokens + (separator_tokens if selected else 0)
+        if cost > remaining:
+            continue
+        selected.append(chunk)
+        remaining -= cost
+    if not selected and chunks:
+        # Nenhum trecho cabe inteiro: usa o mais relevante cortado no limite
+        selected = [_truncate_to_tokens(chunks[0], remaining)]
+    if len(selected) < len(chunks):
+        print(f"✂️ Contexto: {len(selected)}/{len(chunks)} trechos dentro do orçamento de {budget} tokens")
+
+    prompt = template.format(context=CHUNK_SEPARATOR.join(selected), question=question)
+    if history:
+        history_text = "\n".join(history)
+        prompt = f"{HISTORY_HEADER}{history_text}\n\n{prompt}"
+    return prompt, count_tokens(prompt)
@@ -0,0 +1,99 @@
+# Eliminação de chunks quase duplicados (MinHash + LSH) entre a divisão e o cálculo de embeddings
+import os
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from chatbot.textmatch import fold_text
+
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "true").lower() == "true"
+# Similaridade de Jaccard estimada a partir da qual um chunk é considerado repetido
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+NUM_PERM = 128
+# 16 faixas de 8 linhas: pares com Jaccard acima de ~0,7 quase sempre viram candidatos
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 31) - 1
+# Semente fixa: as mesmas entradas produzem sempre as mesmas assinaturas
+_rng = np.random.RandomState(20250101)
+_PERM_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text):
+    """Hashes dos n-gramas de palavras do texto normalizado (sem acentos, minúsculas)."""
+    words = _WORD_PATTERN.findall(fold_text(text))
+    if len(words) <= SHINGLE_SIZE:
+        grams = {" ".join(words)}
+    else:
+        grams = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) & _PRIME for gram in grams), dtype=np.uint64)
+
+
+def minhash(text):
+    """Assinatura MinHash (NUM_PERM valores) do texto."""
+    values = shingles(text)
+    return ((np.outer(values, _PERM_A) + _PERM_B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Índice LSH das assinaturas dos chunks mantidos. Um chunk novo cujo Jaccard estimado com
+    algum chunk já mantido atinge o limiar é considerado duplicado desse chunk (o canônico).
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.signatures = {}
+        self.buckets = defaultdict(list)
+        self.checked = 0
+        self.removed = 0
+
+    @staticmethod
+    def _bands(signature):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+
+    def add(self, chunk_id, signature):
+        self.signatures[chunk_id] = signature
+        for key in self._bands(signature):
+            self.buckets[key].append(chunk_id)
+
+    def add_texts(self, ids, texts):
+        for chunk_id, text in zip(ids, texts):
+            self.add(chunk_id, minhash(text))
+
+    def find(self, signature):
+        """Chunk mantido mais parecido com a assinatura, se atingir o limiar."""
+        candidates = set()
+        for key in self._bands(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for candidate in sorted(candidates):
+            score = float(np.mean(self.signatures[candidate] == signature))
+            if score >= best_score and (best is None or score > best_score):
+                best, best_score = candidate, score
+        return best
+
+    def check(self, chunk_id, text):
+        """
+        Registra o chunk como mantido ou o identifica como duplicado.
+
+        Returns:
+            str: ID do chunk canônico do qual este é duplicado, ou None se foi mantido
+        """
+        self.checked += 1
+        signature = minhash(text)
+        canonical = self.find(signature)
+        if canonical is None:
+            self.add(chunk_id, signature)
+        else:
+            self.removed += 1
+        return canonical
@@ -0,0 +1,261 @@
+# Cache persistente de embeddings da ingestão, endereçado por conteúdo (modelo + hash do texto do chunk)
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.getenv("CHROMA_PERSIST_DIR", "chroma_db"), "embedding_cache"),
+)
+# Limite de tamanho por modelo; ao ultrapassar, ficam as entradas usadas mais recentemente
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+KEY_BYTES = 20
+STAMP_DTYPE = np.uint32
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings já calculados por um modelo, gravados em disco:
+
+    - keys.bin: SHA-1 do texto de cada linha (20 bytes por linha)
+    - vectors.f16: matriz float16 (mapeada em memória na leitura), uma linha por texto
+    - stamps.u32: último uso de cada linha (para a poda por tamanho)
+
+    Linhas novas só são acrescentadas ao final (vetores antes das chaves), então uma
+    interrupção no meio de uma gravação não corrompe as linhas anteriores.
+    """
+
+    def __init__(self, model_name, directory=EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.path = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._vectors = None
+        self._stamps = np.zeros(0, dtype=STAMP_DTYPE)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        except (OSError, ValueError, KeyError):
+            self.dim = None
+            return
+        with open(self._file("keys.bin"), "rb") as f:
+            keys = f.read()
+        row_bytes = self.dim * 2
+        vector_rows = os.path.getsize(self._file("vectors.f16")) // row_bytes
+        rows = min(len(keys) // KEY_BYTES, vector_rows)
+        self._rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+        self._vectors = (
+            np.memmap(self._file("vectors.f16"), dtype=np.float16, mode="r", shape=(rows, self.dim))
+            if rows else None
+        )
+        stamps = np.zeros(rows, dtype=STAMP_DTYPE)
+        if os.path.exists(self._file("stamps.u32")):
+            saved = np.fromfile(self._file("stamps.u32"), dtype=STAMP_DTYPE)[:rows]
+            stamps[:len(saved)] = saved
+        # Preserva os usos registrados em memória por este processo
+        used = min(len(self._stamps), rows)
+        stamps[:used] = np.maximum(stamps[:used], self._stamps[:used])
+        self._stamps = stamps
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def size_bytes(self):
+        return len(self._rows) * ((self.dim or 0) * 2 + KEY_BYTES + np.dtype(STAMP_DTYPE).itemsize)
+
+    def get_many(self, texts):
+        """Retorna, para cada texto, o vetor em cache (float32) ou None."""
+        keys = [text_key(text) for text in texts]
+        now = int(time.time())
+        results = []
+        with self._lock:
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.hits += 1
+                self._stamps[row] = now
+                results.append(np.asarray(self._vectors[row], dtype=np.float32))
+        return results
+
+    def put_many(self, texts, vectors):
+        """
+        Acrescenta vetores novos ao cache.
+
+        Returns:
+            list: os vetores como ficaram gravados (float16 convertido para float32), para que
+                  a ingestão produza o mesmo resultado com ou sem o cache
+        """
+        matrix = np.asarray(vectors, dtype=np.float32).astype(np.float16)
+        stored = [row.astype(np.float32) for row in matrix]
+        if not len(matrix):
+            return stored
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._file("lock"), "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                # Outro processo pode ter acrescentado linhas desde a leitura
+                self._load()
+                if self.dim is None:
+                    self.dim = matrix.shape[1]
+                    with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+                        json.dump({"model": self.model_name, "dim": self.dim}, f)
+                    for name in ("keys.bin", "vectors.f16"):
+                        open(self._file(name), "wb").close()
+                new_keys, new_rows = {}, []
+                for text, row in zip(texts, matrix):
+                    key = text_key(text)
+                    if key not in self._rows and key not in new_keys:
+                        new_keys[key] = len(new_rows)
+                        new_rows.append(row)
+                if new_keys:
+                    first_row = len(self._rows)
+                    # Vetores antes das chaves: uma linha só passa a existir quando a chave é gravada
+                    with open(self._file("vectors.f16"), "r+b") as f:
+                        f.seek(first_row * self.dim * 2)
+                        f.write(np.asarray(new_rows, dtype=np.float16).tobytes())
+                    with open(self._file("keys.bin"), "r+b") as f:
+                        f.seek(first_row * KEY_BYTES)
+                        f.write(b"".join(new_keys))
+                    self._load()
+                    self._stamps[first_row:] = int(time.time())
+                    self._write_stamps()
+        return stored
+
+    def _write_stamps(self):
+        tmp_path = f"{self._file('stamps.u32')}.tmp"
+        self._stamps.tofile(tmp_path)
+        os.replace(tmp_path, self._file("stamps.u32"))
+
+    def flush(self):
+        """Grava as datas de último uso (atualizadas pelos acertos)."""
+        with self._lock:
+            if self.dim is not None:
+                self._write_stamps()
+
+    def prune(self, max_bytes=None, dry_run=False):
+        """
+        Mantém apenas as entradas usadas mais recentemente que cabem em max_bytes.
+
+        Returns:
+            int: número de entradas removidas (ou que seriam removidas, em dry_run)
+        """
+        max_bytes = EMBEDDING_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        if self.dim is None:
+            return 0
+        row_bytes = self.dim * 2 + KEY_BYTES + np.dtype(STAMP_DTYPE).itemsize
+        keep_count = int(max_bytes // row_bytes)
+        removed = max(len(self._rows) - keep_count, 0)
+        if not removed or dry_run:
+            return removed
+        with self._lock:
+            with open(self._file("lock"), "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                self._load()
+                keys = sorted(self._rows, key=self._rows.get)
+                # int64 antes de negar: em uint32 a negação dá a volta e um stamp 0 viraria o mais recente
+                keep = np.sort(np.argsort(-self._stamps.astype(np.int64), kind="stable")[:keep_count])
+                removed = len(keys) - len(keep)
+                vectors = np.asarray(self._vectors[keep]) if len(keep) else np.zeros((0, self.dim), np.float16)
+                stamps = self._stamps[keep]
+                self._vectors = None
+                self._stamps = np.zeros(0, dtype=STAMP_DTYPE)
+                for name, payload in (
+                    ("vectors.f16", vectors.astype(np.float16).tobytes()),
+                    ("keys.bin", b"".join(keys[i] for i in keep)),
+                    ("stamps.u32", stamps.tobytes()),
+                ):
+                    with open(f"{self._file(name)}.tmp", "wb") as f:
+                        f.write(payload)
+                    os.replace(f"{self._file(name)}.tmp", self._file(name))
+                self._load()
+        return removed
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "entries": len(self._rows),
+            "size_mb": round(self.size_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CachedEmbeddings:
+    """
+    Envolve um modelo de embeddings (embed_documents/embed_query) consultando o
+    EmbeddingCache antes de calcular. Só os textos ausentes vão para o modelo.
+    """
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            stored = self.cache.put_many([texts[i] for i in missing], computed)
+            for i, vector in zip(missing, stored):
+                vectors[i] = vector
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def close(self):
+        """Grava as datas de uso, aplica o limite de tamanho e informa o aproveitamento."""
+        self.cache.flush()
+        removed = self.cache.prune()
+        stats = self.cache.stats()
+        total = stats["hits"] + stats["misses"]
+        if total:
+            print(f"🗃️ Cache de embeddings: {stats['hits']}/{total} reaproveitados "
+                  f"({stats['entries']:,} entradas, {stats['size_mb']} MB)")
+        if removed:
+            print(f"🧹 Cache de embeddings: {removed:,} entradas antigas removidas")
+
+
+def with_embedding_cache(embeddings, model_name, directory=EMBEDDING_CACHE_DIR):
+    """Aplica o cache persistente ao modelo de embeddings, se EMBEDDING_CACHE estiver ativo."""
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, EmbeddingCache(model_name, directory=directory))
+
+
+def close_embedding_cache(embeddings):
+    """Finaliza o cache aplicado por with_embedding_cache (nada a fazer se ele estiver desativado)."""
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.close()
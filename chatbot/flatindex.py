@@ -0,0 +1,183 @@
+# Índice vetorial plano em NumPy (alternativa ao Chroma para bases pequenas)
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+FLAT_INDEX_DTYPES = ("int8", "float16", "float32")
+# Tipo das matrizes exportadas (ingestão e exportação sob demanda pelos workers)
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "int8")
+# Linhas processadas por bloco na busca: limita a cópia temporária em float32
+SEARCH_BLOCK_ROWS = 8192
+
+
+def flat_index_path(persist_directory, collection_name):
+    """Prefixo dos arquivos do índice plano de uma coleção, dentro do diretório do Chroma."""
+    return os.path.join(persist_directory, f"flat_{collection_name}")
+
+
+def flat_index_files(path):
+    """Todos os arquivos do índice plano com este prefixo (todas as versões das matrizes)."""
+    pattern = glob.escape(path)
+    return sorted(set(glob.glob(f"{pattern}.npy") + glob.glob(f"{pattern}.*.npy") + glob.glob(f"{pattern}.json")))
+
+
+def _matrix_files(path, sidecar):
+    """Arquivos de vetores e escalas referenciados pelo JSON (formato sem versão: nomes fixos)."""
+    directory = os.path.dirname(path)
+    if "vectors" not in sidecar:
+        return f"{path}.npy", f"{path}.scales.npy"
+    return os.path.join(directory, sidecar["vectors"]), os.path.join(directory, sidecar["scales"])
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class FlatIndex:
+    """
+    Matriz de embeddings normalizados, quantizada (int8 com escala por linha, ou float16)
+    e mapeada em memória, mais um arquivo JSON com IDs, textos e metadados.
+
+    A busca é exata (produto matriz-vetor + argpartition). Expõe o mesmo subconjunto da
+    API de coleção do Chroma usado pelo pipeline RAG: query(), get(), count() e metadata.
+    """
+
+    def __init__(self, vectors, scales, ids, documents, metadatas, metadata=None):
+        self._vectors = vectors
+        self._scales = scales
+        self._ids = list(ids)
+        self._documents = list(documents)
+        self._metadatas = list(metadatas)
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self.metadata = metadata or {}
+
+    @staticmethod
+    def export(collection, path, dtype="int8"):
+        """
+        Exporta uma coleção do Chroma para os arquivos do índice plano.
+        Cada arquivo é gravado em um temporário e movido no final; o JSON por último.
+        As linhas seguem a ordem dos IDs, então o mesmo conteúdo gera os mesmos arquivos
+        (e a mesma versão).
+        """
+        if dtype not in FLAT_INDEX_DTYPES:
+            raise ValueError(f"dtype inválido para o índice plano: {dtype}")
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        order = sorted(range(len(data["ids"])), key=lambda i: data["ids"][i])
+        data = {key: [data[key][i] for i in order] for key in ("ids", "embeddings", "documents", "metadatas")}
+        matrix = _normalize_rows(np.asarray(data["embeddings"], dtype=np.float32).reshape(len(data["ids"]), -1))
+        if dtype == "int8":
+            scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+            vectors = np.round(matrix / scales[:, None]).astype(np.int8)
+        else:
+            scales = np.ones(len(matrix), dtype=np.float32)
+            vectors = matrix.astype(dtype)
+
+        vectors = np.ascontiguousarray(vectors)
+        scales = np.ascontiguousarray(scales, dtype=np.float32)
+        # As matrizes são gravadas com o nome da versão; o JSON, gravado por último, aponta para
+        # elas. Quem carrega o índice lê o JSON e abre exatamente o conjunto que ele indica.
+        digest = hashlib.sha1(vectors.tobytes())
+        digest.update(scales.tobytes())
+        version = digest.hexdigest()[:12]
+        basename = os.path.basename(path)
+        sidecar = {
+            "metadata": dict(sorted((collection.metadata or {}).items())),
+            "dtype": dtype,
+            "version": version,
+            "vectors": f"{basename}.{version}.npy",
+            "scales": f"{basename}.{version}.scales.npy",
+            "ids": data["ids"],
+            "documents": data["documents"],
+            "metadatas": data["metadatas"],
+        }
+        previous = FlatIndex._read_sidecar(path)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for filename, array in zip(_matrix_files(path, sidecar), (vectors, scales)):
+            with open(f"{filename}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{filename}.tmp", filename)
+        with open(f"{path}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, ensure_ascii=False, sort_keys=True)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+        # Mantém também a versão anterior: um worker pode ter lido o JSON antigo e ainda não
+        # ter aberto as matrizes
+        keep = set(_matrix_files(path, sidecar)) | {f"{path}.json"}
+        if previous is not None:
+            keep |= set(_matrix_files(path, previous))
+        for filename in flat_index_files(path):
+            if filename not in keep:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _read_sidecar(path):
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, path):
+        """Carrega o índice com a matriz mapeada em memória (páginas compartilhadas entre workers)."""
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        vectors_path, scales_path = _matrix_files(path, sidecar)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        scales = np.load(scales_path)
+        return cls(vectors, scales, sidecar["ids"], sidecar["documents"], sidecar["metadatas"],
+                   metadata=sidecar.get("metadata"))
+
+    @staticmethod
+    def exists(path):
+        sidecar = FlatIndex._read_sidecar(path)
+        return sidecar is not None and all(os.path.exists(filename) for filename in _matrix_files(path, sidecar))
+
+    def count(self):
+        return len(self._ids)
+
+    def _dequantize(self, rows):
+        return np.asarray(self._vectors[rows], dtype=np.float32) * self._scales[rows, None]
+
+    def _result(self, rows):
+        return {
+            "ids": [self._ids[i] for i in rows],
+            "documents": [self._documents[i] for i in rows],
+            "metadatas": [self._metadatas[i] for i in rows],
+            "embeddings": self._dequantize(np.asarray(rows, dtype=np.int64)),
+        }
+
+    def query(self, query_embeddings, n_results=10, include=None):
+        """Top-k por similaridade de cosseno, no formato de resposta do Chroma (uma lista por consulta)."""
+        response = {"ids": [], "documents": [], "metadatas": [], "embeddings": [], "distances": []}
+        for query in query_embeddings:
+            query = np.asarray(query, dtype=np.float32).ravel()
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            scores = np.empty(len(self._ids), dtype=np.float32)
+            for start in range(0, len(self._ids), SEARCH_BLOCK_ROWS):
+                block = slice(start, start + SEARCH_BLOCK_ROWS)
+                scores[block] = (np.asarray(self._vectors[block], dtype=np.float32) @ query) * self._scales[block]
+            k = min(n_results, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if 0 < k < len(scores) else np.arange(k)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            result = self._result(top)
+            for key in ("ids", "documents", "metadatas", "embeddings"):
+                response[key].append(result[key])
+            response["distances"].append((1.0 - scores[top]).tolist())
+        return response
+
+    def get(self, ids=None, include=None):
+        """Busca por ID em O(1) por item (todos os itens se ids for None)."""
+        if ids is None:
+            rows = list(range(len(self._ids)))
+        else:
+            rows = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+        return self._result(rows)
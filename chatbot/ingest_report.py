@@ -0,0 +1,205 @@
+# Perfil de execução da ingestão: tempo de parede/CPU por etapa, vazão, memória e arquivos mais lentos
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: sem pico de memória no relatório
+    resource = None
+
+REPORT_PREFIX = "ingest_report_"
+SLOWEST_FILES = 10
+# Queda de vazão (em relação à execução anterior) destacada como possível regressão
+REGRESSION_THRESHOLD = 0.2
+
+
+def peak_rss_mb():
+    """
+    Pico de memória residente deste processo e dos processos filhos já encerrados
+    (pool de extração), em MB.
+    """
+    if resource is None:
+        return {"self": None, "children": None}
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+class IngestionStats:
+    """
+    Tempo e volume de cada etapa da ingestão (extração, divisão, deduplicação, embeddings,
+    gravação, índices auxiliares) e tempo de cada arquivo. Pode ser atualizado por várias threads.
+
+    O tempo de CPU da extração é o do processo filho que tratou cada arquivo; o das demais
+    etapas é medido no próprio processo.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.cpu_started = time.process_time()
+        self.stages = {}
+        self.files = []
+        self.totals = {"documents": 0, "chunks": 0, "characters": 0, "tokens": 0}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, items=0, unit="itens", cpu_seconds=0.0):
+        with self._lock:
+            entry = self.stages.setdefault(
+                stage, {"seconds": 0.0, "cpu_seconds": 0.0, "items": 0, "unit": unit}
+            )
+            entry["seconds"] += seconds
+            entry["cpu_seconds"] += cpu_seconds
+            entry["items"] += items
+
+    @contextmanager
+    def stage(self, stage, items=0, unit="itens", cpu_clock=time.process_time):
+        started, cpu_started = time.perf_counter(), cpu_clock()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started, items, unit, cpu_clock() - cpu_started)
+
+    def count(self, **totals):
+        with self._lock:
+            for name, value in totals.items():
+                self.totals[name] = self.totals.get(name, 0) + value
+
+    def add_file(self, filename, seconds, characters, chunks=0, cpu_seconds=0.0):
+        with self._lock:
+            self.files.append({
+                "file": filename,
+                "seconds": round(seconds, 4),
+                "cpu_seconds": round(cpu_seconds, 4),
+                "characters": characters,
+                "chunks": chunks,
+            })
+
+    def as_dict(self):
+        wall = time.perf_counter() - self.started
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = {
+                "seconds": round(entry["seconds"], 4),
+                "cpu_seconds": round(entry["cpu_seconds"], 4),
+                "items": entry["items"],
+                "unit": entry["unit"],
+                "per_second": round(entry["items"] / entry["seconds"], 2) if entry["seconds"] > 0 else None,
+            }
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(time.process_time() - self.cpu_started, 4),
+            "totals": dict(self.totals),
+            "throughput": {
+                f"{name}_per_second": round(value / wall, 2) if wall > 0 else None
+                for name, value in self.totals.items()
+            },
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+            "slowest_files": sorted(self.files, key=lambda f: -f["seconds"])[:SLOWEST_FILES],
+            "files": list(self.files),
+        }
+
+    def report(self):
+        """Imprime o tempo e a vazão de cada etapa."""
+        print(f"\n⏱️ Etapas da ingestão ({time.perf_counter() - self.started:.1f}s no total):")
+        for name, entry in self.stages.items():
+            rate = entry["items"] / entry["seconds"] if entry["seconds"] > 0 else 0.0
+            print(f"  {name:<10} {entry['seconds']:8.2f}s  (CPU {entry['cpu_seconds']:8.2f}s)  "
+                  f"{entry['items']:>9,} {entry['unit']:<8} {rate:10,.1f}/s")
+
+
+def report_path(persist_directory, collection_name):
+    return os.path.join(persist_directory, f"{REPORT_PREFIX}{collection_name}.json")
+
+
+def latest_report(persist_directory, mode):
+    """Relatório mais recente do mesmo modo (completo ou incremental) no diretório da base."""
+    if not os.path.isdir(persist_directory):
+        return None
+    latest = None
+    for filename in os.listdir(persist_directory):
+        if not (filename.startswith(REPORT_PREFIX) and filename.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(persist_directory, filename), "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if report.get("mode") == mode and (latest is None or report["finished_at"] > latest["finished_at"]):
+            latest = report
+    return latest
+
+
+def _change(current, previous):
+    if current is None or not previous:
+        return None
+    return round((current - previous) / previous, 4)
+
+
+def compare_reports(current, previous):
+    """
+    Variação relativa em relação à execução anterior: tempo de parede, memória, vazão geral
+    e tempo/vazão de cada etapa. Quedas de vazão acima de REGRESSION_THRESHOLD são listadas.
+    """
+    comparison = {
+        "previous_collection": previous.get("collection"),
+        "previous_finished_at": previous.get("finished_at"),
+        "wall_seconds": _change(current["wall_seconds"], previous.get("wall_seconds")),
+        "peak_rss_mb": _change(current["peak_rss_mb"]["self"], (previous.get("peak_rss_mb") or {}).get("self")),
+        "throughput": {
+            name: _change(value, previous.get("throughput", {}).get(name))
+            for name, value in current["throughput"].items()
+        },
+        "stages": {},
+        "regressions": [],
+    }
+    for name, stage in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if not before:
+            continue
+        rate_change = _change(stage["per_second"], before.get("per_second"))
+        comparison["stages"][name] = {
+            "seconds": _change(stage["seconds"], before.get("seconds")),
+            "per_second": rate_change,
+        }
+        if rate_change is not None and rate_change < -REGRESSION_THRESHOLD:
+            comparison["regressions"].append(name)
+    return comparison
+
+
+def save_report(stats, persist_directory, collection_name, mode, extra=None):
+    """
+    Grava o relatório JSON da execução ao lado da coleção, comparado com a execução
+    anterior do mesmo modo.
+
+    Returns:
+        dict: Relatório gravado
+    """
+    report = stats.as_dict()
+    report.update({"collection": collection_name, "mode": mode, **(extra or {})})
+    previous = latest_report(persist_directory, mode)
+    report["comparison"] = compare_reports(report, previous) if previous else None
+
+    path = report_path(persist_directory, collection_name)
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+    print(f"📈 Relatório de desempenho: {path}")
+    comparison = report["comparison"]
+    if comparison and comparison["wall_seconds"] is not None:
+        print(f"   Tempo total {comparison['wall_seconds']:+.0%} em relação à execução anterior")
+        for name in comparison["regressions"]:
+            print(f"   ⚠️ Vazão de '{name}' caiu {comparison['stages'][name]['per_second']:+.0%}")
+    return report
@@ -1,45 +1,940 @@
-# Ingestão de documentos para RAG
+# Motor único de ingestão de documentos para RAG
+# (comando "python manage.py ingest_knowledge_base", script atualizar_base_conhecimento.py e ingest_documents)
+import functools
+import hashlib
+import itertools
+import json
 import os
-from langchain_community.document_loaders import TextLoader, UnstructuredPDFLoader, UnstructuredWordDocumentLoader, CSVLoader
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain.schema import Document as LangchainDocument
+from langchain_community.document_loaders import CSVLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain_community.vectorstores import Chroma
 
-SUPPORTED_EXTENSIONS = ['.txt', '.pdf', '.docx', '.csv', '.md']
+from chatbot.bm25 import BM25Index, bm25_index_path
+from chatbot.dedup import DEDUP_THRESHOLD, INGEST_DEDUP, NearDuplicateIndex
+from chatbot.embedding_cache import close_embedding_cache, with_embedding_cache
+from chatbot.flatindex import FLAT_INDEX_DTYPE, FlatIndex, flat_index_path
+from chatbot.ingest_report import IngestionStats, report_path, save_report
+from chatbot.pdf_extract import extract_pdf, page_ranges
+from chatbot.textmatch import keyword_metadata
+
+# Parâmetros de chunking e embeddings. Ficam registrados no manifesto da coleção:
+# se mudarem, a próxima execução reconstrói a base inteira.
+CHUNK_SIZE = 800           # Tamanho otimizado para português
+CHUNK_OVERLAP = 200        # Overlap generoso para contexto
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", ", ", " "]
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "chroma_db")
+COLLECTION_PREFIX = "chatcotin_knowledge_"
+
+# Extração paralela: número de processos (padrão: todos os núcleos) e tempo máximo por arquivo
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+INGEST_FILE_TIMEOUT = float(os.getenv("INGEST_FILE_TIMEOUT", "300"))
+# Folga para o processo pai, caso o alarme do processo filho não consiga interromper o parser
+_TIMEOUT_GRACE = 30
+# Ingestão em fluxo: chunks por lote de embedding/gravação e lotes prontos aguardando gravação
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
 
 DOCS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Docs')
 if not os.path.exists(DOCS_PATH):
     os.makedirs(DOCS_PATH)
 
-def load_documents_from_folder(folder_path):
-    """Carrega todos os documentos suportados de uma pasta."""
+
+# ===== Carregadores =====
+
+# Extensão -> função que recebe o caminho do arquivo e retorna uma lista de documentos.
+# Novos formatos são adicionados com @register_loader(".ext"). Carregadores que aceitam
+# pages=(início, fim) podem ter o arquivo dividido em faixas extraídas em paralelo.
+LOADERS = {}
+
+
+def register_loader(*extensions):
+    """Registra um carregador para uma ou mais extensões (ex.: @register_loader('.pdf'))."""
+    def decorator(loader):
+        for extension in extensions:
+            LOADERS[extension.lower()] = loader
+        return loader
+    return decorator
+
+
+def supported_extensions():
+    return sorted(LOADERS)
+
+
+def _text_document(file_path, text, doc_type):
+    return LangchainDocument(
+        page_content=text,
+        metadata={
+            "source": file_path,
+            "filename": os.path.basename(file_path),
+            "type": doc_type,
+            "extension": os.path.splitext(file_path)[1].lower(),
+        }
+    )
+
+
+@register_loader('.docx')
+def load_docx(file_path):
+    """Microsoft Word: parágrafos seguidos das tabelas (células separadas por " | ")."""
+    from docx import Document
+
+    doc = Document(file_path)
+    text_content = [paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip()]
+    for table in doc.tables:
+        for row in table.rows:
+            row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if row_text:
+                text_content.append(" | ".join(row_text))
+    return [_text_document(file_path, "\n".join(text_content), "word_document")]
+
+
+@register_loader('.md')
+def load_markdown(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [_text_document(file_path, f.read(), "markdown")]
+
+
+@register_loader('.txt')
+def load_text(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [_text_document(file_path, f.read(), "plain_text")]
+
+
+@register_loader('.pdf')
+def load_pdf(file_path, pages=None):
+    """PDF: um documento por página, com o número da página nos metadados."""
+    docs = []
+    for page, text, total in extract_pdf(file_path, pages):
+        doc = _text_document(file_path, text, "pdf")
+        doc.metadata.update({"page": page, "total_pages": total})
+        docs.append(doc)
+    return docs
+
+
+@register_loader('.csv')
+def load_csv(file_path):
+    return CSVLoader(file_path).load()
+
+
+def load_file(file_path, root=None, pages=None):
+    """
+    Carrega um arquivo (ou só as páginas [início, fim) de pages) com o carregador da sua
+    extensão (executado nos processos do pool).
+    A fonte dos documentos fica relativa a root, para que os IDs não dependam da máquina.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    loader = LOADERS.get(ext)
+    if loader is None:
+        return []
+    source = os.path.relpath(file_path, root).replace(os.sep, "/") if root else file_path
+    docs = []
+    for doc in (loader(file_path) if pages is None else loader(file_path, pages=pages)):
+        if not doc.page_content.strip():
+            continue
+        doc.metadata["source"] = source
+        doc.metadata.setdefault("filename", os.path.basename(file_path))
+        doc.metadata.setdefault("extension", ext)
+        docs.append(doc)
+    return docs
+
+
+def extraction_tasks(file_path):
+    """
+    Unidades de extração de um arquivo: (caminho, None) para o arquivo inteiro ou, em PDFs
+    grandes, uma (caminho, faixa de páginas) por faixa.
+    """
+    if os.path.splitext(file_path)[1].lower() == ".pdf" and LOADERS.get(".pdf") is load_pdf:
+        return [(file_path, pages) for pages in page_ranges(file_path)]
+    return [(file_path, None)]
+
+
+def _load_task(task, root=None):
+    file_path, pages = task
+    return load_file(file_path, root=root, pages=pages)
+
+
+def is_supported_file(filename):
+    """Extensão com carregador registrado; ignora ocultos e arquivos de trava do Office (~$...)."""
+    filename = os.path.basename(filename)
+    if filename.startswith(('.', '~$')):
+        return False
+    return os.path.splitext(filename)[1].lower() in LOADERS
+
+
+def supported_files(folder_path):
+    """Nomes dos arquivos suportados da pasta, em ordem alfabética."""
+    if not os.path.isdir(folder_path):
+        return []
+    return [
+        filename for filename in sorted(os.listdir(folder_path))
+        if is_supported_file(filename) and os.path.isfile(os.path.join(folder_path, filename))
+    ]
+
+
+# ===== Extração paralela =====
+
+class ExtractionTimeout(BaseException):
+    # BaseException: não é engolida pelos "except Exception" dos carregadores
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+def _task_label(task):
+    """Nome do arquivo (e faixa de páginas) de uma unidade de extração, para as mensagens."""
+    if isinstance(task, tuple):
+        file_path, pages = task
+        return os.path.basename(file_path) + (f" (páginas {pages[0] + 1}-{pages[1]})" if pages else "")
+    return os.path.basename(task)
+
+
+def _run_with_timeout(extract, file_path, timeout):
+    """
+    Executa a extração dentro do processo filho, interrompida por SIGALRM ao estourar o tempo.
+    Assim o processo fica livre para o próximo arquivo em vez de travar o pool.
+
+    Returns:
+        tuple: (resultado, segundos gastos na extração, segundos de CPU do processo filho)
+    """
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        result = extract(file_path)
+        return result, time.perf_counter() - started, time.process_time() - cpu_started
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def iter_extract_files(file_paths, extract, max_workers=None, timeout=None):
+    """
+    Extrai vários arquivos em um pool de processos, entregando os resultados sob demanda.
+
+    Args:
+        file_paths (list): Arquivos a processar, ou tarefas (caminho, faixa de páginas)
+        extract (callable): Função de nível de módulo (serializável) que recebe o arquivo ou a tarefa
+        max_workers (int): Número de processos (padrão: INGEST_WORKERS)
+        timeout (float): Tempo máximo por arquivo em segundos (padrão: INGEST_FILE_TIMEOUT)
+
+    Yields:
+        tuple: (caminho, resultado, segundos, segundos de CPU) na mesma ordem de file_paths;
+               resultado None para arquivos que falharam ou estouraram o tempo
+    """
+    max_workers = max_workers or INGEST_WORKERS
+    timeout = INGEST_FILE_TIMEOUT if timeout is None else timeout
+    file_paths = list(file_paths)
+    if not file_paths:
+        return
+    executor = ProcessPoolExecutor(max_workers=min(max_workers, len(file_paths)))
+    remaining = iter(file_paths)
+    # No máximo 2 arquivos por processo em andamento: se o consumidor atrasar, a extração espera
+    pending = deque(
+        (path, executor.submit(_run_with_timeout, extract, path, timeout))
+        for path in itertools.islice(remaining, 2 * max_workers)
+    )
+    try:
+        # Coleta na ordem de envio: o resultado final não depende de qual processo termina antes
+        while pending:
+            path, future = pending.popleft()
+            result, seconds, cpu_seconds = None, 0.0, 0.0
+            try:
+                result, seconds, cpu_seconds = future.result(timeout=timeout + _TIMEOUT_GRACE if timeout else None)
+            except (ExtractionTimeout, FutureTimeoutError):
+                seconds = timeout
+                print(f"    ⏱️ Tempo esgotado ({timeout:.0f}s) ao processar {_task_label(path)}")
+            except Exception as e:
+                print(f"    ❌ Erro ao processar {_task_label(path)}: {e}")
+            for next_path in itertools.islice(remaining, 1):
+                pending.append((next_path, executor.submit(_run_with_timeout, extract, next_path, timeout)))
+            yield path, result, seconds, cpu_seconds
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_files_parallel(file_paths, extract, max_workers=None, timeout=None):
+    """
+    Extrai vários arquivos em um pool de processos (ver iter_extract_files).
+
+    Returns:
+        list: Resultados na mesma ordem de file_paths; None para arquivos que falharam
+              ou estouraram o tempo
+    """
+    return [result for _, result, _, _ in iter_extract_files(file_paths, extract, max_workers, timeout)]
+
+
+# ===== Manifesto e checkpoint =====
+
+def file_sha256(file_path):
+    """Hash do conteúdo de um arquivo (detecta alterações entre execuções)."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_documents_folder(docs_path):
+    """Hash de cada arquivo suportado da pasta."""
+    return {filename: file_sha256(os.path.join(docs_path, filename)) for filename in supported_files(docs_path)}
+
+
+def chunking_params(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, embedding_model=EMBEDDING_MODEL):
+    """Parâmetros que, se alterados, invalidam todos os chunks já gerados."""
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "separators": CHUNK_SEPARATORS,
+        "embedding_model": embedding_model,
+        "source": "relative",
+        "dedup_threshold": DEDUP_THRESHOLD if INGEST_DEDUP else None,
+    }
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def manifest_path(persist_directory, collection_name):
+    return os.path.join(persist_directory, f"manifest_{collection_name}.json")
+
+
+def load_manifest(persist_directory, collection_name):
+    """
+    Lê o manifesto da coleção: hash, parâmetros de chunking e IDs dos chunks de cada arquivo.
+
+    Returns:
+        dict: Manifesto ou None se não existir
+    """
+    try:
+        with open(manifest_path(persist_directory, collection_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(persist_directory, collection_name, params, files):
+    _write_json_atomic(manifest_path(persist_directory, collection_name), {
+        "collection": collection_name,
+        "chunking": params,
+        "files": files,
+    })
+
+
+def checkpoint_path(persist_directory, collection_name):
+    return os.path.join(persist_directory, f"checkpoint_{collection_name}.json")
+
+
+def save_checkpoint(persist_directory, collection_name, params, files):
+    """
+    Registra os arquivos já gravados por completo em uma criação de coleção em andamento.
+    Se o processo cair, a próxima execução retoma a mesma coleção a partir daqui.
+    """
+    _write_json_atomic(checkpoint_path(persist_directory, collection_name), {
+        "collection": collection_name,
+        "chunking": params,
+        "files": files,
+    })
+
+
+def find_checkpoint(persist_directory, params):
+    """
+    Procura uma criação de coleção interrompida e compatível com os parâmetros atuais.
+
+    Returns:
+        dict: Checkpoint mais recente ou None
+    """
+    if not os.path.isdir(persist_directory):
+        return None
+    checkpoints = []
+    for filename in os.listdir(persist_directory):
+        if not (filename.startswith("checkpoint_") and filename.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(persist_directory, filename), 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if checkpoint.get("chunking") == params:
+            checkpoints.append(checkpoint)
+    return max(checkpoints, key=lambda c: c["collection"], default=None)
+
+
+def content_version(params, files):
+    """
+    Versão da base derivada do conteúdo (parâmetros + IDs dos chunks): as mesmas entradas
+    geram sempre a mesma versão, e qualquer alteração gera outra.
+    """
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8'))
+    for filename in sorted(files):
+        digest.update(filename.encode('utf-8'))
+        for chunk_id in files[filename]["chunk_ids"]:
+            digest.update(chunk_id.encode('ascii'))
+    return digest.hexdigest()[:16]
+
+
+# ===== Pipeline: divisão, embeddings e gravação em lotes =====
+
+def make_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=CHUNK_SEPARATORS
+    )
+
+
+def split_documents(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    chunks = make_splitter(chunk_size, chunk_overlap).split_documents(documents)
+    # Flags de palavras-chave do domínio pré-calculadas para o filtro de relevância
+    for chunk in chunks:
+        chunk.metadata.update(keyword_metadata(chunk.page_content))
+    return chunks
+
+
+def make_chunk_ids(chunks):
+    """
+    Gera IDs estáveis para os chunks (fonte + posição no documento + conteúdo),
+    para que índices auxiliares (BM25, caches) possam referenciá-los.
+    """
+    ids = []
+    positions = {}
+    for chunk in chunks:
+        source = chunk.metadata.get('source', '')
+        position = positions.get(source, 0)
+        positions[source] = position + 1
+        digest = hashlib.sha1(f"{source}\x00{position}\x00{chunk.page_content}".encode('utf-8')).hexdigest()
+        ids.append(digest)
+    return ids
+
+
+def iter_file_documents(docs_path, filenames, stats=None, max_workers=None, timeout=None):
+    """
+    Extrai os arquivos em paralelo, entregando-os um a um e sempre na mesma ordem.
+    PDFs grandes são divididos em faixas de páginas extraídas em processos diferentes e
+    remontados na ordem original.
+
+    Yields:
+        tuple: (nome do arquivo, documentos); arquivos com alguma parte que falhou não são entregues
+    """
+    extract = functools.partial(_load_task, root=docs_path)
+    tasks = [task for filename in filenames for task in extraction_tasks(os.path.join(docs_path, filename))]
+    results = iter_extract_files(tasks, extract, max_workers, timeout)
+    # As partes de um arquivo chegam em sequência (mesma ordem de envio)
+    for path, parts in itertools.groupby(results, key=lambda result: result[0][0]):
+        parts = list(parts)
+        filename = os.path.basename(path)
+        seconds = sum(part[2] for part in parts)
+        cpu_seconds = sum(part[3] for part in parts)
+        if stats is not None:
+            stats.add("extract", seconds, 1, "arquivos", cpu_seconds)
+        if any(part[1] is None for part in parts):
+            continue
+        docs = [doc for part in parts for doc in part[1]]
+        characters = sum(len(doc.page_content) for doc in docs)
+        print(f"  📄 {filename}: {characters:,} caracteres ({seconds:.1f}s)")
+        if stats is not None:
+            stats.add_file(filename, seconds, characters, cpu_seconds=cpu_seconds)
+            stats.count(documents=len(docs), characters=characters)
+        yield filename, docs
+
+
+def iter_file_chunks(file_documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, stats=None,
+                     dedup=None, duplicates=None):
+    """
+    Divide um arquivo por vez em chunks com IDs estáveis e metadados de palavras-chave.
+    Com dedup, chunks quase iguais a um já mantido são descartados antes do embedding e
+    duplicates[nome do arquivo] recebe os IDs dos chunks canônicos correspondentes.
+
+    Yields:
+        tuple: (nome do arquivo, chunks, ids dos chunks)
+    """
+    from chatbot.context_packer import count_tokens_batch
+
+    for filename, docs in file_documents:
+        started, cpu_started = time.perf_counter(), time.process_time()
+        chunks = split_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunk_ids = make_chunk_ids(chunks)
+        if stats is not None:
+            stats.add("split", time.perf_counter() - started, len(chunks), "chunks",
+                      time.process_time() - cpu_started)
+            if stats.files and stats.files[-1]["file"] == filename:
+                stats.files[-1]["chunks"] = len(chunks)
+        if dedup is not None:
+            started, cpu_started = time.perf_counter(), time.process_time()
+            kept_chunks, kept_ids, canonical_ids = [], [], []
+            for chunk, chunk_id in zip(chunks, chunk_ids):
+                canonical = dedup.check(chunk_id, chunk.page_content)
+                if canonical is None:
+                    kept_chunks.append(chunk)
+                    kept_ids.append(chunk_id)
+                else:
+                    canonical_ids.append(canonical)
+            if canonical_ids:
+                duplicates[filename] = canonical_ids
+            if stats is not None:
+                stats.add("dedup", time.perf_counter() - started, len(chunks), "chunks",
+                          time.process_time() - cpu_started)
+            chunks, chunk_ids = kept_chunks, kept_ids
+        if stats is not None and chunks:
+            stats.count(chunks=len(chunks), tokens=sum(count_tokens_batch([c.page_content for c in chunks])))
+        yield filename, chunks, chunk_ids
+
+
+def batch_file_chunks(file_chunks, batch_size=None):
+    """
+    Agrupa os chunks de vários arquivos em lotes de tamanho fixo.
+
+    Args:
+        file_chunks: Iterável de (nome do arquivo, chunks, ids dos chunks)
+        batch_size (int): Chunks por lote (padrão: INGEST_BATCH_SIZE)
+
+    Yields:
+        tuple: (chunks, ids, arquivos concluídos). Um arquivo aparece como concluído no lote
+               que contém o seu último chunk (ou em um posterior), como (nome, ids dos chunks)
+    """
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    chunks, ids, completed = [], [], []
+    for filename, chunks_of_file, file_ids in file_chunks:
+        for chunk, chunk_id in zip(chunks_of_file, file_ids):
+            chunks.append(chunk)
+            ids.append(chunk_id)
+            if len(chunks) == batch_size:
+                yield chunks, ids, completed
+                chunks, ids, completed = [], [], []
+        completed.append((filename, list(file_ids)))
+    if chunks or completed:
+        yield chunks, ids, completed
+
+
+def write_batches(collection, embeddings, batches, queue_depth=None, on_written=None, stats=None):
+    """
+    Calcula os embeddings e grava os lotes na coleção. O embedding roda na thread atual e a
+    gravação em outra; a fila limitada segura o produtor quando a gravação atrasa, então a
+    memória fica limitada a alguns lotes independentemente do tamanho da base.
+
+    Args:
+        collection: Coleção do Chroma (upsert: regravar um lote após uma falha é seguro)
+        embeddings: Modelo de embeddings (embed_documents)
+        batches: Iterável de (chunks, ids, arquivos concluídos), ver batch_file_chunks
+        queue_depth (int): Lotes prontos aguardando gravação (padrão: INGEST_QUEUE_DEPTH)
+        on_written (callable): Chamada com os arquivos concluídos após cada lote gravado
+        stats (IngestionStats): Recebe o tempo das etapas de embedding e gravação
+
+    Returns:
+        int: Total de chunks gravados
+    """
+    pending = queue.Queue(maxsize=queue_depth or INGEST_QUEUE_DEPTH)
+    progress = {"chunks": 0, "error": None}
+    started = time.monotonic()
+
+    def writer():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if progress["error"] is not None:
+                continue
+            chunks, ids, vectors, completed = item
+            try:
+                write_started, cpu_started = time.perf_counter(), time.thread_time()
+                if ids:
+                    collection.upsert(
+                        ids=ids,
+                        embeddings=vectors,
+                        documents=[chunk.page_content for chunk in chunks],
+                        metadatas=[chunk.metadata for chunk in chunks],
+                    )
+                if stats is not None:
+                    stats.add("write", time.perf_counter() - write_started, len(ids), "chunks",
+                              time.thread_time() - cpu_started)
+                progress["chunks"] += len(ids)
+                if on_written is not None:
+                    on_written(completed)
+                rate = progress["chunks"] / max(time.monotonic() - started, 1e-9)
+                print(f"    📦 {progress['chunks']:,} chunks gravados ({rate:,.0f} chunks/s)")
+            except Exception as e:
+                progress["error"] = e
+
+    thread = threading.Thread(target=writer, name="ingest-writer", daemon=True)
+    thread.start()
+    try:
+        for chunks, ids, completed in batches:
+            if progress["error"] is not None:
+                break
+            embed_started, cpu_started = time.perf_counter(), time.process_time()
+            vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks]) if chunks else []
+            if stats is not None:
+                # Tempo de CPU do processo inteiro: inclui as threads de inferência do modelo
+                stats.add("embed", time.perf_counter() - embed_started, len(chunks), "chunks",
+                          time.process_time() - cpu_started)
+            pending.put((chunks, ids, vectors, completed))
+    finally:
+        pending.put(None)
+        thread.join()
+    if progress["error"] is not None:
+        raise progress["error"]
+    return progress["chunks"]
+
+
+def stream_into_collection(collection, embeddings, docs_path, filenames, files, file_hashes, params,
+                           on_files_done=None, stats=None, batch_size=None, dedup=None):
+    """
+    Extrai, divide, elimina quase duplicados, calcula embeddings e grava os arquivos em
+    lotes de tamanho fixo, sem manter a base inteira em memória.
+
+    Args:
+        files (dict): Entradas do manifesto; recebe os arquivos gravados por completo
+        file_hashes (dict): Hash de cada arquivo
+        params (dict): Parâmetros de chunking (chunking_params)
+        on_files_done (callable): Chamada com files após cada lote com arquivos concluídos
+        dedup (NearDuplicateIndex): Índice dos chunks já mantidos (None desativa a deduplicação)
+
+    Returns:
+        int: Total de chunks gravados
+    """
+    duplicates = {}
+
+    def completed(done):
+        for filename, chunk_ids in done:
+            files[filename] = {"sha256": file_hashes[filename], "chunk_ids": chunk_ids}
+            if filename in duplicates:
+                files[filename]["duplicates_of"] = duplicates.pop(filename)
+        if done and on_files_done is not None:
+            on_files_done(files)
+
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    print(f"\n💾 Gravando no ChromaDB em lotes de {batch_size} chunks...")
+    file_documents = iter_file_documents(docs_path, filenames, stats=stats)
+    file_chunks = iter_file_chunks(file_documents, params["chunk_size"], params["chunk_overlap"], stats=stats,
+                                   dedup=dedup, duplicates=duplicates)
+    batches = batch_file_chunks(file_chunks, batch_size)
+    written = write_batches(collection, embeddings, batches, on_written=completed, stats=stats)
+    if dedup is not None and dedup.checked:
+        print(f"🧬 {dedup.removed:,} de {dedup.checked:,} chunks quase duplicados descartados "
+              f"({100.0 * dedup.removed / dedup.checked:.1f}%)")
+    return written
+
+
+def make_dedup_index(collection, files):
+    """
+    Índice de deduplicação já contendo os chunks mantidos dos arquivos informados
+    (conteúdo lido da coleção), ou None se INGEST_DEDUP estiver desativado.
+    """
+    if not INGEST_DEDUP:
+        return None
+    dedup = NearDuplicateIndex()
+    ids = [chunk_id for entry in files.values() for chunk_id in entry["chunk_ids"]]
+    if ids:
+        data = collection.get(ids=ids, include=["documents"])
+        dedup.add_texts(data["ids"], data["documents"])
+    return dedup
+
+
+def apply_duplicate_sources(collection, files):
+    """
+    Registra nos metadados de cada chunk canônico os arquivos cujos trechos repetidos foram
+    descartados (duplicate_sources, duplicate_count) e limpa as marcações que deixaram de valer.
+    """
+    sources = {}
+    for filename, entry in files.items():
+        for canonical in entry.get("duplicates_of", ()):
+            sources.setdefault(canonical, set()).add(filename)
+    marked = collection.get(where={"duplicate_count": {"$gt": 0}}, include=[])["ids"]
+    ids = sorted(set(marked) | set(sources))
+    if not ids:
+        return
+    data = collection.get(ids=ids, include=["metadatas"])
+    metadatas = []
+    for chunk_id, metadata in zip(data["ids"], data["metadatas"]):
+        metadata = dict(metadata or {})
+        metadata["duplicate_sources"] = "; ".join(sorted(sources.get(chunk_id, ())))
+        metadata["duplicate_count"] = len(sources.get(chunk_id, ()))
+        metadatas.append(metadata)
+    collection.update(ids=data["ids"], metadatas=metadatas)
+
+
+def finalize_collection(collection, collection_name, persist_directory, files, kb_version, stats=None):
+    """
+    Registra a versão da coleção e as fontes dos duplicados descartados e regenera os índices
+    auxiliares (BM25 e índice plano) a partir do conteúdo atual da coleção, em ordem de ID
+    (arquivos reproduzíveis).
+    """
+    stats = stats or IngestionStats()
+    metadata = {k: v for k, v in (collection.metadata or {}).items() if not k.startswith("hnsw:")}
+    if metadata.get("kb_version") != kb_version:
+        metadata["kb_version"] = kb_version
+        collection.modify(metadata=metadata)
+    apply_duplicate_sources(collection, files)
+
+    # Índice lexical BM25 ao lado da coleção (busca híbrida)
+    print("🔤 Criando índice BM25...")
+    with stats.stage("bm25", collection.count(), "chunks"):
+        data = collection.get(include=["documents"])
+        order = sorted(range(len(data["ids"])), key=lambda i: data["ids"][i])
+        bm25_index = BM25Index.build([data["ids"][i] for i in order], [data["documents"][i] for i in order],
+                                     version=kb_version)
+        bm25_index.save(bm25_index_path(persist_directory, collection_name))
+    print(f"    ✅ Índice BM25 com {len(bm25_index.postings):,} termos")
+
+    # Exportação para o índice plano NumPy (VECTOR_INDEX_BACKEND=flat)
+    print(f"🧮 Exportando índice vetorial plano ({FLAT_INDEX_DTYPE})...")
+    with stats.stage("flat", collection.count(), "chunks"):
+        FlatIndex.export(collection, flat_index_path(persist_directory, collection_name), dtype=FLAT_INDEX_DTYPE)
+
+
+def make_embeddings(embedding_model=EMBEDDING_MODEL):
+    """Modelo de embeddings da ingestão, com o cache persistente de embeddings quando ativo."""
+    return with_embedding_cache(FastEmbedEmbeddings(model_name=embedding_model), embedding_model)
+
+
+def open_collection(collection_name, persist_directory, embeddings):
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        persist_directory=persist_directory
+    )
+
+
+# ===== Operações completas =====
+
+def build_collection(docs_path, persist_directory, collection_name, params, file_hashes, checkpoint=None, stats=None):
+    """
+    Cria uma coleção nova em fluxo: carrega, divide, calcula embeddings e grava em lotes,
+    registrando um checkpoint a cada lote (retomado se checkpoint for informado).
+
+    Returns:
+        Chroma: Coleção criada ou None se nenhum documento foi gravado
+    """
+    embeddings = make_embeddings(params["embedding_model"])
+    vectorstore = open_collection(collection_name, persist_directory, embeddings)
+    collection = vectorstore._collection
+
+    # Arquivos já gravados por completo antes da interrupção (e que não mudaram) são pulados
+    files = {}
+    if checkpoint:
+        for filename, entry in checkpoint["files"].items():
+            if file_hashes.get(filename) == entry["sha256"]:
+                files[filename] = entry
+        # Remove tudo o que não pertence a um arquivo concluído e inalterado: chunks de arquivos
+        # alterados desde a interrupção e os lotes já gravados do arquivo interrompido no meio
+        keep = {chunk_id for entry in files.values() for chunk_id in entry["chunk_ids"]}
+        orphan_ids = [chunk_id for chunk_id in collection.get(include=[])["ids"] if chunk_id not in keep]
+        for start in range(0, len(orphan_ids), INGEST_BATCH_SIZE):
+            collection.delete(ids=orphan_ids[start:start + INGEST_BATCH_SIZE])
+        if orphan_ids:
+            print(f"🧹 {len(orphan_ids)} chunk(s) sem arquivo concluído removido(s)")
+        print(f"♻️  Retomando {collection_name}: {len(files)} arquivo(s) já gravado(s)")
+    save_checkpoint(persist_directory, collection_name, params, files)
+
+    pending = [filename for filename in file_hashes if filename not in files]
+    stream_into_collection(
+        collection, embeddings, docs_path, pending, files, file_hashes, params,
+        on_files_done=lambda done: save_checkpoint(persist_directory, collection_name, params, done),
+        stats=stats, dedup=make_dedup_index(collection, files),
+    )
+    close_embedding_cache(embeddings)
+    if not files:
+        return None
+
+    finalize_collection(collection, collection_name, persist_directory, files,
+                        content_version(params, files), stats)
+    save_manifest(persist_directory, collection_name, params, files)
+    os.remove(checkpoint_path(persist_directory, collection_name))
+    return vectorstore
+
+
+def diff_manifest(previous, file_hashes):
+    """
+    Compara os arquivos do manifesto com os hashes atuais da pasta.
+
+    Returns:
+        tuple: (adicionados, alterados, removidos, IDs dos chunks que deixam de valer). Os alterados
+               incluem os arquivos cujos trechos repetidos apontam para chunks que vão sair
+    """
+    added = sorted(set(file_hashes) - set(previous))
+    removed = sorted(set(previous) - set(file_hashes))
+    changed = sorted(f for f in set(file_hashes) & set(previous) if file_hashes[f] != previous[f]["sha256"])
+    # Arquivos cujos trechos repetidos apontam para chunks que vão sair precisam ser reprocessados
+    stale = {chunk_id for f in removed + changed for chunk_id in previous[f]["chunk_ids"]}
+    dependents = True
+    while dependents:
+        dependents = sorted(
+            f for f, entry in previous.items()
+            if f in file_hashes and f not in changed and stale.intersection(entry.get("duplicates_of", ()))
+        )
+        changed = sorted(changed + dependents)
+        stale.update(chunk_id for f in dependents for chunk_id in previous[f]["chunk_ids"])
+    return added, changed, removed, stale
+
+
+def update_collection(docs_path, persist_directory, collection_name, manifest, file_hashes, params, stats=None):
+    """
+    Atualiza a coleção existente apenas com os arquivos adicionados, alterados ou removidos
+    desde a última execução, conforme o manifesto. Os chunks são gravados com upsert:
+    se o processo cair, basta executar de novo (o manifesto só é gravado no final).
+    A coleção é a que está em produção: os chunks novos são gravados antes de remover os
+    desatualizados, para que nenhum documento fique ausente durante a atualização.
+
+    Returns:
+        tuple: (Chroma ou None se nada mudou, resumo das alterações)
+    """
+    previous = manifest.get("files", {})
+    added, changed, removed, stale = diff_manifest(previous, file_hashes)
+    summary = {"added": added, "changed": changed, "removed": removed}
+
+    print("📋 Alterações desde a última execução:")
+    print(f"  ➕ {len(added)} novo(s)   ✏️  {len(changed)} alterado(s)   ➖ {len(removed)} removido(s)")
+    print(f"  ✔️  {len(file_hashes) - len(added) - len(changed)} sem alteração")
+    if not (added or changed or removed):
+        return None, summary
+
+    embeddings = make_embeddings(params["embedding_model"])
+    vectorstore = open_collection(collection_name, persist_directory, embeddings)
+    collection = vectorstore._collection
+    files = {f: entry for f, entry in previous.items() if f not in removed and f not in changed}
+
+    # Inserir chunks dos arquivos novos ou alterados
+    if added or changed:
+        stream_into_collection(collection, embeddings, docs_path, sorted(added + changed),
+                               files, file_hashes, params, stats=stats,
+                               dedup=make_dedup_index(collection, files))
+    close_embedding_cache(embeddings)
+
+    # Remover só os chunks que não foram regravados: os IDs derivam do conteúdo, então um
+    # trecho que não mudou mantém o ID e continua na coleção
+    current = {chunk_id for entry in files.values() for chunk_id in entry["chunk_ids"]}
+    stale_ids = sorted(stale - current)
+    if stale_ids:
+        print(f"\n🗑️  Removendo {len(stale_ids)} chunks desatualizados...")
+        for start in range(0, len(stale_ids), INGEST_BATCH_SIZE):
+            collection.delete(ids=stale_ids[start:start + INGEST_BATCH_SIZE])
+
+    finalize_collection(collection, collection_name, persist_directory, files,
+                        content_version(params, files), stats)
+    save_manifest(persist_directory, collection_name, params, files)
+    return vectorstore, summary
+
+
+def smoke_test(vectorstore):
+    """Confere se a coleção responde às consultas de aquecimento."""
+    from chatbot.knowledge_base import WARMUP_QUERIES
+
+    print("\n🔍 Testando base de conhecimento...")
+    for query in WARMUP_QUERIES:
+        try:
+            results = vectorstore.similarity_search(query, k=2)
+            if results:
+                filename = results[0].metadata.get('filename', 'fonte desconhecida')
+                print(f"  ✅ '{query}': {len(results)} resultado(s) — 📄 {filename}")
+            else:
+                print(f"  ❌ '{query}': Nenhum resultado")
+        except Exception as e:
+            print(f"  ⚠️  '{query}': Erro no teste - {e}")
+
+
+def run_ingestion(docs_path=DOCS_PATH, persist_directory=CHROMA_PERSIST_DIR, full=False, publish=True,
+                  chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, stats=None):
+    """
+    Atualiza a base de conhecimento: incremental sobre a coleção ativa quando o manifesto
+    é compatível; senão, cria uma coleção nova (retomando uma criação interrompida) ao lado
+    da atual. No final publica a coleção/versão no ponteiro lido pelos workers.
+
+    Returns:
+        dict: {"collection", "kb_version", "files", "changed", "report"} ou None em caso de falha.
+              "report" é o caminho do relatório de desempenho da execução
+    """
+    from chatbot.knowledge_base import publish_active_collection, read_active_collection
+
+    stats = stats or IngestionStats()
+    params = chunking_params(chunk_size, chunk_overlap)
+    with stats.stage("hash", len(supported_files(docs_path)), "arquivos"):
+        file_hashes = hash_documents_folder(docs_path)
+    if not file_hashes:
+        print(f"❌ Nenhum documento suportado em '{docs_path}/' ({', '.join(supported_extensions())})")
+        return None
+
+    active = (read_active_collection(persist_directory) or {}).get("collection") or os.getenv("CHROMA_COLLECTION")
+    manifest = load_manifest(persist_directory, active) if active else None
+
+    if not full and manifest is not None and manifest.get("chunking") == params:
+        mode = "incremental"
+        collection_name = active
+        print(f"🔁 Atualização incremental da coleção: {collection_name}")
+        vectorstore, _ = update_collection(docs_path, persist_directory, collection_name, manifest,
+                                           file_hashes, params, stats=stats)
+        if vectorstore is None:
+            print(f"\n✅ Nenhuma alteração em '{docs_path}/'. Base já está atualizada.")
+            return {"collection": collection_name, "kb_version": None, "files": len(manifest["files"]),
+                    "changed": False, "report": None}
+    else:
+        mode = "full"
+        # A nova coleção é criada ao lado da atual, no mesmo diretório.
+        # Os workers continuam servindo a coleção ativa até o ponteiro ser trocado.
+        # Uma criação interrompida é retomada na mesma coleção.
+        checkpoint = find_checkpoint(persist_directory, params)
+        collection_name = checkpoint["collection"] if checkpoint else f"{COLLECTION_PREFIX}{int(time.time())}"
+        if manifest is not None and not full:
+            print("⚙️  Parâmetros de chunking mudaram: reconstruindo a base inteira")
+        print(f"🆕 Nova coleção: {collection_name}")
+        vectorstore = build_collection(docs_path, persist_directory, collection_name, params, file_hashes,
+                                       checkpoint=checkpoint, stats=stats)
+        if vectorstore is None:
+            print("❌ Nenhum documento foi carregado.")
+            return None
+
+    smoke_test(vectorstore)
+    kb_version = (vectorstore._collection.metadata or {}).get("kb_version")
+    if publish:
+        # Os workers aquecem a coleção/versão em segundo plano e trocam sem interrupção
+        publish_active_collection(persist_directory, collection_name, kb_version=kb_version)
+        print(f"\n🔀 Coleção ativa: {collection_name} (versão {kb_version})")
+    files = len(load_manifest(persist_directory, collection_name)["files"])
+    save_report(stats, persist_directory, collection_name, mode, {"kb_version": kb_version, "indexed_files": files})
+    return {"collection": collection_name, "kb_version": kb_version, "files": files, "changed": True,
+            "report": report_path(persist_directory, collection_name)}
+
+
+def load_documents_from_folder(folder_path, max_workers=None, timeout=None):
+    """Carrega todos os documentos suportados de uma pasta, em paralelo e em ordem alfabética."""
     docs = []
-    for filename in os.listdir(folder_path):
-        ext = os.path.splitext(filename)[1].lower()
-        file_path = os.path.join(folder_path, filename)
-        if ext == '.txt' or ext == '.md':
-            docs += TextLoader(file_path).load()
-        elif ext == '.pdf':
-            docs += UnstructuredPDFLoader(file_path).load()
-        elif ext == '.docx':
-            docs += UnstructuredWordDocumentLoader(file_path).load()
-        elif ext == '.csv':
-            docs += CSVLoader(file_path).load()
+    for _, loaded in iter_file_documents(folder_path, supported_files(folder_path),
+                                         max_workers=max_workers, timeout=timeout):
+        docs += loaded
     return docs
 
-def split_documents(documents, chunk_size=1000, chunk_overlap=150):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return splitter.split_documents(documents)
 
 def ingest_documents(folder_path=DOCS_PATH, collection_name="meu_vetores", chunk_size=None, chunk_overlap=None):
-    """Pipeline completo: carrega, divide, embute e indexa documentos no ChromaDB.
+    """Pipeline completo: carrega, divide, embute e indexa documentos no ChromaDB (em memória).
     chunk_size e chunk_overlap podem ser ajustados dinamicamente.
+    Os arquivos fluem em lotes de INGEST_BATCH_SIZE chunks, com memória limitada.
     """
-    docs = load_documents_from_folder(folder_path)
     # Usa valores customizados se fornecidos, senão usa padrão
-    cs = chunk_size if chunk_size is not None else 1000
-    co = chunk_overlap if chunk_overlap is not None else 150
-    chunks = split_documents(docs, chunk_size=cs, chunk_overlap=co)
-    embeddings = FastEmbedEmbeddings(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    vectorstore = Chroma.from_documents(chunks, embedding=embeddings, collection_name=collection_name)
+    params = chunking_params(
+        chunk_size if chunk_size is not None else CHUNK_SIZE,
+        chunk_overlap if chunk_overlap is not None else CHUNK_OVERLAP,
+    )
+    embeddings = make_embeddings(params["embedding_model"])
+    vectorstore = Chroma(collection_name=collection_name, embedding_function=embeddings)
+    file_hashes = hash_documents_folder(folder_path)
+    stream_into_collection(vectorstore._collection, embeddings, folder_path, list(file_hashes), {},
+                           file_hashes, params, dedup=make_dedup_index(vectorstore._collection, {}))
+    close_embedding_cache(embeddings)
     return vectorstore
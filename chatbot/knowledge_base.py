@@ -0,0 +1,265 @@
+# Ponteiro da coleção ativa e controle de troca da base de conhecimento entre workers
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import time
+
+from chatbot.flatindex import flat_index_files, flat_index_path
+
+ALIAS_FILENAME = "ACTIVE_COLLECTION.json"
+HEARTBEAT_DIRNAME = "workers"
+# Heartbeats mais antigos que isso pertencem a workers encerrados
+HEARTBEAT_MAX_AGE = 300
+# Cada worker renova o heartbeat nesse intervalo (s), mesmo ocioso; deve ser bem menor que HEARTBEAT_MAX_AGE
+KB_HEARTBEAT_INTERVAL = min(float(os.getenv("KB_HEARTBEAT_INTERVAL", "60")), HEARTBEAT_MAX_AGE / 3)
+# Coleções e backups anteriores mantidos para rollback, além da coleção ativa
+KB_KEEP_PREVIOUS = int(os.getenv("KB_KEEP_PREVIOUS", "1"))
+KB_KEEP_BACKUPS = int(os.getenv("KB_KEEP_BACKUPS", "1"))
+# Limpeza de coleções, backups e compactação do SQLite ao final de cada ingestão
+KB_AUTO_CLEANUP = os.getenv("KB_AUTO_CLEANUP", "false").lower() == "true"
+CHROMA_SQLITE_FILENAME = "chroma.sqlite3"
+# Coleção servida pelos workers quando não há ponteiro ACTIVE_COLLECTION.json
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "chatcotin_knowledge_1748485543")
+
+# Consultas usadas para aquecer uma coleção nova antes de colocá-la em produção
+WARMUP_QUERIES = [
+    "módulos da API de dados abertos",
+    "transparência pública",
+    "Lei de Acesso à Informação",
+    "compras governamentais",
+    "portal transparência",
+    "dados de licitações",
+    "quais painéis estão disponíveis",
+]
+
+
+def alias_path(persist_directory):
+    return os.path.join(persist_directory, ALIAS_FILENAME)
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_active_collection(persist_directory):
+    """
+    Lê o ponteiro da coleção ativa.
+
+    Returns:
+        dict: {"collection", "kb_version", "updated_at"} ou None se não houver ponteiro
+    """
+    try:
+        with open(alias_path(persist_directory), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def active_collection_name(persist_directory):
+    """Coleção que os workers servem: a do ponteiro ou, sem ponteiro, CHROMA_COLLECTION."""
+    return (read_active_collection(persist_directory) or {}).get("collection") or CHROMA_COLLECTION
+
+
+def publish_active_collection(persist_directory, collection_name, kb_version=None):
+    """Aponta a base de conhecimento para outra coleção (escrita atômica, lida pelos workers)."""
+    data = {
+        "collection": collection_name,
+        "kb_version": kb_version,
+        "updated_at": time.time(),
+    }
+    _write_json_atomic(alias_path(persist_directory), data)
+    return data
+
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def write_heartbeat(persist_directory, collection_name):
+    """Registra qual coleção este worker está servindo."""
+    path = os.path.join(persist_directory, HEARTBEAT_DIRNAME, f"{worker_id()}.json")
+    _write_json_atomic(path, {
+        "worker": worker_id(),
+        "collection": collection_name,
+        "updated_at": time.time(),
+    })
+
+
+def collections_in_use(persist_directory, max_age=HEARTBEAT_MAX_AGE, prune=False):
+    """
+    Coleções servidas por workers vivos. Com prune, os heartbeats expirados são removidos.
+
+    Returns:
+        set: nomes das coleções em uso
+    """
+    directory = os.path.join(persist_directory, HEARTBEAT_DIRNAME)
+    in_use = set()
+    if not os.path.isdir(directory):
+        return in_use
+    now = time.time()
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                heartbeat = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - heartbeat.get("updated_at", 0) > max_age:
+            if prune:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            continue
+        in_use.add(heartbeat.get("collection"))
+    return in_use
+
+
+def collection_files(persist_directory, name):
+    """Arquivos auxiliares gravados ao lado de uma coleção (BM25, manifesto, índice plano, relatório)."""
+    return [
+        os.path.join(persist_directory, filename)
+        for filename in (f"bm25_{name}.json", f"manifest_{name}.json", f"checkpoint_{name}.json",
+                         f"ingest_report_{name}.json")
+    ] + flat_index_files(flat_index_path(persist_directory, name))
+
+
+def path_size(path):
+    """Tamanho em bytes de um arquivo ou de uma pasta inteira."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _segment_dirs(persist_directory, collection_id):
+    """Pastas dos segmentos (índice HNSW) de uma coleção dentro do diretório do ChromaDB."""
+    try:
+        with sqlite3.connect(f"file:{os.path.join(persist_directory, CHROMA_SQLITE_FILENAME)}?mode=ro",
+                             uri=True) as conn:
+            rows = conn.execute("SELECT id FROM segments WHERE collection = ?", (str(collection_id),)).fetchall()
+    except sqlite3.Error:
+        return []
+    return [path for path in (os.path.join(persist_directory, row[0]) for row in rows) if os.path.isdir(path)]
+
+
+def collection_size(persist_directory, collection):
+    """
+    Bytes ocupados por uma coleção fora do SQLite compartilhado: segmentos e arquivos auxiliares.
+    """
+    paths = _segment_dirs(persist_directory, collection.id) + collection_files(persist_directory, collection.name)
+    return sum(path_size(path) for path in paths if os.path.exists(path))
+
+
+def list_backups(persist_directory):
+    """
+    Cópias antigas do diretório inteiro (<diretório>_backup_<timestamp>), das mais recentes
+    para as mais antigas.
+    """
+    persist_directory = os.path.abspath(persist_directory)
+    parent, prefix = os.path.dirname(persist_directory), f"{os.path.basename(persist_directory)}_backup_"
+    if not os.path.isdir(parent):
+        return []
+    backups = [
+        os.path.join(parent, name) for name in os.listdir(parent)
+        if name.startswith(prefix) and os.path.isdir(os.path.join(parent, name))
+    ]
+    return sorted(backups, reverse=True)
+
+
+def retire_backups(persist_directory, keep=KB_KEEP_BACKUPS, dry_run=False):
+    """
+    Remove os backups do diretório do ChromaDB, exceto os keep mais recentes.
+
+    Returns:
+        list: caminhos removidos (ou que seriam removidos, em dry_run)
+    """
+    retired = list_backups(persist_directory)[keep:]
+    if not dry_run:
+        for path in retired:
+            shutil.rmtree(path, ignore_errors=True)
+    return retired
+
+
+def vacuum_store(persist_directory):
+    """
+    Compacta o SQLite do ChromaDB, devolvendo ao disco o espaço das coleções removidas.
+    Falha (banco em uso) sem afetar a base; basta repetir depois.
+
+    Returns:
+        int: bytes liberados, ou None se o banco não existe ou estava bloqueado
+    """
+    path = os.path.join(persist_directory, CHROMA_SQLITE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    before = os.path.getsize(path)
+    try:
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ Não foi possível compactar {path}: {e}")
+        return None
+    return before - os.path.getsize(path)
+
+
+def retire_collections(client, persist_directory, keep_previous=KB_KEEP_PREVIOUS, dry_run=False):
+    """
+    Remove coleções antigas que não são a ativa nem estão em uso por algum worker vivo.
+    As keep_previous coleções mais recentes (pelo timestamp no nome) são mantidas para rollback.
+    Coleções com checkpoint são criações em andamento ou interrompidas (retomadas pela próxima
+    ingestão): não são removidas nem contam como coleção anterior.
+
+    Returns:
+        list: nomes das coleções removidas (ou que seriam removidas, em dry_run)
+    """
+    active = active_collection_name(persist_directory)
+    protected = collections_in_use(persist_directory, prune=not dry_run) | {active}
+    collections = sorted(client.list_collections(), key=lambda c: c.name, reverse=True)
+    candidates = [
+        c.name for c in collections
+        if c.name not in protected
+        and not os.path.exists(os.path.join(persist_directory, f"checkpoint_{c.name}.json"))
+    ]
+    retired = candidates[keep_previous:]
+    if not dry_run:
+        for name in retired:
+            client.delete_collection(name)
+            for path in collection_files(persist_directory, name):
+                if os.path.exists(path):
+                    os.remove(path)
+    return retired
+
+
+def cleanup_knowledge_base(persist_directory, keep_previous=KB_KEEP_PREVIOUS, keep_backups=KB_KEEP_BACKUPS,
+                           vacuum=True, dry_run=False):
+    """
+    Libera espaço em disco: remove coleções antigas (mantendo a ativa, as em uso e as
+    keep_previous mais recentes), backups antigos do diretório e compacta o SQLite.
+
+    Returns:
+        dict: {"collections", "backups", "vacuumed_bytes"}
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=persist_directory)
+    collections = retire_collections(client, persist_directory, keep_previous=keep_previous, dry_run=dry_run)
+    backups = retire_backups(persist_directory, keep=keep_backups, dry_run=dry_run)
+    vacuumed = None
+    if vacuum and not dry_run:
+        vacuumed = vacuum_store(persist_directory)
+    return {"collections": collections, "backups": backups, "vacuumed_bytes": vacuumed}
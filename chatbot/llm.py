@@ -1,11 +1,16 @@
 # Integração com modelos de IA para RAG - ChatCOTIN
 import os
-from groq import Groq
+
+import httpx
+from groq import APIConnectionError
 from markdown import markdown
-from django.conf import settings
 
-# Configuração do Groq - usar Django settings
-GROQ_API_KEY = getattr(settings, 'GROQ_API_KEY', '')
+from chatbot.context_packer import pack_prompt
+from chatbot.providers import MAX_COMPLETION_TOKENS, get_async_groq_client, get_databricks_llm, get_groq_client
+
+# Configuração do Groq (chave e pool de conexões em chatbot/providers.py)
+GROQ_MODEL = "llama-3.3-70b-versatile"
+SYSTEM_MESSAGE = "Você é o ChatCOTIN. Siga rigorosamente as instruções do prompt."
 
 DOCS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Docs')
 if not os.path.exists(DOCS_PATH):
@@ -76,106 +81,211 @@ def get_unified_prompt_template():
     return UNIFIED_PROMPT_TEMPLATE
 
 
+def build_prompt(context, question, chat_history=None, budget=None):
+    """
+    Monta o prompt unificado dentro do orçamento de tokens.
+
+    Args:
+        context: Lista de trechos (do mais relevante ao menos) ou texto único
+        question (str): Pergunta do usuário
+        chat_history: Lista de turnos (do mais antigo ao mais recente) ou texto único
+        budget (int): Limite de tokens do prompt (padrão: LLM_PROMPT_TOKEN_BUDGET)
+
+    Returns:
+        tuple: (prompt, número de tokens)
+    """
+    chunks = [context] if isinstance(context, str) else list(context or [])
+    history_turns = [chat_history] if isinstance(chat_history, str) else list(chat_history or [])
+    return pack_prompt(UNIFIED_PROMPT_TEMPLATE, question, chunks, history_turns, budget=budget)
+
+
+# Falhas passageiras (sobrecarga, limite de requisições, rede): vale tentar de novo mais tarde
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _network_errors():
+    """Exceções de rede e de tempo esgotado dos clientes Groq (httpx) e Databricks (requests)."""
+    errors = [APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError]
+    try:
+        import requests
+        errors += [requests.ConnectionError, requests.Timeout]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+NETWORK_ERRORS = _network_errors()
+
+
+class LLMProviderError(Exception):
+    """
+    Falha de um provedor de LLM; status é o código HTTP, quando houver, e retry_after
+    o tempo de espera (s) pedido pelo provedor no cabeçalho Retry-After.
+    """
+
+    def __init__(self, provider, message, status=None, retry_after=None, transient=None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+        self.transient = status in TRANSIENT_STATUSES if transient is None else transient
+
+    @property
+    def overloaded(self):
+        """Limite de requisições ou serviço sobrecarregado: vale tentar outro provedor."""
+        return self.status in (429, 503)
+
+
+def error_status(error):
+    """Código HTTP de uma exceção dos clientes Groq/Databricks (ou None se não houver resposta HTTP)."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error):
+    """Segundos pedidos pelo provedor no cabeçalho Retry-After (ou None)."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def provider_error(provider, error):
+    if isinstance(error, LLMProviderError):
+        return error
+    status = error_status(error)
+    # Sem código HTTP, só falhas de rede são passageiras; erros de programação ou de
+    # interpretação da resposta não melhoram com novas tentativas
+    return LLMProviderError(provider, f"{provider}: {error}", status=status,
+                            retry_after=retry_after(error),
+                            transient=status in TRANSIENT_STATUSES or isinstance(error, NETWORK_ERRORS))
+
+
+def provider_error_message(error):
+    """Mensagem exibida ao usuário quando nenhum provedor conseguiu responder."""
+    status = getattr(error, "status", None)
+    if status == 503:
+        return ("⚠️ Os modelos de IA estão temporariamente indisponíveis devido a alta demanda. "
+               "Por favor, tente novamente em alguns minutos.")
+    elif status == 401:
+        return "❌ Erro de autenticação com o provedor de IA. Verifique a configuração da API key."
+    elif status == 429:
+        return "⚠️ Limite de requisições excedido. Aguarde alguns minutos antes de tentar novamente."
+    return f"❌ Erro inesperado: {error}"
+
+
+def build_messages(context, question, chat_history=None, budget=None):
+    """
+    Mensagens enviadas a qualquer provedor: instrução de sistema e prompt unificado
+    (dentro de budget tokens, se informado).
+
+    Returns:
+        tuple: (mensagens, número de tokens do prompt)
+    """
+    prompt, prompt_tokens = build_prompt(context, question, chat_history, budget=budget)
+    print(f"🧮 Prompt com {prompt_tokens} tokens")
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt},
+    ], prompt_tokens
+
+
+# ===== Backends =====
+# Cada backend faz uma única tentativa e levanta LLMProviderError em caso de falha;
+# novas tentativas e a troca de provedor ficam com o roteador (chatbot/router.py).
+
 def get_groq_llm():
-    """Retorna uma instância do cliente Groq configurado."""
-    if not GROQ_API_KEY:
-        raise ValueError("GROQ_API_KEY não está configurada. Adicione-a nas variáveis de ambiente.")
-    
-    return Groq(api_key=GROQ_API_KEY)
+    """Retorna o cliente Groq do processo (conexões reaproveitadas entre requisições)."""
+    return get_groq_client()
+
+
+def get_async_groq_llm():
+    """Retorna o cliente Groq assíncrono do processo (views assíncronas, servidor ASGI)."""
+    return get_async_groq_client()
+
+
+def _groq_request(messages, stream):
+    return dict(
+        model=GROQ_MODEL,
+        messages=messages,
+        temperature=0.1,
+        max_tokens=MAX_COMPLETION_TOKENS["groq"],
+        top_p=0.9,
+        stream=stream
+    )
+
+
+def groq_complete(messages):
+    """Resposta completa (markdown) do Groq Llama-3.3-70B-Versatile."""
+    try:
+        completion = get_groq_llm().chat.completions.create(**_groq_request(messages, stream=False))
+    except Exception as e:
+        raise provider_error("groq", e) from e
+    return completion.choices[0].message.content
+
+
+async def agroq_complete(messages):
+    try:
+        completion = await get_async_groq_llm().chat.completions.create(**_groq_request(messages, stream=False))
+    except Exception as e:
+        raise provider_error("groq", e) from e
+    return completion.choices[0].message.content
+
+
+async def astream_groq(messages):
+    """
+    Trechos da resposta do Groq (markdown) à medida que o modelo os gera. Cancelar ou fechar
+    o gerador encerra a conexão e interrompe a geração.
+    """
+    stream = None
+    try:
+        stream = await get_async_groq_llm().chat.completions.create(**_groq_request(messages, stream=True))
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    except Exception as e:
+        raise provider_error("groq", e) from e
+    finally:
+        if stream is not None:
+            await stream.close()
+
+
+def databricks_complete(messages):
+    """Resposta completa (markdown) do endpoint Databricks."""
+    try:
+        return get_databricks_llm().invoke(messages).content
+    except Exception as e:
+        raise provider_error("databricks", e) from e
+
+
+async def adatabricks_complete(messages):
+    try:
+        return (await get_databricks_llm().ainvoke(messages)).content
+    except Exception as e:
+        raise provider_error("databricks", e) from e
+
+
+async def astream_databricks(messages):
+    """Trechos da resposta do Databricks (markdown) à medida que o modelo os gera."""
+    stream = get_databricks_llm().astream(messages)
+    try:
+        async for chunk in stream:
+            if chunk.content:
+                yield chunk.content
+    except Exception as e:
+        raise provider_error("databricks", e) from e
+    finally:
+        await stream.aclose()
 
 
 def generate_answer_groq(context, question, chat_history=None):
     """
-    Gera uma resposta usando o modelo Groq Llama-3.3-70B-Versatile.
-    Utiliza o prompt template unificado do ChatCOTIN.
-    Inclui proteção contra contexto muito longo e retry em caso de erro 503.
+    Gera uma resposta (HTML) usando o modelo Groq Llama-3.3-70B-Versatile, sem roteamento.
+    Utiliza o prompt template unificado do ChatCOTIN; levanta LLMProviderError em caso de falha.
     """
-    client = get_groq_llm()
-    
-    # Proteção contra contexto muito longo (Groq tem limite de ~128K tokens)
-    # Estimativa: 1 token ≈ 4 caracteres em português
-    MAX_CONTEXT_CHARS = 80000  # ~20K tokens para contexto
-    MAX_HISTORY_CHARS = 8000   # ~2K tokens para histórico
-    
-    # Truncar contexto se muito longo
-    if len(context) > MAX_CONTEXT_CHARS:
-        context = context[:MAX_CONTEXT_CHARS] + "\n\n[CONTEXTO TRUNCADO DEVIDO AO TAMANHO]"
-        print(f"⚠️ Contexto truncado para {MAX_CONTEXT_CHARS} caracteres")
-    
-    # Truncar histórico se muito longo
-    if chat_history and len(chat_history) > MAX_HISTORY_CHARS:
-        chat_history = chat_history[-MAX_HISTORY_CHARS:] + "\n[HISTÓRICO TRUNCADO]"
-        print(f"⚠️ Histórico truncado para {MAX_HISTORY_CHARS} caracteres")
-    
-    # Usar o template unificado
-    prompt = UNIFIED_PROMPT_TEMPLATE.format(context=context, question=question)
-    
-    # Se houver histórico, incluir no prompt
-    if chat_history:
-        prompt = f"HISTÓRICO DA CONVERSA:\n{chat_history}\n\n{prompt}"
-    
-    # Implementar retry para erro 503 (Service Unavailable)
-    import time
-    max_retries = 3
-    
-    for attempt in range(max_retries):
-        try:
-            # Fazer a chamada para o modelo Groq
-            completion = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "Você é o ChatCOTIN. Siga rigorosamente as instruções do prompt."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=4096,
-                top_p=0.9,
-                stream=False
-            )
-            
-            response = completion.choices[0].message.content
-            # Converter markdown para HTML
-            return markdown(response, output_format='html')
-            
-        except Exception as e:
-            error_str = str(e)
-            
-            # Se for erro 503 e ainda há tentativas, retry com delay
-            if '503' in error_str and attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 2  # 2s, 4s, 6s
-                print(f"⚠️ Erro 503 (tentativa {attempt + 1}/{max_retries}). Tentando novamente em {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            
-            # Se for erro de token limit, tentar com contexto ainda menor
-            elif ('token' in error_str.lower() or 'length' in error_str.lower()) and attempt == 0:
-                print("⚠️ Erro de token limit. Reduzindo contexto...")
-                context = context[:40000] + "\n\n[CONTEXTO REDUZIDO DEVIDO A LIMITE DE TOKENS]"
-                prompt = UNIFIED_PROMPT_TEMPLATE.format(context=context, question=question)
-                if chat_history:
-                    prompt = f"HISTÓRICO DA CONVERSA:\n{chat_history[:4000]}\n\n{prompt}"
-                continue
-            
-            # Para outros erros ou esgotadas as tentativas
-            else:
-                # Melhorar mensagem de erro para o usuário
-                if '503' in error_str:
-                    return ("⚠️ O serviço Groq está temporariamente indisponível devido a alta demanda. "
-                           "Por favor, tente novamente em alguns minutos ou use o modelo Databricks.")
-                elif '401' in error_str:
-                    return "❌ Erro de autenticação com Groq. Verifique a configuração da API key."
-                elif '429' in error_str:
-                    return ("⚠️ Limite de requisições excedido. Aguarde alguns minutos antes de tentar novamente "
-                           "ou use o modelo Databricks.")
-                else:
-                    return f"❌ Erro inesperado: {error_str}"
-    
-    # Se chegou aqui, todas as tentativas falharam
-    return ("⚠️ Não foi possível conectar ao Groq após várias tentativas. "
-           "Por favor, tente usar o modelo Databricks ou tente novamente mais tarde.")
+    messages, _ = build_messages(context, question, chat_history)
+    return markdown(groq_complete(messages), output_format='html')
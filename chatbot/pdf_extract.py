@@ -0,0 +1,99 @@
+# Extração rápida de PDFs com pypdf, página a página; o unstructured só trata páginas sem camada de texto
+import os
+import tempfile
+
+from pypdf import PdfReader, PdfWriter
+
+# PDFs com mais páginas que isso são divididos em faixas extraídas em paralelo (0 desativa)
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+# Páginas sem texto (digitalizadas) passam pelo unstructured, que aplica OCR
+PDF_OCR_FALLBACK = os.getenv("PDF_OCR_FALLBACK", "true").lower() == "true"
+
+
+def page_count(file_path):
+    """Número de páginas do PDF, ou None se o arquivo não puder ser lido."""
+    try:
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return None
+
+
+def page_ranges(file_path, pages_per_task=PDF_PAGES_PER_TASK):
+    """
+    Faixas de páginas [início, fim) em que o PDF é dividido para extração paralela.
+
+    Returns:
+        list: [None] para extrair o arquivo inteiro de uma vez
+    """
+    total = page_count(file_path)
+    if not total or not pages_per_task or total <= pages_per_task:
+        return [None]
+    return [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+
+
+def iter_pages(file_path, pages=None):
+    """
+    Texto de cada página, lida sob demanda (o PDF não é carregado inteiro em memória).
+
+    Yields:
+        tuple: (número da página a partir de 1, texto, total de páginas)
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    start, end = pages or (0, total)
+    for index in range(start, min(end, total)):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            print(f"    ⚠️ Página {index + 1} de {os.path.basename(file_path)} ilegível: {e}")
+            text = ""
+        yield index + 1, text, total
+
+
+def ocr_pages(file_path, page_numbers):
+    """
+    Extrai com o unstructured apenas as páginas indicadas, copiadas para um PDF temporário.
+
+    Returns:
+        dict: {número da página: texto}
+    """
+    from langchain_community.document_loaders import UnstructuredPDFLoader
+
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    for number in page_numbers:
+        writer.add_page(reader.pages[number - 1])
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer.write(f)
+        elements = UnstructuredPDFLoader(tmp_path, mode="elements").load()
+    finally:
+        os.remove(tmp_path)
+
+    texts = {}
+    for element in elements:
+        position = element.metadata.get("page_number")
+        if not position or position > len(page_numbers):
+            continue
+        texts.setdefault(page_numbers[position - 1], []).append(element.page_content)
+    return {number: "\n".join(parts) for number, parts in texts.items()}
+
+
+def extract_pdf(file_path, pages=None):
+    """
+    Extrai as páginas com pypdf e recorre ao unstructured para as que não têm texto.
+
+    Returns:
+        list: (número da página, texto, total de páginas) em ordem
+    """
+    extracted = list(iter_pages(file_path, pages))
+    missing = [number for number, text, _ in extracted if not text.strip()]
+    if missing and PDF_OCR_FALLBACK:
+        try:
+            recovered = ocr_pages(file_path, missing)
+        except Exception as e:
+            print(f"    ⚠️ OCR indisponível para {len(missing)} página(s) de {os.path.basename(file_path)}: {e}")
+            recovered = {}
+        extracted = [(number, recovered.get(number, text), total) for number, text, total in extracted]
+    return extracted
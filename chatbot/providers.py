@@ -0,0 +1,186 @@
+# Clientes de LLM de longa duração, um por processo, com pool de conexões HTTP (keep-alive)
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from groq import AsyncGroq, Groq
+
+GROQ_API_KEY = getattr(settings, 'GROQ_API_KEY', '')
+# Pool de conexões HTTP de cada cliente
+LLM_HTTP_MAX_CONNECTIONS = getattr(settings, 'LLM_HTTP_MAX_CONNECTIONS', 100)
+LLM_HTTP_MAX_KEEPALIVE = getattr(settings, 'LLM_HTTP_MAX_KEEPALIVE', 20)
+LLM_HTTP_KEEPALIVE_EXPIRY = getattr(settings, 'LLM_HTTP_KEEPALIVE_EXPIRY', 60.0)
+# Conexão rápida para detectar um provedor fora do ar; leitura longa para respostas extensas
+LLM_HTTP_CONNECT_TIMEOUT = getattr(settings, 'LLM_HTTP_CONNECT_TIMEOUT', 5.0)
+LLM_HTTP_READ_TIMEOUT = getattr(settings, 'LLM_HTTP_READ_TIMEOUT', 120.0)
+# Limite de tokens da resposta (max_tokens) de cada provedor; o controle de admissão reserva esse valor
+MAX_COMPLETION_TOKENS = {
+    "groq": getattr(settings, 'GROQ_MAX_TOKENS', 4096),
+    "databricks": getattr(settings, 'DATABRICKS_MAX_TOKENS', 2048),
+}
+
+_lock = threading.Lock()
+# nome -> {"client", "http", "created_at", "requests"}
+_clients = {}
+# id do loop de eventos -> (loop, {nome: entrada}); um AsyncClient não pode trocar de loop
+_async_clients = {}
+
+
+def http_limits():
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def http_timeout():
+    return httpx.Timeout(LLM_HTTP_READ_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+
+
+def _entry(client=None, http=None):
+    return {"client": client, "http": http, "created_at": time.time(), "requests": 0}
+
+
+def _count_request(entry):
+    def hook(request):
+        entry["requests"] += 1
+    return hook
+
+
+def _count_request_async(entry):
+    async def hook(request):
+        entry["requests"] += 1
+    return hook
+
+
+def _require_groq_key():
+    if not GROQ_API_KEY:
+        raise ValueError("GROQ_API_KEY não está configurada. Adicione-a nas variáveis de ambiente.")
+
+
+def _new_groq():
+    # Sem novas tentativas no SDK: ficam com o roteador, que respeita os limites entre workers
+    _require_groq_key()
+    entry = _entry()
+    entry["http"] = httpx.Client(limits=http_limits(), timeout=http_timeout(),
+                                 event_hooks={"request": [_count_request(entry)]})
+    entry["client"] = Groq(api_key=GROQ_API_KEY, http_client=entry["http"], timeout=http_timeout(),
+                           max_retries=0)
+    return entry
+
+
+def _new_async_groq():
+    _require_groq_key()
+    entry = _entry()
+    entry["http"] = httpx.AsyncClient(limits=http_limits(), timeout=http_timeout(),
+                                      event_hooks={"request": [_count_request_async(entry)]})
+    entry["client"] = AsyncGroq(api_key=GROQ_API_KEY, http_client=entry["http"], timeout=http_timeout(),
+                                max_retries=0)
+    return entry
+
+
+def _new_databricks():
+    from databricks_langchain import ChatDatabricks
+
+    # O ChatDatabricks guarda o cliente do endpoint; reaproveitá-lo mantém as conexões abertas
+    return _entry(ChatDatabricks(
+        endpoint=settings.DATABRICKS_MODEL_ENDPOINT,
+        temperature=0.7,
+        max_tokens=MAX_COMPLETION_TOKENS["databricks"]
+    ))
+
+
+_FACTORIES = {"groq": _new_groq, "databricks": _new_databricks}
+
+
+def get_client(name):
+    """Cliente síncrono do provedor, criado na primeira chamada e reaproveitado pelo processo."""
+    entry = _clients.get(name)
+    if entry is None:
+        with _lock:
+            entry = _clients.get(name)
+            if entry is None:
+                entry = _clients[name] = _FACTORIES[name]()
+    return entry["client"]
+
+
+def get_async_groq_client():
+    """
+    Cliente Groq assíncrono do loop de eventos atual. Sob o uvicorn há um loop por processo;
+    no servidor de desenvolvimento cada requisição assíncrona roda em um loop próprio.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        current = _async_clients.get(id(loop))
+        if current is None or current[0] is not loop:
+            # Descarta os clientes de loops já encerrados
+            for key, (other, _) in list(_async_clients.items()):
+                if other.is_closed():
+                    del _async_clients[key]
+            current = _async_clients[id(loop)] = (loop, {})
+        entry = current[1].get("groq")
+        if entry is None:
+            entry = current[1]["groq"] = _new_async_groq()
+    return entry["client"]
+
+
+def get_groq_client():
+    return get_client("groq")
+
+
+def get_databricks_llm():
+    return get_client("databricks")
+
+
+def _connection_counts(http):
+    """Conexões abertas e ociosas no pool do httpx (API interna do httpcore; None se indisponível)."""
+    try:
+        connections = list(http._transport._pool.connections)
+    except AttributeError:
+        return None, None
+    return len(connections), sum(1 for connection in connections if connection.is_idle())
+
+
+def pool_stats():
+    """
+    Clientes deste processo: idade, requisições feitas e conexões abertas/ociosas do pool.
+
+    Returns:
+        dict: {nome: {...}}; clientes assíncronos aparecem como "<nome>@async<n>"
+    """
+    with _lock:
+        entries = list(_clients.items())
+        for index, (_, clients) in enumerate(_async_clients.values()):
+            entries += [(f"{name}@async{index}", entry) for name, entry in clients.items()]
+    now = time.time()
+    stats = {"pid": os.getpid(), "clients": {}}
+    for name, entry in entries:
+        open_connections, idle_connections = (
+            _connection_counts(entry["http"]) if entry["http"] is not None else (None, None)
+        )
+        stats["clients"][name] = {
+            "age_seconds": round(now - entry["created_at"], 1),
+            "requests": entry["requests"] if entry["http"] is not None else None,
+            "open_connections": open_connections,
+            "idle_connections": idle_connections,
+        }
+    return stats
+
+
+def _reset_after_fork():
+    """
+    No processo filho, descarta os clientes herdados: os sockets pertencem ao processo pai e
+    não podem ser compartilhados. Os clientes são recriados na primeira chamada.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,292 @@
+# Controle de admissão das requisições aos provedores de LLM, compartilhado entre os workers
+import asyncio
+import functools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from chatbot.context_packer import LLM_PROMPT_TOKEN_BUDGET
+from chatbot.llm import LLMProviderError
+from chatbot.providers import MAX_COMPLETION_TOKENS
+
+LLM_RATE_LIMIT = getattr(settings, 'LLM_RATE_LIMIT', True)
+# Estado dos baldes em SQLite: compartilhado pelos workers da mesma máquina (instância)
+LLM_RATE_LIMIT_DB = (getattr(settings, 'LLM_RATE_LIMIT_DB', '')
+                     or os.path.join(tempfile.gettempdir(), 'chatcotin_llm_rate_limits.sqlite3'))
+# Limites de cada provedor por minuto: (requisições, tokens); 0 = sem limite
+LLM_RATE_LIMITS = {
+    "groq": (getattr(settings, 'GROQ_RATE_LIMIT_RPM', 30), getattr(settings, 'GROQ_RATE_LIMIT_TPM', 12000)),
+    "databricks": (getattr(settings, 'DATABRICKS_RATE_LIMIT_RPM', 0), getattr(settings, 'DATABRICKS_RATE_LIMIT_TPM', 0)),
+}
+# Fila de espera por provedor: tamanho máximo e tempo máximo de espera (s)
+LLM_ADMISSION_MAX_QUEUE = getattr(settings, 'LLM_ADMISSION_MAX_QUEUE', 50)
+LLM_ADMISSION_TIMEOUT = getattr(settings, 'LLM_ADMISSION_TIMEOUT', 10.0)
+# Novas rodadas de tentativas após falhas passageiras, com espera exponencial aleatorizada
+LLM_RETRY_ATTEMPTS = getattr(settings, 'LLM_RETRY_ATTEMPTS', 2)
+LLM_RETRY_BASE_DELAY = getattr(settings, 'LLM_RETRY_BASE_DELAY', 0.5)
+LLM_RETRY_MAX_DELAY = getattr(settings, 'LLM_RETRY_MAX_DELAY', 8.0)
+# Pausa do provedor após um 429 sem cabeçalho Retry-After
+DEFAULT_RETRY_AFTER = 2.0
+# Intervalo mínimo entre consultas de quem está na fila
+POLL_INTERVAL = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    provider TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class AdmissionError(LLMProviderError):
+    """A requisição não foi admitida: fila cheia ou prazo esgotado antes de haver capacidade."""
+
+    def __init__(self, provider, message, retry_after=None):
+        # Não é falha do provedor: não conta para o disjuntor nem gera nova rodada de tentativas
+        super().__init__(provider, message, status=429, retry_after=retry_after, transient=False)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Espera antes da tentativa seguinte: exponencial com variação aleatória ("full jitter"),
+    para que os workers não repitam a requisição todos ao mesmo tempo. Se o provedor pediu
+    um tempo (Retry-After), espera ao menos esse tempo.
+    """
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    if retry_after:
+        delay = retry_after + random.uniform(0, LLM_RETRY_BASE_DELAY)
+    return delay
+
+
+def estimate_tokens(provider, messages, prompt_tokens=None):
+    """
+    Tokens reservados para uma requisição: prompt (contado ou estimado) mais o max_tokens
+    que o provedor recebe para a resposta.
+    """
+    if prompt_tokens is None:
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+    return prompt_tokens + MAX_COMPLETION_TOKENS.get(provider, 0)
+
+
+def _recreates_schema(method):
+    """
+    Se o banco não tem as tabelas (ex.: o arquivo no diretório temporário foi apagado com o
+    processo rodando), recria o esquema e repete a operação uma vez.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Estado dos limites de LLM indisponível ({e}); recriando {self.path}")
+            self._ready = False
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class RateLimiter:
+    """
+    Baldes de fichas (requisições e tokens por minuto) de cada provedor, guardados em SQLite
+    para que todos os workers consumam do mesmo limite. Quem não tem capacidade entra numa
+    fila por ordem de chegada e espera até o prazo; um 429 do provedor pausa todos os workers.
+    """
+
+    def __init__(self, path, limits):
+        self.path = str(path)
+        self.limits = limits
+        self._ready = False
+
+    def limited(self, provider):
+        return LLM_RATE_LIMIT and any(self.limits.get(provider, (0, 0)))
+
+    def prompt_budget(self, provider):
+        """
+        Orçamento de tokens do prompt enviado ao provedor: LLM_PROMPT_TOKEN_BUDGET, reduzido
+        para que prompt + resposta caibam no limite de tokens por minuto do provedor.
+        """
+        tpm = self.limits.get(provider, (0, 0))[1]
+        if not (self.limited(provider) and tpm):
+            return LLM_PROMPT_TOKEN_BUDGET
+        return max(0, min(LLM_PROMPT_TOKEN_BUDGET, tpm - MAX_COMPLETION_TOKENS.get(provider, 0)))
+
+    def _connect(self):
+        # Uma conexão por operação: seguro entre threads e após o fork dos workers
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._ready = True
+        return conn
+
+    def _bucket(self, conn, provider, now):
+        """Estado do balde, já reabastecido pelo tempo decorrido."""
+        rpm, tpm = self.limits[provider]
+        row = conn.execute(
+            "SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE provider = ?", (provider,)
+        ).fetchone()
+        if row is None:
+            return float(rpm), float(tpm), now, 0.0
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(0.0, now - updated_at)
+        return (min(rpm, requests + elapsed * rpm / 60), min(tpm, tokens + elapsed * tpm / 60),
+                now, blocked_until)
+
+    def _save(self, conn, provider, requests, tokens, now, blocked_until):
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (provider, requests, tokens, updated_at, blocked_until) "
+            "VALUES (?, ?, ?, ?, ?)", (provider, requests, tokens, now, blocked_until)
+        )
+
+    @_recreates_schema
+    def _try_acquire(self, provider, cost, ticket, expires_at):
+        """
+        Tenta consumir uma requisição e `cost` tokens. Só o primeiro da fila (ou quem chega
+        com a fila vazia) pode consumir; os demais entram na fila.
+
+        Returns:
+            tuple: (segundos até a próxima tentativa, 0 se admitido; ticket na fila)
+        """
+        rpm, tpm = self.limits[provider]
+        cost = cost if tpm else 0
+        queue_full = False
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                # Entradas de workers que morreram ou desistiram expiram com o prazo
+                conn.execute("DELETE FROM waiters WHERE expires_at < ?", (now,))
+                requests, tokens, now, blocked_until = self._bucket(conn, provider, now)
+                head = conn.execute(
+                    "SELECT MIN(ticket) FROM waiters WHERE provider = ?", (provider,)
+                ).fetchone()[0]
+                has_capacity = (now >= blocked_until and (not rpm or requests >= 1)
+                                and (not tpm or tokens >= cost))
+                wait = 0.0
+                if has_capacity and ticket == head:
+                    if rpm:
+                        requests -= 1
+                    tokens -= cost
+                    if ticket is not None:
+                        conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+                elif ticket is None and conn.execute(
+                    "SELECT COUNT(*) FROM waiters WHERE provider = ?", (provider,)
+                ).fetchone()[0] >= LLM_ADMISSION_MAX_QUEUE:
+                    queue_full = True
+                else:
+                    if ticket is None:
+                        ticket = conn.execute(
+                            "INSERT INTO waiters (provider, expires_at) VALUES (?, ?)", (provider, expires_at)
+                        ).lastrowid
+                    # Tempo até haver capacidade (para quem não é o primeiro da fila, um limite inferior)
+                    wait = max(
+                        blocked_until - now,
+                        (1 - requests) * 60 / rpm if rpm else 0.0,
+                        (cost - tokens) * 60 / tpm if tpm else 0.0,
+                        POLL_INTERVAL,
+                    )
+                self._save(conn, provider, requests, tokens, now, blocked_until)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if queue_full:
+            raise AdmissionError(provider, f"{provider}: fila de espera cheia ({LLM_ADMISSION_MAX_QUEUE})")
+        return wait, ticket
+
+    @_recreates_schema
+    def _leave(self, ticket):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+
+    def _give_up(self, provider, wait, deadline, timeout):
+        """Desiste se o prazo acabou ou se a espera estimada passa dele."""
+        if time.time() + wait > deadline:
+            raise AdmissionError(
+                provider, f"{provider}: limite de requisições/tokens sem capacidade em {timeout:.0f}s",
+                retry_after=wait,
+            )
+
+    async def aacquire(self, provider, cost, timeout=LLM_ADMISSION_TIMEOUT):
+        """
+        Espera (até `timeout` segundos) por capacidade no provedor e a consome. A espera e o
+        acesso ao SQLite não bloqueiam o loop de eventos.
+
+        Returns:
+            float: segundos de espera na fila
+        """
+        if not self.limited(provider):
+            return 0.0
+        tpm = self.limits[provider][1]
+        if tpm and cost > tpm:
+            # Nunca caberia no balde e o provedor a recusaria com 429: passa direto ao próximo provedor
+            raise AdmissionError(provider, f"{provider}: requisição de {cost} tokens acima do limite de {tpm} tokens/min")
+        started = time.time()
+        deadline = started + timeout
+        ticket = None
+        try_acquire = sync_to_async(self._try_acquire, thread_sensitive=False)
+        leave = sync_to_async(self._leave, thread_sensitive=False)
+        try:
+            while True:
+                wait, ticket = await try_acquire(provider, cost, ticket, deadline)
+                if not wait:
+                    ticket = None
+                    return time.time() - started
+                self._give_up(provider, wait, deadline, timeout)
+                await asyncio.sleep(wait)
+        finally:
+            # Inclusive se a requisição for cancelada (cliente desconectou ou perdeu a corrida);
+            # se nem isso terminar, a entrada expira com o prazo
+            if ticket is not None:
+                await leave(ticket)
+
+    @_recreates_schema
+    def block(self, provider, seconds):
+        """Pausa o provedor para todos os workers (o provedor respondeu 429)."""
+        if not self.limited(provider):
+            return
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            requests, tokens, now, blocked_until = self._bucket(conn, provider, time.time())
+            self._save(conn, provider, requests, tokens, now, max(blocked_until, now + seconds))
+            conn.execute("COMMIT")
+        print(f"⏸️ {provider} pausado por {seconds:.1f}s em todos os workers (limite do provedor)")
+
+    @_recreates_schema
+    def stats(self):
+        """Capacidade disponível, pausa e fila de cada provedor limitado."""
+        stats = {}
+        providers = [provider for provider in self.limits if self.limited(provider)]
+        if not providers:
+            return stats
+        with closing(self._connect()) as conn:
+            now = time.time()
+            for provider in providers:
+                requests, tokens, now, blocked_until = self._bucket(conn, provider, now)
+                queued = conn.execute(
+                    "SELECT COUNT(*) FROM waiters WHERE provider = ? AND expires_at >= ?", (provider, now)
+                ).fetchone()[0]
+                rpm, tpm = self.limits[provider]
+                stats[provider] = {
+                    "requests_available": round(requests, 1) if rpm else None,
+                    "tokens_available": round(tokens) if tpm else None,
+                    "blocked_for": round(max(0.0, blocked_until - now), 1),
+                    "queued": queued,
+                }
+        return stats
+
+
+LIMITER = RateLimiter(LLM_RATE_LIMIT_DB, LLM_RATE_LIMITS)
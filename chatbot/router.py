@@ -0,0 +1,413 @@
+# Roteamento entre os provedores de LLM: latência, disjuntor (circuit breaker) e requisições de cobertura
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from chatbot.llm import (
+    LLMProviderError, adatabricks_complete, agroq_complete, astream_databricks, astream_groq,
+)
+from chatbot.rate_limit import (
+    DEFAULT_RETRY_AFTER, LIMITER, LLM_RETRY_ATTEMPTS, AdmissionError, backoff_delay, estimate_tokens,
+)
+
+# Amostras de latência consideradas (as mais recentes, dentro da janela de tempo)
+ROUTER_WINDOW_SIZE = getattr(settings, 'ROUTER_WINDOW_SIZE', 100)
+ROUTER_WINDOW_SECONDS = getattr(settings, 'ROUTER_WINDOW_SECONDS', 300)
+# Amostras mínimas antes de comparar latências entre provedores
+ROUTER_MIN_SAMPLES = getattr(settings, 'ROUTER_MIN_SAMPLES', 5)
+# O provedor preferido é mantido enquanto sua mediana não passar desse múltiplo da do mais rápido
+ROUTER_LATENCY_TOLERANCE = getattr(settings, 'ROUTER_LATENCY_TOLERANCE', 1.5)
+# Acima dessa taxa de erro recente, o provedor só é tentado depois dos demais
+ROUTER_MAX_ERROR_RATE = getattr(settings, 'ROUTER_MAX_ERROR_RATE', 0.5)
+# Disjuntor: falhas de sobrecarga (429/503/rede) nessa janela abrem o circuito por um tempo
+ROUTER_BREAKER_ERRORS = getattr(settings, 'ROUTER_BREAKER_ERRORS', 3)
+ROUTER_BREAKER_WINDOW = getattr(settings, 'ROUTER_BREAKER_WINDOW', 30)
+ROUTER_BREAKER_COOLDOWN = getattr(settings, 'ROUTER_BREAKER_COOLDOWN', 30)
+# Requisição de cobertura: se a primeira resposta demorar mais que esse percentil, dispara no outro provedor
+ROUTER_HEDGE = getattr(settings, 'ROUTER_HEDGE', True)
+ROUTER_HEDGE_PERCENTILE = getattr(settings, 'ROUTER_HEDGE_PERCENTILE', 95)
+ROUTER_HEDGE_MIN_DELAY = getattr(settings, 'ROUTER_HEDGE_MIN_DELAY', 2.0)
+# Espera antes da cobertura enquanto ainda não há amostras suficientes
+ROUTER_HEDGE_DEFAULT_DELAY = getattr(settings, 'ROUTER_HEDGE_DEFAULT_DELAY', 8.0)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+# Latências medidas em janelas separadas: resposta completa e tempo até o primeiro trecho (streaming)
+COMPLETE, STREAM = "complete", "stream"
+
+
+class LLMUnavailableError(Exception):
+    """Nenhum provedor conseguiu responder; last_error é a última falha."""
+
+    def __init__(self, last_error):
+        super().__init__(str(last_error))
+        self.last_error = last_error
+        self.status = getattr(last_error, "status", None)
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ProviderHealth:
+    """
+    Saúde de um provedor neste processo: latências recentes de cada modo (até a resposta
+    completa ou, no streaming, até o primeiro trecho), taxa de erro e estado do disjuntor.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # modo -> (instante, latência ou None, sucesso)
+        self.samples = {mode: deque(maxlen=ROUTER_WINDOW_SIZE) for mode in (COMPLETE, STREAM)}
+        self.overloads = deque()
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def _recent(self, modes=(COMPLETE, STREAM)):
+        cutoff = time.time() - ROUTER_WINDOW_SECONDS
+        return [sample for mode in modes for sample in self.samples[mode] if sample[0] >= cutoff]
+
+    def latencies(self, mode):
+        return [latency for _, latency, ok in self._recent((mode,)) if ok]
+
+    def percentile(self, percentile, mode):
+        with self._lock:
+            latencies = self.latencies(mode)
+        return _percentile(latencies, percentile) if len(latencies) >= ROUTER_MIN_SAMPLES else None
+
+    def error_rate(self, min_samples=1):
+        with self._lock:
+            recent = self._recent()
+        if len(recent) < min_samples:
+            return 0.0
+        return sum(1 for _, _, ok in recent if not ok) / len(recent)
+
+    def allow(self):
+        """O disjuntor deixa passar uma requisição? Meio aberto: só uma de teste por vez."""
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= ROUTER_BREAKER_COOLDOWN:
+                self.state, self.probing = HALF_OPEN, False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def available(self):
+        """Como allow(), mas sem reservar a requisição de teste."""
+        with self._lock:
+            if self.state == OPEN:
+                return time.time() - self.opened_at >= ROUTER_BREAKER_COOLDOWN
+            return not (self.state == HALF_OPEN and self.probing)
+
+    def record_success(self, latency, mode):
+        with self._lock:
+            self.samples[mode].append((time.time(), latency, True))
+            if self.state != CLOSED:
+                print(f"✅ Circuito do {self.name} fechado")
+            self.state, self.probing = CLOSED, False
+
+    def record_failure(self, error, mode):
+        now = time.time()
+        with self._lock:
+            self.samples[mode].append((now, None, False))
+            # Só falhas passageiras (429/5xx/rede) indicam sobrecarga; 401, 400 ou erros ao
+            # interpretar a resposta contam na taxa de erro, mas não abrem o circuito
+            if not getattr(error, "transient", False):
+                if self.state == HALF_OPEN:
+                    self.probing = False
+                return
+            self.overloads.append(now)
+            while self.overloads and self.overloads[0] < now - ROUTER_BREAKER_WINDOW:
+                self.overloads.popleft()
+            if self.state == HALF_OPEN or len(self.overloads) >= ROUTER_BREAKER_ERRORS:
+                if self.state != OPEN:
+                    print(f"🔌 Circuito do {self.name} aberto por {ROUTER_BREAKER_COOLDOWN}s "
+                          f"({len(self.overloads)} falhas em {ROUTER_BREAKER_WINDOW}s)")
+                self.state, self.opened_at, self.probing = OPEN, now, False
+                self.overloads.clear()
+
+    def cancelled(self):
+        """Requisição abandonada (perdeu a corrida ou o cliente desconectou): libera o teste."""
+        with self._lock:
+            self.probing = False
+
+    def snapshot(self):
+        with self._lock:
+            latencies = {mode: self.latencies(mode) for mode in self.samples}
+            state = self.state
+        return {
+            "state": state,
+            "error_rate": round(self.error_rate(), 3),
+            **{mode: {
+                "samples": len(values),
+                "p50": round(_percentile(values, 50), 3) if values else None,
+                "p95": round(_percentile(values, 95), 3) if values else None,
+            } for mode, values in latencies.items()},
+        }
+
+
+class LLMRouter:
+    """
+    Escolhe o provedor de cada pergunta: o preferido pelo usuário, a menos que o disjuntor dele
+    esteja aberto ou que ele esteja bem mais lento que o outro; em caso de falha, tenta o próximo.
+    Se a primeira resposta demorar mais que o percentil configurado, dispara uma requisição
+    de cobertura no outro provedor e fica com a que responder primeiro. Todo o caminho é
+    assíncrono: esperas na fila e entre tentativas não bloqueiam o worker.
+
+    Cada tentativa passa antes pelo controle de admissão (chatbot/rate_limit.py), que respeita
+    os limites de requisições e tokens do provedor em todos os workers. Se todos os provedores
+    falharem por motivo passageiro, uma nova rodada começa após uma espera exponencial aleatorizada.
+
+    As mensagens são montadas por build(budget), uma vez por orçamento de tokens: o prompt de
+    cada provedor cabe no seu limite de tokens por minuto (RateLimiter.prompt_budget).
+    """
+
+    def __init__(self, backends):
+        # nome -> {"acomplete", "astream", "configured"}
+        self.backends = backends
+        self.health = {name: ProviderHealth(name) for name in backends}
+
+    def order(self, preferred=None, mode=COMPLETE):
+        """Provedores em ordem de tentativa, comparando as latências do modo da requisição."""
+        names = [name for name, backend in self.backends.items() if backend["configured"]()]
+        if not names:
+            return []
+        preferred = preferred if preferred in names else names[0]
+        p50 = {name: self.health[name].percentile(50, mode) for name in names}
+        known = [value for value in p50.values() if value is not None]
+        fastest = min(known) if known else None
+
+        def rank(name):
+            health = self.health[name]
+            failing = health.error_rate(min_samples=ROUTER_MIN_SAMPLES) > ROUTER_MAX_ERROR_RATE
+            slow = (fastest is not None and p50[name] is not None
+                    and p50[name] > fastest * ROUTER_LATENCY_TOLERANCE)
+            return (not health.available(), failing, slow, name != preferred,
+                    p50[name] if p50[name] is not None else float("inf"))
+
+        return sorted(names, key=rank)
+
+    def hedge_delay(self, name, mode):
+        p = self.health[name].percentile(ROUTER_HEDGE_PERCENTILE, mode)
+        return max(ROUTER_HEDGE_MIN_DELAY, p if p is not None else ROUTER_HEDGE_DEFAULT_DELAY)
+
+    def _candidates(self, preferred, mode):
+        order = self.order(preferred, mode)
+        if not order:
+            raise LLMUnavailableError(LLMProviderError(None, "Nenhum provedor de LLM configurado"))
+        # Com todos os circuitos abertos, ainda tenta o primeiro: melhor que recusar a pergunta
+        return [name for name in order if self.health[name].available()] or order[:1]
+
+    def _admit(self, name, last_resort):
+        """Consulta o disjuntor na hora da tentativa (reserva a requisição de teste, se meio aberto)."""
+        return self.health[name].allow() or last_resort
+
+    def _record_failure(self, name, error, mode):
+        self.health[name].record_failure(error, mode)
+        # Limite do provedor atingido: pausa o provedor em todos os workers, não só neste
+        if error.status == 429 and not isinstance(error, AdmissionError):
+            LIMITER.block(name, error.retry_after or DEFAULT_RETRY_AFTER)
+
+    def _retry_delay(self, error, attempt):
+        """Espera antes da próxima rodada de tentativas, ou None se não vale tentar de novo."""
+        last_error = error.last_error
+        if attempt >= LLM_RETRY_ATTEMPTS or not getattr(last_error, "transient", False):
+            return None
+        delay = backoff_delay(attempt, last_error.retry_after)
+        print(f"🔁 Nova rodada de tentativas em {delay:.1f}s ({attempt + 1}/{LLM_RETRY_ATTEMPTS})")
+        return delay
+
+    async def _afailure(self, name, error, mode):
+        """Registra a falha de uma tentativa assíncrona (a pausa compartilhada grava no SQLite)."""
+        if isinstance(error, AdmissionError):
+            self.health[name].cancelled()
+        else:
+            await sync_to_async(self._record_failure, thread_sensitive=False)(name, error, mode)
+
+    @staticmethod
+    def _prompts(build):
+        """
+        Mensagens de cada provedor e o custo em tokens, montadas sob demanda e compartilhadas
+        entre os provedores com o mesmo orçamento.
+        """
+        built = {}
+
+        async def prompt(name):
+            budget = LIMITER.prompt_budget(name)
+            if budget not in built:
+                built[budget] = asyncio.ensure_future(build(budget))
+            # shield: cancelar uma tentativa não cancela a montagem usada pela outra
+            messages, prompt_tokens = await asyncio.shield(built[budget])
+            return messages, estimate_tokens(name, messages, prompt_tokens)
+
+        return prompt
+
+    async def _attempt(self, name, prompt):
+        try:
+            messages, cost = await prompt(name)
+            await LIMITER.aacquire(name, cost)
+            started = time.perf_counter()
+            answer = await self.backends[name]["acomplete"](messages)
+        except LLMProviderError as e:
+            await self._afailure(name, e, COMPLETE)
+            raise
+        except asyncio.CancelledError:
+            self.health[name].cancelled()
+            raise
+        self.health[name].record_success(time.perf_counter() - started, COMPLETE)
+        return answer, name
+
+    async def _rounds(self, race):
+        """Executa race() e, após falhas passageiras, novas rodadas com espera que não bloqueia o loop."""
+        for attempt in itertools.count():
+            try:
+                return await race()
+            except LLMUnavailableError as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def acomplete(self, build, preferred=None):
+        """
+        Resposta completa (markdown), com troca de provedor em caso de falha e requisição de cobertura.
+
+        Args:
+            build: async build(budget) -> (mensagens, tokens do prompt)
+
+        Returns:
+            tuple: (resposta, provedor que respondeu)
+        """
+        prompt = self._prompts(build)
+        return await self._rounds(lambda: self._race(
+            self._candidates(preferred, COMPLETE),
+            lambda name: asyncio.ensure_future(self._attempt(name, prompt)),
+            COMPLETE,
+        ))
+
+    async def _race(self, candidates, start, mode):
+        """
+        Executa as tentativas: a primeira imediatamente; a próxima quando a anterior falha ou,
+        com ROUTER_HEDGE, quando ela passa do tempo de cobertura. Fica com o primeiro resultado
+        e cancela as demais.
+        """
+        pending = {}
+        queue = list(candidates)
+        last_error = None
+        started = 0
+        try:
+            while queue or pending:
+                if queue and (not pending or ROUTER_HEDGE):
+                    name = queue.pop(0)
+                    if not self._admit(name, last_resort=not queue and not pending and not started):
+                        continue
+                    pending[start(name)] = name
+                    started += 1
+                    if len(pending) > 1:
+                        print(f"🛡️ Requisição de cobertura disparada no {name}")
+                if not pending:
+                    continue
+                timeout = self.hedge_delay(next(iter(pending.values())), mode) if queue and ROUTER_HEDGE else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        return task.result()
+                    except AdmissionError as e:
+                        print(f"⏳ {e}; tentando o próximo provedor")
+                        last_error = e
+                    except LLMProviderError as e:
+                        print(f"⚠️ {name} falhou ({e.status or 'sem resposta HTTP'}); tentando o próximo provedor")
+                        last_error = e
+        finally:
+            # Cancela as tentativas que perderam a corrida e espera o encerramento das conexões
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        raise LLMUnavailableError(last_error)
+
+    async def astream(self, build, preferred=None):
+        """
+        Trechos da resposta (markdown). A troca de provedor e a cobertura valem até o primeiro
+        trecho; depois dele, a resposta segue no provedor que o entregou.
+
+        Args:
+            build: async build(budget) -> (mensagens, tokens do prompt)
+
+        Yields:
+            tuple: (provedor, trecho)
+        """
+        prompt = self._prompts(build)
+        streams = {}
+        opened = []
+
+        async def first_chunk(name):
+            try:
+                messages, cost = await prompt(name)
+                await LIMITER.aacquire(name, cost)
+                started = time.perf_counter()
+                stream = streams[name] = self.backends[name]["astream"](messages)
+                opened.append(stream)
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                chunk = ""
+            except LLMProviderError as e:
+                await self._afailure(name, e, STREAM)
+                raise
+            except asyncio.CancelledError:
+                self.health[name].cancelled()
+                raise
+            self.health[name].record_success(time.perf_counter() - started, STREAM)
+            return chunk, name
+
+        try:
+            chunk, winner = await self._rounds(lambda: self._race(
+                self._candidates(preferred, STREAM), lambda name: asyncio.ensure_future(first_chunk(name)), STREAM
+            ))
+            if chunk:
+                yield winner, chunk
+            async for chunk in streams[winner]:
+                yield winner, chunk
+        finally:
+            for stream in opened:
+                await stream.aclose()
+
+    def stats(self):
+        return {name: health.snapshot() for name, health in self.health.items()}
+
+    def rate_limits(self):
+        """Capacidade e fila de cada provedor, compartilhadas entre os workers."""
+        return LIMITER.stats()
+
+
+def _groq_configured():
+    return bool(getattr(settings, 'GROQ_API_KEY', ''))
+
+
+def _databricks_configured():
+    return bool(getattr(settings, 'DATABRICKS_MODEL_ENDPOINT', ''))
+
+
+ROUTER = LLMRouter({
+    "groq": {
+        "acomplete": agroq_complete,
+        "astream": astream_groq,
+        "configured": _groq_configured,
+    },
+    "databricks": {
+        "acomplete": adatabricks_complete,
+        "astream": astream_databricks,
+        "configured": _databricks_configured,
+    },
+})
@@ -0,0 +1,48 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from chatbot.bm25 import BM25Index, tokenize
+
+
+class TokenizeTests(SimpleTestCase):
+    def test_numero_e_ano_viram_termos_separados(self):
+        self.assertEqual(tokenize("Lei nº 12.527/2011"), ["lei", "12.527", "12527", "2011"])
+
+    def test_forma_compacta_do_numero(self):
+        self.assertEqual(tokenize("lei 12527"), ["lei", "12527"])
+        self.assertIn("12527", tokenize("Lei 12.527"))
+
+    def test_acentos_e_stopwords(self):
+        self.assertEqual(tokenize("Painéis de preços da União"), ["paineis", "precos", "uniao"])
+
+
+class BM25IndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index.build(
+            ["lai", "licitacao"],
+            ["Conforme a Lei nº 12.527/2011, o acesso à informação é garantido.",
+             "A Lei nº 14.133/2021 trata de licitações e contratos."],
+        )
+
+    def test_numero_sem_pontuacao_encontra_a_citacao(self):
+        self.assertEqual([doc_id for doc_id, _ in self.index.search("12527")], ["lai"])
+
+    def test_numero_com_pontuacao_prioriza_a_lei_certa(self):
+        results = self.index.search("lei 12.527")
+        self.assertEqual(results[0][0], "lai")
+        self.assertGreater(results[0][1], results[1][1])
+
+    def test_indice_de_outra_tokenizacao_e_descartado(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bm25_teste.json")
+            self.index.save(path)
+            self.assertEqual(BM25Index.load(path).ids, ["lai", "licitacao"])
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            del data["tokenizer"]
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            self.assertIsNone(BM25Index.load(path))
@@ -0,0 +1,48 @@
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from chatbot.embedding_cache import KEY_BYTES, CachedEmbeddings, EmbeddingCache
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_reaproveita_vetores_entre_instancias(self):
+        model = FakeEmbeddings()
+        first = CachedEmbeddings(model, EmbeddingCache("modelo", directory=self.directory))
+        vectors = first.embed_documents(["a", "bb"])
+        second = CachedEmbeddings(model, EmbeddingCache("modelo", directory=self.directory))
+        self.assertEqual(second.embed_documents(["bb", "a"]), vectors[::-1])
+        self.assertEqual(model.calls, 2)
+
+    def test_poda_mantem_os_usados_mais_recentemente(self):
+        cache = EmbeddingCache("modelo", directory=self.directory)
+        texts = ["sem uso", "antigo", "recente"]
+        cache.put_many(texts, [[1, 0], [0, 1], [1, 1]])
+        # Linhas sem data de uso (ex.: cache gravado sem stamps.u32) ficam com 0
+        cache._stamps[:] = np.array([0, 1700000000, 1700000500], dtype=cache._stamps.dtype)
+        cache.flush()
+        row_bytes = cache.dim * 2 + KEY_BYTES + cache._stamps.itemsize
+        self.assertEqual(cache.prune(max_bytes=2 * row_bytes), 1)
+        hits = [vector is not None for vector in cache.get_many(texts)]
+        self.assertEqual(hits, [False, True, True])
+
+    def test_poda_em_dry_run_nao_altera(self):
+        cache = EmbeddingCache("modelo", directory=self.directory)
+        cache.put_many(["a", "b"], [[1, 0], [0, 1]])
+        self.assertEqual(cache.prune(max_bytes=0, dry_run=True), 2)
+        self.assertEqual(len(cache), 2)
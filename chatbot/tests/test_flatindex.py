@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from chatbot.flatindex import FlatIndex, flat_index_files, flat_index_path
+from chatbot.knowledge_base import collection_files
+
+
+class FakeCollection:
+    """Subconjunto da coleção do Chroma usado na exportação."""
+
+    def __init__(self, ids, embeddings, metadata=None):
+        self.ids = ids
+        self.embeddings = embeddings
+        self.metadata = metadata or {}
+
+    def get(self, include=None):
+        return {
+            "ids": list(self.ids),
+            "embeddings": [list(e) for e in self.embeddings],
+            "documents": [f"texto {doc_id}" for doc_id in self.ids],
+            "metadatas": [{"source": doc_id} for doc_id in self.ids],
+        }
+
+
+class FlatIndexExportTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = flat_index_path(self.tmp.name, "teste")
+
+    def test_json_aponta_para_matrizes_versionadas(self):
+        FlatIndex.export(FakeCollection(["a", "b"], [[1, 0], [0, 1]]), self.path)
+        with open(f"{self.path}.json", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        self.assertEqual(sidecar["vectors"], f"flat_teste.{sidecar['version']}.npy")
+        self.assertEqual(sidecar["scales"], f"flat_teste.{sidecar['version']}.scales.npy")
+        index = FlatIndex.load(self.path)
+        self.assertEqual(index.query([[1, 0]], n_results=1)["ids"], [["a"]])
+
+    def test_reexportar_mantem_a_versao_anterior_e_remove_as_mais_antigas(self):
+        versions = []
+        for embeddings in ([[1, 0], [0, 1]], [[0, 1], [1, 0]], [[1, 1], [1, -1]]):
+            FlatIndex.export(FakeCollection(["a", "b"], embeddings), self.path)
+            with open(f"{self.path}.json", encoding="utf-8") as f:
+                versions.append(json.load(f)["version"])
+        self.assertEqual(len(set(versions)), 3)
+        names = {os.path.basename(p) for p in flat_index_files(self.path)}
+        self.assertEqual(names, {
+            "flat_teste.json",
+            f"flat_teste.{versions[1]}.npy", f"flat_teste.{versions[1]}.scales.npy",
+            f"flat_teste.{versions[2]}.npy", f"flat_teste.{versions[2]}.scales.npy",
+        })
+        self.assertTrue(set(flat_index_files(self.path)) <= set(collection_files(self.tmp.name, "teste")))
+
+    def test_mesmo_conteudo_gera_a_mesma_versao(self):
+        collection = FakeCollection(["b", "a"], [[0, 1], [1, 0]])
+        FlatIndex.export(collection, self.path)
+        first = flat_index_files(self.path)
+        FlatIndex.export(collection, self.path)
+        self.assertEqual(flat_index_files(self.path), first)
+
+    def test_carrega_indice_sem_versao(self):
+        np.save(f"{self.path}.npy", np.array([[127, 0]], dtype=np.int8))
+        np.save(f"{self.path}.scales.npy", np.array([1 / 127], dtype=np.float32))
+        with open(f"{self.path}.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": ["a"], "documents": ["x"], "metadatas": [{}], "dtype": "int8"}, f)
+        self.assertTrue(FlatIndex.exists(self.path))
+        self.assertEqual(FlatIndex.load(self.path).get(["a"])["documents"], ["x"])
+
+    def test_json_sem_matrizes_nao_existe(self):
+        FlatIndex.export(FakeCollection(["a"], [[1, 0]]), self.path)
+        for path in flat_index_files(self.path):
+            if path.endswith(".npy"):
+                os.remove(path)
+        self.assertFalse(FlatIndex.exists(self.path))
@@ -0,0 +1,148 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chatbot import ingestion
+from chatbot.ingestion import chunking_params, diff_manifest, hash_documents_folder, load_manifest, update_collection
+
+
+def entry(sha256, chunk_ids, duplicates_of=None):
+    data = {"sha256": sha256, "chunk_ids": chunk_ids}
+    if duplicates_of:
+        data["duplicates_of"] = duplicates_of
+    return data
+
+
+class DiffManifestTests(SimpleTestCase):
+    def test_adicionados_alterados_e_removidos(self):
+        previous = {"a.txt": entry("1", ["a1"]), "b.txt": entry("2", ["b1", "b2"]), "c.txt": entry("3", ["c1"])}
+        added, changed, removed, stale = diff_manifest(previous, {"a.txt": "1", "b.txt": "novo", "d.txt": "4"})
+        self.assertEqual((added, changed, removed), (["d.txt"], ["b.txt"], ["c.txt"]))
+        self.assertEqual(stale, {"b1", "b2", "c1"})
+
+    def test_dependentes_de_duplicados_em_cadeia(self):
+        # c repete um trecho de b, que repete um trecho de a: alterar a reprocessa os três
+        previous = {
+            "a.txt": entry("1", ["a1"]),
+            "b.txt": entry("2", ["b1"], duplicates_of=["a1"]),
+            "c.txt": entry("3", ["c1"], duplicates_of=["b1"]),
+            "d.txt": entry("4", ["d1"]),
+        }
+        added, changed, removed, stale = diff_manifest(
+            previous, {"a.txt": "novo", "b.txt": "2", "c.txt": "3", "d.txt": "4"}
+        )
+        self.assertEqual(changed, ["a.txt", "b.txt", "c.txt"])
+        self.assertEqual(stale, {"a1", "b1", "c1"})
+        self.assertEqual((added, removed), ([], []))
+
+    def test_sem_alteracoes(self):
+        previous = {"a.txt": entry("1", ["a1"])}
+        self.assertEqual(diff_manifest(previous, {"a.txt": "1"}), ([], [], [], set()))
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class FakeCollection:
+    """Subconjunto da API de coleção do Chroma usado pela ingestão; registra upserts e deletes."""
+
+    def __init__(self):
+        self.rows = {}
+        self.metadata = {}
+        self.events = []
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for chunk_id, embedding, document, metadata in zip(ids, embeddings, documents, metadatas):
+            self.rows[chunk_id] = (embedding, document, dict(metadata))
+        self.events.append(("upsert", set(ids), set(self.rows)))
+
+    def delete(self, ids):
+        self.events.append(("delete", set(ids), set(self.rows)))
+        for chunk_id in ids:
+            self.rows.pop(chunk_id, None)
+
+    def get(self, ids=None, where=None, include=None):
+        selected = [i for i in sorted(self.rows) if ids is None or i in ids]
+        if where is not None:
+            selected = [i for i in selected if self.rows[i][2].get("duplicate_count", 0) > 0]
+        return {
+            "ids": selected,
+            "embeddings": [self.rows[i][0] for i in selected],
+            "documents": [self.rows[i][1] for i in selected],
+            "metadatas": [self.rows[i][2] for i in selected],
+        }
+
+    def update(self, ids, metadatas):
+        for chunk_id, metadata in zip(ids, metadatas):
+            embedding, document, _ = self.rows[chunk_id]
+            self.rows[chunk_id] = (embedding, document, metadata)
+
+    def modify(self, metadata):
+        self.metadata = metadata
+
+    def count(self):
+        return len(self.rows)
+
+
+class UpdateCollectionTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.docs = os.path.join(tmp.name, "Docs")
+        self.persist = os.path.join(tmp.name, "chroma")
+        os.makedirs(self.docs)
+        self.collection = FakeCollection()
+        vectorstore = SimpleNamespace(_collection=self.collection)
+        for target, value in (("make_embeddings", lambda model: FakeEmbeddings()),
+                              ("open_collection", lambda *args: vectorstore)):
+            patcher = mock.patch.object(ingestion, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.params = chunking_params()
+
+    def write(self, filename, text):
+        with open(os.path.join(self.docs, filename), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def update(self):
+        manifest = load_manifest(self.persist, "teste") or {"files": {}}
+        return update_collection(self.docs, self.persist, "teste", manifest,
+                                 hash_documents_folder(self.docs), self.params)
+
+    def test_atualizacao_incremental_grava_antes_de_remover(self):
+        self.write("lai.txt", "A Lei de Acesso à Informação garante o acesso a dados públicos.")
+        self.write("compras.txt", "O portal de compras governamentais publica as licitações.")
+        self.write("antigo.txt", "Decreto revogado sobre sistemas de governo.")
+        _, summary = self.update()
+        self.assertEqual(summary["added"], ["antigo.txt", "compras.txt", "lai.txt"])
+        before = load_manifest(self.persist, "teste")["files"]
+
+        self.collection.events.clear()
+        self.write("compras.txt", "O portal de compras governamentais publica editais e contratos.")
+        os.remove(os.path.join(self.docs, "antigo.txt"))
+        _, summary = self.update()
+        self.assertEqual(summary, {"added": [], "changed": ["compras.txt"], "removed": ["antigo.txt"]})
+
+        after = load_manifest(self.persist, "teste")["files"]
+        self.assertEqual(sorted(after), ["compras.txt", "lai.txt"])
+        self.assertEqual(after["lai.txt"], before["lai.txt"])
+        self.assertNotEqual(after["compras.txt"]["chunk_ids"], before["compras.txt"]["chunk_ids"])
+        self.assertEqual(set(self.collection.rows),
+                         {chunk_id for f in after.values() for chunk_id in f["chunk_ids"]})
+
+        # Os chunks novos já estavam na coleção quando os desatualizados foram removidos
+        kinds = [event[0] for event in self.collection.events]
+        self.assertEqual(kinds, ["upsert", "delete"])
+        _, deleted, present = self.collection.events[1]
+        self.assertEqual(deleted, set(before["antigo.txt"]["chunk_ids"] + before["compras.txt"]["chunk_ids"]))
+        self.assertTrue(set(after["compras.txt"]["chunk_ids"]) <= present)
+
+    def test_nada_mudou(self):
+        self.write("lai.txt", "A Lei de Acesso à Informação.")
+        self.update()
+        self.assertEqual(self.update()[0], None)
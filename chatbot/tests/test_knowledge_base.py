@@ -0,0 +1,46 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from chatbot.knowledge_base import publish_active_collection, retire_collections
+
+
+class FakeClient:
+    def __init__(self, names):
+        self.names = list(names)
+
+    def list_collections(self):
+        return [SimpleNamespace(name=name) for name in self.names]
+
+    def delete_collection(self, name):
+        self.names.remove(name)
+
+
+class RetireCollectionsTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.persist = tmp.name
+        self.client = FakeClient(["kb_100", "kb_200", "kb_300", "kb_400"])
+        publish_active_collection(self.persist, "kb_300")
+
+    def checkpoint(self, name):
+        with open(os.path.join(self.persist, f"checkpoint_{name}.json"), "w", encoding="utf-8") as f:
+            f.write("{}")
+
+    def test_mantem_a_ativa_e_a_anterior_mais_recente(self):
+        self.assertEqual(retire_collections(self.client, self.persist, keep_previous=1), ["kb_200", "kb_100"])
+        self.assertEqual(self.client.names, ["kb_300", "kb_400"])
+
+    def test_colecao_com_checkpoint_nao_ocupa_a_vaga_de_rollback(self):
+        # kb_400 é uma criação interrompida: a anterior de verdade (kb_200) continua para rollback
+        self.checkpoint("kb_400")
+        self.assertEqual(retire_collections(self.client, self.persist, keep_previous=1), ["kb_100"])
+        self.assertEqual(self.client.names, ["kb_200", "kb_300", "kb_400"])
+
+    def test_dry_run_nao_remove(self):
+        self.checkpoint("kb_100")
+        self.assertEqual(retire_collections(self.client, self.persist, keep_previous=0, dry_run=True), ["kb_400", "kb_200"])
+        self.assertEqual(len(self.client.names), 4)
@@ -0,0 +1,121 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chatbot import rate_limit, router
+from chatbot.llm import LLMProviderError
+from chatbot.providers import MAX_COMPLETION_TOKENS
+from chatbot.rate_limit import AdmissionError, RateLimiter, estimate_tokens
+from chatbot.router import COMPLETE, LLMRouter
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "limits.sqlite3")
+        self.limiter = RateLimiter(self.path, {"groq": (1, 12000), "livre": (0, 0)})
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(rate_limit, "time", SimpleNamespace(time=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def acquire(self, ticket=None, cost=100):
+        return self.limiter._try_acquire("groq", cost, ticket, self.now + 600)
+
+    def test_fila_por_ordem_de_chegada(self):
+        self.assertEqual(self.acquire(), (0.0, None))
+        wait, first = self.acquire()
+        self.assertGreater(wait, 0)
+        wait, second = self.acquire()
+        self.assertGreater(wait, 0)
+        self.now += 60
+        # Há capacidade, mas só o primeiro da fila pode consumi-la
+        wait, ticket = self.acquire(second)
+        self.assertGreater(wait, 0)
+        self.assertEqual(ticket, second)
+        self.assertEqual(self.acquire(first), (0.0, first))
+        self.now += 60
+        self.assertEqual(self.acquire(second)[0], 0.0)
+        self.assertEqual(self.limiter.stats()["groq"]["queued"], 0)
+
+    def test_quem_chega_nao_fura_a_fila(self):
+        self.acquire()
+        _, waiting = self.acquire()
+        self.now += 60
+        wait, newcomer = self.acquire()
+        self.assertGreater(wait, 0)
+        self.assertGreater(newcomer, waiting)
+
+    def test_fila_cheia(self):
+        self.acquire()
+        with mock.patch.object(rate_limit, "LLM_ADMISSION_MAX_QUEUE", 1):
+            self.acquire()
+            with self.assertRaises(AdmissionError):
+                self.acquire()
+
+    async def test_requisicao_acima_do_limite_de_tokens_e_recusada(self):
+        with self.assertRaises(AdmissionError) as raised:
+            await self.limiter.aacquire("groq", 12001)
+        self.assertFalse(raised.exception.transient)
+        self.assertEqual(self.limiter.stats()["groq"]["tokens_available"], 12000)
+
+    async def test_prazo_esgotado_sai_da_fila(self):
+        await self.limiter.aacquire("groq", 100)
+        with self.assertRaises(AdmissionError):
+            await self.limiter.aacquire("groq", 100, timeout=1)
+        self.assertEqual(self.limiter.stats()["groq"]["queued"], 0)
+
+    async def test_provedor_sem_limite(self):
+        self.assertEqual(await self.limiter.aacquire("livre", 10 ** 6), 0.0)
+
+    def test_pausa_apos_429(self):
+        self.limiter.block("groq", 5)
+        self.assertEqual(self.limiter.stats()["groq"]["blocked_for"], 5.0)
+        wait, ticket = self.acquire()
+        self.assertGreaterEqual(wait, 5.0)
+        self.now += 5
+        self.assertEqual(self.acquire(ticket)[0], 0.0)
+
+    def test_429_do_provedor_pausa_todos_os_workers(self):
+        llm_router = LLMRouter({"groq": {"configured": lambda: True}})
+        with mock.patch.object(router, "LIMITER", self.limiter):
+            llm_router._record_failure("groq", LLMProviderError("groq", "limite", status=429, retry_after=3), COMPLETE)
+            self.assertEqual(self.limiter.stats()["groq"]["blocked_for"], 3.0)
+            self.now += 3
+            # Recusa do próprio controle de admissão não é um 429 do provedor
+            llm_router._record_failure("groq", AdmissionError("groq", "fila cheia"), COMPLETE)
+        self.assertEqual(self.limiter.stats()["groq"]["blocked_for"], 0.0)
+
+    def test_recria_o_esquema_se_o_banco_for_apagado(self):
+        self.acquire()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+        self.assertEqual(self.acquire(), (0.0, None))
+        self.assertEqual(self.limiter.stats()["groq"]["requests_available"], 0.0)
+
+    def test_recria_o_esquema_se_as_tabelas_sumirem(self):
+        self.acquire()
+        with self.limiter._connect() as conn:
+            conn.execute("DROP TABLE waiters")
+        self.now += 60
+        self.assertEqual(self.acquire(), (0.0, None))
+
+
+class TokenBudgetTests(SimpleTestCase):
+    def test_reserva_o_max_tokens_do_provedor(self):
+        messages = [{"role": "user", "content": "x" * 400}]
+        self.assertEqual(estimate_tokens("groq", messages, 1000), 1000 + MAX_COMPLETION_TOKENS["groq"])
+        self.assertEqual(estimate_tokens("databricks", messages), 100 + MAX_COMPLETION_TOKENS["databricks"])
+
+    def test_orcamento_do_prompt_cabe_no_limite_do_provedor(self):
+        limiter = RateLimiter(":memory:", {"groq": (30, 12000), "databricks": (0, 0)})
+        with mock.patch.object(rate_limit, "LLM_PROMPT_TOKEN_BUDGET", 24000):
+            self.assertEqual(limiter.prompt_budget("groq"), 12000 - MAX_COMPLETION_TOKENS["groq"])
+            self.assertEqual(limiter.prompt_budget("databricks"), 24000)
+        with mock.patch.object(rate_limit, "LLM_PROMPT_TOKEN_BUDGET", 4000):
+            self.assertEqual(limiter.prompt_budget("groq"), 4000)
@@ -0,0 +1,177 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chatbot import router
+from chatbot.llm import LLMProviderError
+from chatbot.router import CLOSED, COMPLETE, HALF_OPEN, OPEN, STREAM, LLMRouter, LLMUnavailableError, ProviderHealth
+
+MESSAGES = [{"role": "user", "content": "Pergunta"}]
+
+
+async def build(budget):
+    return MESSAGES, 10
+
+
+def overload(provider="a"):
+    return LLMProviderError(provider, "sobrecarregado", status=503)
+
+
+class FakeProvider:
+    """Provedor assíncrono de teste: espera `delay`, falha com `error` ou responde; registra cancelamentos."""
+
+    def __init__(self, name, delay=0.0, error=None, chunks=("resposta",), fail_after=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = 0
+        self.cancelled = 0
+
+    async def acomplete(self, messages):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return "".join(self.chunks)
+
+    async def astream(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        for i, chunk in enumerate(self.chunks):
+            if self.fail_after is not None and i == self.fail_after:
+                raise overload(self.name)
+            yield chunk
+
+    def backend(self):
+        return {"acomplete": self.acomplete, "astream": self.astream, "configured": lambda: True}
+
+
+def make_router(*providers):
+    return LLMRouter({provider.name: provider.backend() for provider in providers})
+
+
+class ProviderHealthTests(SimpleTestCase):
+    def setUp(self):
+        for name, value in (("ROUTER_BREAKER_ERRORS", 3), ("ROUTER_BREAKER_WINDOW", 30),
+                            ("ROUTER_BREAKER_COOLDOWN", 30)):
+            patcher = mock.patch.object(router, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.health = ProviderHealth("a")
+
+    def test_disjuntor_abre_apos_falhas_passageiras(self):
+        for _ in range(2):
+            self.health.record_failure(overload(), COMPLETE)
+        self.assertEqual(self.health.state, CLOSED)
+        self.health.record_failure(overload(), STREAM)
+        self.assertEqual(self.health.state, OPEN)
+        self.assertFalse(self.health.allow())
+        self.assertFalse(self.health.available())
+
+    def test_meio_aberto_deixa_passar_uma_requisicao_de_teste(self):
+        for _ in range(3):
+            self.health.record_failure(overload(), COMPLETE)
+        self.health.opened_at -= 31
+        self.assertTrue(self.health.available())
+        self.assertTrue(self.health.allow())
+        self.assertEqual(self.health.state, HALF_OPEN)
+        self.assertFalse(self.health.allow())
+        self.health.record_success(0.5, COMPLETE)
+        self.assertEqual(self.health.state, CLOSED)
+        self.assertTrue(self.health.allow())
+
+    def test_falha_no_teste_reabre_o_circuito(self):
+        for _ in range(3):
+            self.health.record_failure(overload(), COMPLETE)
+        self.health.opened_at -= 31
+        self.assertTrue(self.health.allow())
+        self.health.record_failure(overload(), COMPLETE)
+        self.assertEqual(self.health.state, OPEN)
+        self.assertFalse(self.health.allow())
+
+    def test_falha_nao_passageira_nao_abre_o_circuito(self):
+        for _ in range(5):
+            self.health.record_failure(LLMProviderError("a", "chave inválida", status=401), COMPLETE)
+        self.assertEqual(self.health.state, CLOSED)
+        self.assertEqual(self.health.error_rate(), 1.0)
+
+    def test_teste_cancelado_libera_a_vaga(self):
+        for _ in range(3):
+            self.health.record_failure(overload(), COMPLETE)
+        self.health.opened_at -= 31
+        self.assertTrue(self.health.allow())
+        self.health.cancelled()
+        self.assertTrue(self.health.allow())
+
+
+class LLMRouterTests(SimpleTestCase):
+    def setUp(self):
+        for name, value in (("ROUTER_HEDGE", True), ("ROUTER_HEDGE_MIN_DELAY", 0.01),
+                            ("ROUTER_HEDGE_DEFAULT_DELAY", 0.05), ("LLM_RETRY_ATTEMPTS", 0)):
+            patcher = mock.patch.object(router, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_troca_de_provedor_apos_falha(self):
+        a, b = FakeProvider("a", error=overload()), FakeProvider("b", chunks=("de b",))
+        answer = await make_router(a, b).acomplete(build, preferred="a")
+        self.assertEqual(answer, ("de b", "b"))
+        self.assertEqual((a.calls, b.calls), (1, 1))
+
+    async def test_cobertura_dispara_apos_o_atraso_e_cancela_o_perdedor(self):
+        a, b = FakeProvider("a", delay=5.0, chunks=("de a",)), FakeProvider("b", chunks=("de b",))
+        llm_router = make_router(a, b)
+        answer = await asyncio.wait_for(llm_router.acomplete(build, preferred="a"), timeout=2)
+        self.assertEqual(answer, ("de b", "b"))
+        self.assertEqual(a.cancelled, 1)
+        # O perdedor cancelado não conta como falha nem prende a vaga de teste do disjuntor
+        self.assertEqual(llm_router.health["a"].error_rate(), 0.0)
+        self.assertEqual(llm_router.health["b"].latencies(COMPLETE), [mock.ANY])
+
+    async def test_sem_cobertura_espera_o_preferido(self):
+        a, b = FakeProvider("a", delay=0.1, chunks=("de a",)), FakeProvider("b")
+        with mock.patch.object(router, "ROUTER_HEDGE", False):
+            answer = await make_router(a, b).acomplete(build, preferred="a")
+        self.assertEqual(answer, ("de a", "a"))
+        self.assertEqual(b.calls, 0)
+
+    async def test_todos_falham(self):
+        a, b = FakeProvider("a", error=overload("a")), FakeProvider("b", error=overload("b"))
+        with self.assertRaises(LLMUnavailableError) as raised:
+            await make_router(a, b).acomplete(build, preferred="a")
+        self.assertEqual(raised.exception.status, 503)
+
+    async def test_circuito_aberto_passa_ao_proximo(self):
+        a, b = FakeProvider("a", chunks=("de a",)), FakeProvider("b", chunks=("de b",))
+        llm_router = make_router(a, b)
+        for _ in range(router.ROUTER_BREAKER_ERRORS):
+            llm_router.health["a"].record_failure(overload(), COMPLETE)
+        answer = await llm_router.acomplete(build, preferred="a")
+        self.assertEqual(answer, ("de b", "b"))
+        self.assertEqual(a.calls, 0)
+
+    async def collect(self, llm_router):
+        return [item async for item in llm_router.astream(build, preferred="a")]
+
+    async def test_stream_troca_de_provedor_antes_do_primeiro_trecho(self):
+        a, b = FakeProvider("a", error=overload()), FakeProvider("b", chunks=("um ", "dois"))
+        self.assertEqual(await self.collect(make_router(a, b)), [("b", "um "), ("b", "dois")])
+
+    async def test_stream_nao_troca_de_provedor_depois_do_primeiro_trecho(self):
+        a = FakeProvider("a", chunks=("um ", "dois"), fail_after=1)
+        b = FakeProvider("b", chunks=("outro",))
+        received = []
+        with self.assertRaises(LLMProviderError):
+            async for item in make_router(a, b).astream(build, preferred="a"):
+                received.append(item)
+        self.assertEqual(received, [("a", "um ")])
+        self.assertEqual(b.calls, 0)
@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from chatbot.textmatch import DOMAIN_MATCHER, KeywordMatcher, fold_text, popcount
+
+
+class FoldTextTests(SimpleTestCase):
+    def test_remove_acentos_e_maiusculas(self):
+        self.assertEqual(fold_text("Painéis de Preços"), "paineis de precos")
+
+    def test_reduz_espacos_e_quebras_de_linha(self):
+        self.assertEqual(fold_text("compras \n\t governamentais"), "compras governamentais")
+
+    def test_texto_vazio(self):
+        self.assertEqual(fold_text(None), "")
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def test_palavra_composta_com_espacos_irregulares(self):
+        matcher = KeywordMatcher(["compras governamentais"])
+        self.assertEqual(matcher.matches("compras  governamentais"), ["compras governamentais"])
+        self.assertEqual(matcher.matches("Compras\ngovernamentais"), ["compras governamentais"])
+
+    def test_palavra_curta_exige_palavra_inteira(self):
+        matcher = KeywordMatcher(["lei", "LAI", "licitação"])
+        self.assertEqual(matcher.matches("Leitura da lei"), ["lei"])
+        self.assertEqual(matcher.matches("leitura e laico"), [])
+        self.assertEqual(matcher.matches("A LAI, art. 5"), ["LAI"])
+
+    def test_palavra_longa_casa_dentro_de_outra(self):
+        matcher = KeywordMatcher(["compras"])
+        self.assertEqual(matcher.matches("Portal Comprasnet"), ["compras"])
+
+    def test_mascara_por_posicao(self):
+        matcher = KeywordMatcher(["portal", "decreto", "sistema"])
+        self.assertEqual(matcher.flags("Decreto do sistema"), 0b110)
+        self.assertIn("portal", matcher)
+        self.assertNotIn("nada aqui", matcher)
+
+    def test_assinatura_depende_das_palavras_chave(self):
+        self.assertEqual(KeywordMatcher(["lei"]).signature, KeywordMatcher(["Lei"]).signature)
+        self.assertNotEqual(KeywordMatcher(["lei"]).signature, KeywordMatcher(["decreto"]).signature)
+        self.assertEqual(len(DOMAIN_MATCHER.signature), 12)
+
+
+class PopcountTests(SimpleTestCase):
+    def test_conta_bits_de_cada_mascara(self):
+        self.assertEqual(popcount([0, 1, 0b1011, 2 ** 63 + 1]).tolist(), [0, 1, 3, 2])
+
+    def test_mascara_unica(self):
+        self.assertEqual(popcount(0b111).tolist(), [3])
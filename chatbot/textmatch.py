@@ -0,0 +1,129 @@
+# Casamento de palavras-chave com normalização de acentos (Aho-Corasick)
+import hashlib
+import re
+import unicodedata
+from collections import deque
+
+import numpy as np
+
+# Palavras-chave do domínio (pode ser expandido/configurado).
+# A ordem define os bits de kw_flags gravados nos metadados dos chunks.
+DOMAIN_KEYWORDS = [
+    "transparência", "dados abertos", "licitação", "compras", "governo", "LAI", "normativo", "portal", "sistema", "acesso", "informação", "lei", "decreto"
+]
+# Palavras-chave curtas só casam com palavras inteiras ("lei" não casa com "leitura")
+WHOLE_WORD_MAX_LENGTH = 4
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fold_text(text):
+    """
+    Remove acentos, converte para minúsculas e reduz sequências de espaços e quebras
+    de linha (comuns no texto extraído de PDF/DOCX) a um espaço ("Painéis  de" -> "paineis de").
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _WHITESPACE.sub(" ", text)
+
+
+class KeywordMatcher:
+    """
+    Autômato Aho-Corasick sobre texto normalizado: encontra todas as palavras-chave
+    em uma única passada pelo texto, independentemente de quantas forem.
+
+    Args:
+        keywords (list): Palavras-chave; a posição i corresponde ao bit i da máscara
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        # Identifica a lista de palavras-chave e a regra de casamento (para validar máscaras gravadas na ingestão)
+        self.signature = hashlib.sha1(
+            ("\x00".join(fold_text(k) for k in self.keywords) + f"\x00wb{WHOLE_WORD_MAX_LENGTH}\x00ws").encode("utf-8")
+        ).hexdigest()[:12]
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [0]
+        self._lengths = {}
+        # Bits das palavras-chave que exigem limites de palavra
+        self._whole_word = 0
+        for i, keyword in enumerate(self.keywords):
+            folded = fold_text(keyword).strip()
+            if not folded:
+                continue
+            self._lengths[i] = len(folded)
+            if len(folded) <= WHOLE_WORD_MAX_LENGTH:
+                self._whole_word |= 1 << i
+            node = 0
+            for ch in folded:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(0)
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._out[node] |= 1 << i
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def flags(self, text, folded=False):
+        """Máscara de bits com as palavras-chave presentes no texto."""
+        goto, fail, out = self._goto, self._fail, self._out
+        text = text if folded else fold_text(text)
+        node = 0
+        mask = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            found = out[node]
+            if found & self._whole_word:
+                found = self._drop_partial_words(found, text, pos)
+            mask |= found
+        return mask
+
+    def _drop_partial_words(self, found, text, end):
+        """Remove da máscara as palavras-chave curtas que terminam em `end` dentro de outra palavra."""
+        after = end + 1 < len(text) and text[end + 1].isalnum()
+        for i, length in self._lengths.items():
+            bit = 1 << i
+            if found & bit & self._whole_word:
+                start = end - length + 1
+                if after or (start > 0 and text[start - 1].isalnum()):
+                    found &= ~bit
+        return found
+
+    def matches(self, text):
+        """Lista das palavras-chave presentes no texto."""
+        mask = self.flags(text)
+        return [keyword for i, keyword in enumerate(self.keywords) if mask >> i & 1]
+
+    def __contains__(self, text):
+        return self.flags(text) != 0
+
+
+def popcount(masks):
+    """Número de bits ligados em cada máscara (vetorizado)."""
+    masks = np.asarray(masks, dtype=np.uint64).reshape(-1)
+    return np.unpackbits(masks.view(np.uint8).reshape(len(masks), 8), axis=1).sum(axis=1)
+
+
+DOMAIN_MATCHER = KeywordMatcher(DOMAIN_KEYWORDS)
+
+
+def keyword_metadata(text):
+    """Metadados de palavras-chave pré-calculados na ingestão para cada chunk."""
+    return {"kw_flags": DOMAIN_MATCHER.flags(text), "kw_sig": DOMAIN_MATCHER.signature}
@@ -8,6 +8,7 @@ urlpatterns = [
     path('chatbot/', views.chatbot_new, name='chatbot_new'),
     path('sobre/', views.sobre, name='sobre'),
     path('conversation/<int:conversation_id>/', views.chatbot, name='chatbot_conversation'),
+    path('api/chat/stream/', views.chatbot_stream, name='chatbot_stream'),
     
     # APIs da barra lateral
     path('api/conversations/', views.get_conversations_sidebar, name='get_conversations_sidebar'),
@@ -22,6 +23,9 @@ urlpatterns = [
     path('api/response/regenerate/', views.regenerate_response, name='regenerate_response'),
     path('api/response/copy/', views.copy_response, name='copy_response'),
     
+    # Diagnóstico dos clientes de LLM e caches (equipe)
+    path('api/llm/stats/', views.llm_stats, name='llm_stats'),
+    
     # URLs existentes (compatibilidade)
     path('clear-history/', views.clear_history, name='clear_history'),
 ]
@@ -1,119 +1,609 @@
 # Busca semântica otimizada para RAG
 from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
 import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from django.conf import settings
+
+from chatbot.bm25 import BM25Index, bm25_index_path, reciprocal_rank_fusion
+from chatbot.cache import TTLCache
+from chatbot.flatindex import FLAT_INDEX_DTYPE, FlatIndex, flat_index_path
+from chatbot.knowledge_base import (
+    CHROMA_COLLECTION, KB_HEARTBEAT_INTERVAL, WARMUP_QUERIES, collections_in_use, read_active_collection, retire_collections,
+    write_heartbeat,
+)
+from chatbot.textmatch import DOMAIN_MATCHER, KeywordMatcher, fold_text, popcount
 
 EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-# Atualizado para usar a coleção mais recente com todos os documentos
-CHROMA_COLLECTION = "chatcotin_knowledge_1748485543"
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "chroma_db")
+# Intervalo (s) entre verificações do ponteiro da coleção ativa
+KB_ALIAS_CHECK_INTERVAL = float(os.getenv("KB_ALIAS_CHECK_INTERVAL", "30"))
+# Após a troca, remove coleções que nenhum worker usa mais (mantendo a anterior para rollback)
+KB_RETIRE_AFTER_SWAP = os.getenv("KB_RETIRE_AFTER_SWAP", "true").lower() == "true"
+# Backend de busca vetorial: "chroma" ou "flat" (matriz NumPy quantizada exportada da coleção)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma")
+
+# Cache de dois níveis para perguntas repetidas: embedding da pergunta e IDs dos chunks recuperados
+QUERY_EMBEDDING_CACHE = TTLCache(
+    maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400")),
+)
+RETRIEVAL_CACHE = TTLCache(
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "3600")),
+)
+
+
+# Registro por processo: um modelo de embeddings e um cliente Chroma por coleção.
+# Carregar o modelo ONNX a cada requisição dominava a latência e o RSS dos workers.
+_registry_lock = threading.RLock()
+_embeddings = None
+_vectorstores = {}
+_indexes = {}
+_collection_versions = {}
+_bm25_indexes = {}
+_pinned_chunks = {}
+_intent_matcher = None
+_active_collection = None
+_warming_collection = None
+_alias_checked_at = 0.0
+# Processo que iniciou a thread de heartbeat (threads não sobrevivem ao fork dos workers)
+_heartbeat_pid = None
+# Busca vetorial e lexical rodam em paralelo; o Chroma libera o GIL durante a consulta
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-search")
+
+
+def get_embeddings():
+    """Retorna o modelo de embeddings compartilhado, carregando-o na primeira chamada."""
+    global _embeddings
+    if _embeddings is None:
+        with _registry_lock:
+            if _embeddings is None:
+                _embeddings = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
+    return _embeddings
+
+
+def get_active_collection():
+    """
+    Coleção servida por este worker: a do ponteiro ACTIVE_COLLECTION.json ou CHROMA_COLLECTION.
+    Quando o ponteiro muda, a nova coleção é aquecida em segundo plano e só então assume.
+    """
+    global _active_collection, _alias_checked_at
+    if _heartbeat_pid != os.getpid():
+        _start_heartbeat()
+    if _active_collection is None:
+        with _registry_lock:
+            if _active_collection is None:
+                alias = read_active_collection(CHROMA_PERSIST_DIR) or {}
+                _active_collection = alias.get("collection") or CHROMA_COLLECTION
+                _alias_checked_at = time.monotonic()
+                _write_heartbeat()
+        return _active_collection
+    if time.monotonic() - _alias_checked_at >= KB_ALIAS_CHECK_INTERVAL:
+        _alias_checked_at = time.monotonic()
+        _check_alias()
+    return _active_collection
+
+
+def _start_heartbeat():
+    """
+    Renova o heartbeat deste worker periodicamente em segundo plano. Sem isso, um worker
+    ocioso (sem requisições) pareceria encerrado e a coleção que ele serve poderia ser removida.
+    """
+    global _heartbeat_pid
+    with _registry_lock:
+        if _heartbeat_pid == os.getpid():
+            return
+        _heartbeat_pid = os.getpid()
+    threading.Thread(target=_heartbeat_loop, name="kb-heartbeat", daemon=True).start()
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(KB_HEARTBEAT_INTERVAL)
+        if _active_collection is not None:
+            _write_heartbeat()
+
+
+def _write_heartbeat():
+    try:
+        write_heartbeat(CHROMA_PERSIST_DIR, _active_collection)
+    except OSError as e:
+        print(f"⚠️ Não foi possível registrar o heartbeat do worker: {e}")
+
+
+def _check_alias():
+    global _warming_collection
+    _write_heartbeat()
+    alias = read_active_collection(CHROMA_PERSIST_DIR) or {}
+    target = alias.get("collection")
+    if not target:
+        return
+    if target == _active_collection:
+        # Mesma coleção atualizada de forma incremental: só recarrega se a versão mudou
+        version = alias.get("kb_version")
+        loaded = _collection_versions.get(target)
+        if not version or loaded is None or str(version) == loaded:
+            return
+    with _registry_lock:
+        if _warming_collection is not None:
+            return
+        _warming_collection = target
+    threading.Thread(target=_warm_and_swap, args=(target,), name="kb-warmup", daemon=True).start()
+
+
+def _warm_and_swap(collection_name):
+    """Carrega e aquece a nova coleção (índices, chunks fixados, caches) e troca a coleção ativa."""
+    global _active_collection, _warming_collection
+    try:
+        started = time.monotonic()
+        if collection_name == _active_collection:
+            print(f"🔄 Recarregando {collection_name} após atualização incremental...")
+            _refresh_collection(collection_name)
+        else:
+            print(f"🔄 Aquecendo nova coleção {collection_name}...")
+            get_index(collection_name=collection_name)
+            get_bm25_index(collection_name=collection_name)
+        for intent in getattr(settings, "RAG_PINNED_CHUNKS", {}):
+            get_pinned_chunk_ids(intent, collection_name=collection_name)
+        for query in WARMUP_QUERIES:
+            retrieve_documents(query, collection_name=collection_name)
+        with _registry_lock:
+            previous = _active_collection
+            _active_collection = collection_name
+        _write_heartbeat()
+        print(f"✅ Coleção ativa: {collection_name} (aquecida em {time.monotonic() - started:.1f}s)")
+        if previous != collection_name:
+            _forget_collection(previous)
+            if KB_RETIRE_AFTER_SWAP:
+                _retire_old_collections()
+    except Exception as e:
+        print(f"❌ Falha ao aquecer {collection_name}; mantendo {_active_collection}: {e}")
+    finally:
+        _warming_collection = None
 
 
-def get_vectorstore(collection_name=CHROMA_COLLECTION, persist_directory=CHROMA_PERSIST_DIR):
-    """Carrega o vectorstore ChromaDB já indexado."""
-    embeddings = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
-    return Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=persist_directory
+def _refresh_collection(collection_name, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Recarrega uma coleção atualizada no lugar (mesmo nome, nova kb_version). Os novos
+    índices são montados fora do registro e trocados de uma vez; os IDs dos chunks são
+    derivados do conteúdo, então o cache de embeddings de consultas continua válido.
+    """
+    vectorstore = None
+    if VECTOR_INDEX_BACKEND == "flat":
+        index = FlatIndex.load(flat_index_path(persist_directory, collection_name))
+    else:
+        vectorstore = Chroma(
+            collection_name=collection_name,
+            embedding_function=get_embeddings(),
+            persist_directory=persist_directory
+        )
+        index = vectorstore._collection
+    version = _read_collection_version(index)
+    path = bm25_index_path(persist_directory, collection_name)
+    bm25_index = BM25Index.load(path) if os.path.exists(path) else None
+    if bm25_index is None or bm25_index.version != version:
+        data = index.get(include=["documents"])
+        bm25_index = BM25Index.build(data["ids"], data["documents"], version=version)
+    with _registry_lock:
+        if vectorstore is not None:
+            _vectorstores[(collection_name, os.path.abspath(persist_directory))] = vectorstore
+        _indexes[collection_name] = index
+        _collection_versions[collection_name] = version
+        _bm25_indexes[collection_name] = bm25_index
+        _pinned_chunks.pop(collection_name, None)
+
+
+def _retire_old_collections():
+    """Remove coleções antigas somente depois que todos os workers vivos trocaram de coleção."""
+    if collections_in_use(CHROMA_PERSIST_DIR) - {_active_collection}:
+        return
+    import chromadb
+    retired = retire_collections(chromadb.PersistentClient(path=CHROMA_PERSIST_DIR), CHROMA_PERSIST_DIR)
+    if retired:
+        print(f"🗑️ Coleções aposentadas: {', '.join(retired)}")
+
+
+def get_vectorstore(collection_name=None, persist_directory=CHROMA_PERSIST_DIR):
+    """Retorna o vectorstore ChromaDB já indexado, compartilhado entre as requisições do processo."""
+    collection_name = collection_name or get_active_collection()
+    key = (collection_name, os.path.abspath(persist_directory))
+    vectorstore = _vectorstores.get(key)
+    if vectorstore is None:
+        with _registry_lock:
+            vectorstore = _vectorstores.get(key)
+            if vectorstore is None:
+                vectorstore = Chroma(
+                    collection_name=collection_name,
+                    embedding_function=get_embeddings(),
+                    persist_directory=persist_directory
+                )
+                _vectorstores[key] = vectorstore
+    return vectorstore
+
+
+def _load_flat_index(collection_name, persist_directory):
+    """Carrega o índice plano da coleção, exportando-o do Chroma se ainda não existir."""
+    path = flat_index_path(persist_directory, collection_name)
+    if not FlatIndex.exists(path):
+        print(f"🔧 Exportando {collection_name} para o índice plano ({FLAT_INDEX_DTYPE})")
+        vectorstore = get_vectorstore(collection_name=collection_name, persist_directory=persist_directory)
+        FlatIndex.export(vectorstore._collection, path, dtype=FLAT_INDEX_DTYPE)
+        # O cliente Chroma só foi necessário para a exportação
+        _vectorstores.pop((collection_name, os.path.abspath(persist_directory)), None)
+    return FlatIndex.load(path)
+
+
+def get_index(collection_name=None, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Coleção consultada pelo pipeline RAG, conforme VECTOR_INDEX_BACKEND: a coleção do
+    Chroma ou o FlatIndex exportado dela (mesma API de query/get/count).
+    """
+    collection_name = collection_name or get_active_collection()
+    index = _indexes.get(collection_name)
+    if index is None:
+        with _registry_lock:
+            index = _indexes.get(collection_name)
+            if index is None:
+                if VECTOR_INDEX_BACKEND == "flat":
+                    index = _load_flat_index(collection_name, persist_directory)
+                else:
+                    index = get_vectorstore(collection_name=collection_name, persist_directory=persist_directory)._collection
+                _collection_versions[collection_name] = _read_collection_version(index)
+                _indexes[collection_name] = index
+    return index
+
+
+def _read_collection_version(collection):
+    """Identifica o conteúdo da coleção: usa o metadado kb_version ou, na falta dele, o total de chunks."""
+    metadata = collection.metadata or {}
+    return str(metadata.get("kb_version") or collection.count())
+
+
+def get_collection_version(collection_name=None):
+    """Versão da base de conhecimento servida por este processo (parte da chave dos caches)."""
+    collection_name = collection_name or get_active_collection()
+    get_index(collection_name=collection_name)
+    return f"{collection_name}@{_collection_versions.get(collection_name, '0')}"
+
+
+def get_bm25_index(collection_name=None, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Índice BM25 da coleção. Normalmente é gerado na ingestão; se estiver ausente
+    ou desatualizado em relação à coleção, é reconstruído e gravado.
+    """
+    collection_name = collection_name or get_active_collection()
+    index = _bm25_indexes.get(collection_name)
+    if index is not None:
+        return index
+    with _registry_lock:
+        index = _bm25_indexes.get(collection_name)
+        if index is not None:
+            return index
+        collection = get_index(collection_name=collection_name, persist_directory=persist_directory)
+        version = _collection_versions.get(collection_name)
+        path = bm25_index_path(persist_directory, collection_name)
+        if os.path.exists(path):
+            index = BM25Index.load(path)
+        if index is None or index.version != version:
+            print(f"🔧 Construindo índice BM25 para {collection_name}")
+            data = collection.get(include=["documents"])
+            index = BM25Index.build(data["ids"], data["documents"], version=version)
+            try:
+                index.save(path)
+            except OSError as e:
+                print(f"⚠️ Não foi possível gravar o índice BM25: {e}")
+        _bm25_indexes[collection_name] = index
+        return index
+
+
+def reload(collection_name=None):
+    """
+    Descarta as instâncias em cache para que sejam recriadas na próxima chamada.
+    Sem collection_name, descarta também o modelo de embeddings.
+    """
+    global _embeddings
+    with _registry_lock:
+        if collection_name is None:
+            _vectorstores.clear()
+            _indexes.clear()
+            _collection_versions.clear()
+            _bm25_indexes.clear()
+            _pinned_chunks.clear()
+            _embeddings = None
+            QUERY_EMBEDDING_CACHE.clear()
+        else:
+            _forget_collection(collection_name)
+        RETRIEVAL_CACHE.clear()
+
+
+def _forget_collection(collection_name):
+    """Solta as instâncias de uma coleção; requisições em andamento mantêm suas referências."""
+    with _registry_lock:
+        for key in [k for k in _vectorstores if k[0] == collection_name]:
+            del _vectorstores[key]
+        _indexes.pop(collection_name, None)
+        _collection_versions.pop(collection_name, None)
+        _bm25_indexes.pop(collection_name, None)
+        _pinned_chunks.pop(collection_name, None)
+
+
+def normalize_query(query):
+    """Normaliza a pergunta para uso como chave de cache (Unicode NFKC, minúsculas, espaços e pontuação final)."""
+    query = unicodedata.normalize("NFKC", query or "").lower()
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.rstrip("?!.;: ")
+
+
+def embed_query_cached(query):
+    """Embedding da pergunta normalizada, reaproveitado entre requisições pelo cache LRU."""
+    normalized = normalize_query(query)
+    key = (EMBEDDING_MODEL, normalized)
+    embedding = QUERY_EMBEDDING_CACHE.get(key)
+    if embedding is None:
+        embedding = np.asarray(get_embeddings().embed_query(normalized), dtype=np.float32)
+        embedding.setflags(write=False)
+        QUERY_EMBEDDING_CACHE.set(key, embedding)
+    return embedding
+
+
+def cache_stats():
+    """Contadores de acerto/erro dos caches de consulta."""
+    return {
+        "query_embedding": QUERY_EMBEDDING_CACHE.stats(),
+        "retrieval": RETRIEVAL_CACHE.stats(),
+    }
+
+
+def _documents_from_result(ids, texts, metadatas, embeddings):
+    documents = [
+        Document(page_content=text or "", metadata=metadata or {}, id=doc_id)
+        for doc_id, text, metadata in zip(ids, texts, metadatas)
+    ]
+    doc_embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(documents), -1)
+    return documents, doc_embeddings
+
+
+def get_documents_by_ids(ids, collection_name=None):
+    """
+    Busca chunks pelo ID, preservando a ordem pedida.
+
+    Returns:
+        tuple: (documentos, matriz de embeddings) — IDs inexistentes são ignorados
+    """
+    if not ids:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    collection_name = collection_name or get_active_collection()
+    collection = get_index(collection_name=collection_name)
+    result = collection.get(ids=list(ids), include=["documents", "metadatas", "embeddings"])
+    position = {doc_id: i for i, doc_id in enumerate(result["ids"])}
+    order = [position[doc_id] for doc_id in ids if doc_id in position]
+    embeddings = np.asarray(result["embeddings"], dtype=np.float32)
+    return _documents_from_result(
+        [result["ids"][i] for i in order],
+        [result["documents"][i] for i in order],
+        [result["metadatas"][i] for i in order],
+        embeddings[order] if order else embeddings,
+    )
+
+
+def _vector_query(collection_name, query_embedding, k):
+    result = get_index(collection_name=collection_name).query(
+        query_embeddings=[query_embedding.tolist()],
+        n_results=k,
+        include=["documents", "metadatas", "embeddings"]
     )
+    documents, doc_embeddings = _documents_from_result(
+        result["ids"][0], result["documents"][0], result["metadatas"][0], result["embeddings"][0]
+    )
+    return documents, doc_embeddings
+
+
+def retrieve_documents(query, k=6, collection_name=None):
+    """
+    Busca híbrida: vetorial (Chroma) e lexical (BM25) em paralelo, combinadas por
+    fusão de ranks recíprocos. Devolve também os vetores já armazenados no Chroma.
+
+    Returns:
+        tuple: (documentos, matriz de embeddings dos documentos, embedding da pergunta)
+    """
+    # A coleção é fixada no início para que toda a requisição use a mesma, mesmo durante uma troca
+    collection_name = collection_name or get_active_collection()
+    query_embedding = embed_query_cached(query)
+    cache_key = (get_collection_version(collection_name), normalize_query(query), k)
 
+    cached_ids = RETRIEVAL_CACHE.get(cache_key)
+    if cached_ids is not None:
+        documents, doc_embeddings = get_documents_by_ids(cached_ids, collection_name=collection_name)
+        if len(documents) == len(cached_ids):
+            return documents, doc_embeddings, query_embedding
 
-def semantic_search(query, k=5, collection_name=CHROMA_COLLECTION):
+    vector_future = _search_executor.submit(_vector_query, collection_name, query_embedding, k)
+    try:
+        lexical_ids = [doc_id for doc_id, _ in get_bm25_index(collection_name).search(query, k=k)]
+    except Exception as e:
+        print(f"⚠️ Busca BM25 indisponível: {e}")
+        lexical_ids = []
+    vector_docs, vector_embeddings = vector_future.result()
+
+    vector_ids = [doc.id for doc in vector_docs]
+    fused_ids = reciprocal_rank_fusion([vector_ids, lexical_ids])[:k]
+    position = {doc_id: i for i, doc_id in enumerate(vector_ids)}
+    missing = [doc_id for doc_id in fused_ids if doc_id not in position]
+    lexical_docs, lexical_embeddings = get_documents_by_ids(missing, collection_name=collection_name)
+
+    documents, rows = [], []
+    lexical_position = {doc.id: i for i, doc in enumerate(lexical_docs)}
+    for doc_id in fused_ids:
+        if doc_id in position:
+            documents.append(vector_docs[position[doc_id]])
+            rows.append(vector_embeddings[position[doc_id]])
+        elif doc_id in lexical_position:
+            documents.append(lexical_docs[lexical_position[doc_id]])
+            rows.append(lexical_embeddings[lexical_position[doc_id]])
+    doc_embeddings = np.vstack(rows) if rows else vector_embeddings[:0]
+
+    RETRIEVAL_CACHE.set(cache_key, tuple(doc.id for doc in documents))
+    return documents, doc_embeddings, query_embedding
+
+
+def semantic_search(query, k=5, collection_name=None):
     """Busca semântica otimizada: retorna os k documentos mais relevantes para a query."""
-    vectorstore = get_vectorstore(collection_name=collection_name)
-    results = vectorstore.similarity_search(query, k=k)
-    return [doc.page_content for doc in results]
+    documents, _, _ = retrieve_documents(query, k=k, collection_name=collection_name)
+    return [doc.page_content for doc in documents]
+
+
+def _resolve_pinned_chunks(collection_name):
+    """
+    Resolve, uma única vez por coleção, os IDs dos chunks fixados de cada intenção
+    configurada em settings.RAG_PINNED_CHUNKS (arquivo de origem + trechos obrigatórios).
+    """
+    collection = get_index(collection_name=collection_name)
+    pinned_config = getattr(settings, "RAG_PINNED_CHUNKS", {})
+    if not pinned_config:
+        return {}
+    metadatas = collection.get(include=["metadatas"])
+    pinned = {}
+    for intent, rule in pinned_config.items():
+        filename = rule.get("filename", "")
+        candidate_ids = [
+            doc_id for doc_id, metadata in zip(metadatas["ids"], metadatas["metadatas"])
+            if filename in (metadata or {}).get("filename", os.path.basename((metadata or {}).get("source", "")))
+        ]
+        documents, _ = get_documents_by_ids(candidate_ids, collection_name=collection_name)
+        pinned[intent] = [
+            doc.id for doc in documents
+            if all(text in doc.page_content for text in rule.get("contains", []))
+        ][:rule.get("max_chunks", 1)]
+        if not pinned[intent]:
+            print(f"⚠️ Nenhum chunk fixado encontrado para a intenção '{intent}'")
+    return pinned
+
+
+def get_pinned_chunk_ids(intent, collection_name=None):
+    """IDs dos chunks fixados para uma intenção (resolvidos na primeira chamada)."""
+    collection_name = collection_name or get_active_collection()
+    pinned = _pinned_chunks.get(collection_name)
+    if pinned is None:
+        with _registry_lock:
+            pinned = _pinned_chunks.get(collection_name)
+            if pinned is None:
+                pinned = _resolve_pinned_chunks(collection_name)
+                _pinned_chunks[collection_name] = pinned
+    return pinned.get(intent, [])
+
+
+def _get_intent_matcher():
+    """Compila, uma única vez, as palavras-chave de todas as intenções em um só autômato."""
+    global _intent_matcher
+    if _intent_matcher is None:
+        keywords, intents = [], []
+        for intent, rule in getattr(settings, "RAG_PINNED_CHUNKS", {}).items():
+            for keyword in rule.get("keywords", []):
+                keywords.append(keyword)
+                intents.append(intent)
+        _intent_matcher = (KeywordMatcher(keywords), intents)
+    return _intent_matcher
+
+
+def detect_query_intents(query):
+    """Intenções configuradas em RAG_PINNED_CHUNKS cujas palavras-chave aparecem na pergunta."""
+    matcher, intents = _get_intent_matcher()
+    mask = matcher.flags(query)
+    detected = []
+    for i, intent in enumerate(intents):
+        if mask >> i & 1 and intent not in detected:
+            detected.append(intent)
+    return detected
+
+
+def merge_pinned_chunks(query, documents, collection_name=None):
+    """
+    Garante a presença dos chunks fixados das intenções detectadas na pergunta,
+    buscando-os por ID e substituindo os resultados de menor rank.
+    """
+    collection_name = collection_name or get_active_collection()
+    present = {doc.id for doc in documents}
+    pinned_ids = []
+    for intent in detect_query_intents(query):
+        pinned_ids += [doc_id for doc_id in get_pinned_chunk_ids(intent, collection_name) if doc_id not in present]
+    if not pinned_ids:
+        return documents
+    pinned_docs, _ = get_documents_by_ids(pinned_ids, collection_name=collection_name)
+    keep = max(len(documents) - len(pinned_docs), 0)
+    print(f"🔧 {len(pinned_docs)} chunk(s) fixado(s) incluído(s) no contexto")
+    return documents[:keep] + pinned_docs
 
 
 def enhanced_search_for_panels(query, k=8):
     """
     Busca especializada para consultas sobre painéis que garante a inclusão 
-    do chunk do markdown com a lista completa de painéis.
-    """
-    vectorstore = get_vectorstore()
-    
-    # Busca normal
-    normal_results = vectorstore.similarity_search(query, k=k)
-    
-    # Verificar se algum resultado já inclui o chunk do markdown
-    markdown_chunk_found = False
-    for result in normal_results:
-        if ('resumo_fontes_transparencia_ativa.md' in result.metadata.get('filename', '') and
-            'Painel de Compras Governamentais' in result.page_content and
-            'Portal Nacional de Contratações Públicas' in result.page_content):
-            markdown_chunk_found = True
-            break
-    
-    # Se não encontrou o chunk do markdown, forçar sua inclusão
-    if not markdown_chunk_found:
-        # Buscar especificamente o chunk do markdown
-        markdown_results = vectorstore.similarity_search(
-            "Painel de Compras Governamentais Portal Nacional de Contratações Públicas PNCP", 
-            k=10
-        )
-        
-        # Encontrar o chunk correto do markdown
-        for result in markdown_results:
-            if ('resumo_fontes_transparencia_ativa.md' in result.metadata.get('filename', '') and
-                'Painel de Compras Governamentais' in result.page_content):
-                # Substituir o último resultado pela informação do markdown
-                normal_results[-1] = result
-                print("🔧 Chunk do markdown forçadamente incluído no contexto")
-                break
-    
-    return [doc.page_content for doc in normal_results]
+    do chunk com a lista completa de painéis (ver RAG_PINNED_CHUNKS).
+    """
+    collection_name = get_active_collection()
+    documents, _, _ = retrieve_documents(query, k=k, collection_name=collection_name)
+    documents = merge_pinned_chunks(query, documents, collection_name=collection_name)
+    return [doc.page_content for doc in documents]
 
 
 def is_panel_related_query(query):
     """Verifica se a consulta é relacionada a painéis."""
-    query_lower = query.lower()
-    panel_keywords = [
-        'painéis', 'painel', 'panel', 'paineis', 
-        'disponíveis', 'transparência', 'dashboards',
-        'compras governamentais', 'pncp', 'município',
-        'fornecedores', 'contratos públicos'
-    ]
-    return any(keyword in query_lower for keyword in panel_keywords)
+    return "paineis" in detect_query_intents(query)
 
 
-# Palavras-chave do domínio (pode ser expandido/configurado)
-DOMAIN_KEYWORDS = [
-    "transparência", "dados abertos", "licitação", "compras", "governo", "LAI", "normativo", "portal", "sistema", "acesso", "informação", "lei", "decreto"
-]
+def cosine_scores(query_embedding, doc_embeddings):
+    """Similaridade de cosseno entre a pergunta e todas as linhas da matriz, em uma única operação."""
+    query_embedding = np.asarray(query_embedding, dtype=np.float32).ravel()
+    doc_embeddings = np.asarray(doc_embeddings, dtype=np.float32)
+    norms = np.linalg.norm(doc_embeddings, axis=1) * np.linalg.norm(query_embedding)
+    return (doc_embeddings @ query_embedding) / np.maximum(norms, 1e-12)
 
 
-def filter_relevant_documents(question, documents, embeddings, threshold=0.3, top_n=5):
+def filter_relevant_documents(question, documents, embeddings=None, threshold=0.3, top_n=5,
+                              doc_embeddings=None, question_embedding=None):
     """
     Filtra documentos relevantes combinando similaridade, palavras-chave e matching de termos da pergunta.
+    Use doc_embeddings/question_embedding vindos de retrieve_documents() para evitar recalcular vetores.
     """
     if not documents:
         return []
     try:
-        question_embedding = np.array(embeddings.embed_query(question)).reshape(1, -1)
-        doc_embeddings = np.array([
-            np.array(embeddings.embed_query(doc.page_content))
-            for doc in documents
-        ])
-        similarities = cosine_similarity(question_embedding, doc_embeddings)[0]
-        question_lower = question.lower()
-        filtered_docs = []
-        for doc, sim in zip(documents, similarities):
-            doc_lower = doc.page_content.lower()
-            keyword_score = sum(1 for kw in DOMAIN_KEYWORDS if kw in doc_lower)
-            question_words = question_lower.split()
-            word_match_score = sum(1 for word in question_words if len(word) > 3 and word in doc_lower)
-            final_score = sim + (keyword_score * 0.05) + (word_match_score * 0.1)
-            if final_score >= threshold:
-                filtered_docs.append((doc, final_score))
-        filtered_docs = sorted(filtered_docs, key=lambda x: x[1], reverse=True)
-        relevant_docs = [doc for doc, _ in filtered_docs[:top_n]]
+        if question_embedding is None:
+            question_embedding = (embeddings or get_embeddings()).embed_query(question)
+        if doc_embeddings is None:
+            # Compatibilidade: sem vetores armazenados, embute todos os documentos em um único lote
+            doc_embeddings = (embeddings or get_embeddings()).embed_documents(
+                [doc.page_content for doc in documents]
+            )
+        similarities = cosine_scores(question_embedding, doc_embeddings)
+        # Palavras da pergunta (sem acentos) compiladas em um único autômato; até 64 cabem na máscara
+        question_words = list(dict.fromkeys(w for w in re.findall(r"\w+", fold_text(question)) if len(w) > 3))[:64]
+        question_matcher = KeywordMatcher(question_words)
+        keyword_flags = np.zeros(len(documents), dtype=np.uint64)
+        word_flags = np.zeros(len(documents), dtype=np.uint64)
+        for i, doc in enumerate(documents):
+            folded = fold_text(doc.page_content)
+            word_flags[i] = question_matcher.flags(folded, folded=True)
+            # kw_flags é gravado na ingestão; só recalcula se a lista de palavras-chave mudou
+            if doc.metadata.get("kw_sig") == DOMAIN_MATCHER.signature:
+                keyword_flags[i] = doc.metadata["kw_flags"]
+            else:
+                keyword_flags[i] = DOMAIN_MATCHER.flags(folded, folded=True)
+        keyword_scores = popcount(keyword_flags)
+        word_match_scores = popcount(word_flags)
+        final_scores = similarities + (keyword_scores * 0.05) + (word_match_scores * 0.1)
+        order = np.argsort(-final_scores, kind="stable")
+        relevant_docs = [documents[i] for i in order if final_scores[i] >= threshold][:top_n]
         # Fallback: se não encontrou suficientes, retorna os top-N por similaridade
         if not relevant_docs:
-            top_docs = sorted(zip(documents, similarities), key=lambda x: x[1], reverse=True)
-            relevant_docs = [doc for doc, _ in top_docs[:top_n]]
+            top = np.argsort(-similarities, kind="stable")[:top_n]
+            relevant_docs = [documents[i] for i in top]
         return relevant_docs
     except Exception as e:
         print(f"[Filtro de relevância] Erro: {e}")
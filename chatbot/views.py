@@ -1,18 +1,24 @@
 import os
 import json
+import asyncio
+import time
+from asgiref.sync import sync_to_async
 from django.db.models import Q, Count
 from django.core.paginator import Paginator
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.shortcuts import render, get_object_or_404
-from databricks_langchain import ChatDatabricks
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404, aget_object_or_404
 from markdown import markdown
 
 from chatbot.models import Chat, Conversation, ChatFeedback
-from chatbot.vectorstore import semantic_search, filter_relevant_documents, get_vectorstore, enhanced_search_for_panels, is_panel_related_query
-from chatbot.llm import get_unified_prompt_template, generate_answer_groq
+from chatbot.vectorstore import semantic_search, filter_relevant_documents, retrieve_documents, enhanced_search_for_panels, is_panel_related_query
+from chatbot.llm import build_messages, provider_error_message
+from chatbot.answer_cache import ANSWER_CACHE, get_cached_answer, cache_answer
+from chatbot.providers import pool_stats
+from chatbot.router import ROUTER, LLMUnavailableError
+from chatbot.vectorstore import cache_stats
 
 
 # Configuração das variáveis de ambiente do Databricks
@@ -35,76 +41,72 @@ def get_chat_history(chats):
     return chat_history
 
 
-def ask_ai(context, message):
-    model = ChatDatabricks(
-        endpoint=settings.DATABRICKS_MODEL_ENDPOINT,
-        temperature=0.7,
-        max_tokens=2048
-    )
-    
-    # Buscar contexto relevante do RAG
-    vectorstore = get_vectorstore()
-    docs = vectorstore.similarity_search(message, k=10)
-    embeddings = vectorstore._embedding_function
-    relevant_docs = filter_relevant_documents(message, docs, embeddings, top_n=5)
-    rag_context = "\n\n".join([doc.page_content for doc in relevant_docs])
-    
-    # Usar o template unificado
-    unified_prompt = get_unified_prompt_template()
-    
-    # Aplicar o template unificado com contexto RAG
-    prompt_content = unified_prompt.format(
-        context=rag_context, 
-        question=message
-    )
-    
-    messages = [
-        ('system', 'Você é o ChatCOTIN. Siga rigorosamente as instruções do prompt.'),
-        ('human', prompt_content)
-    ]
-    
-    print(messages)
-    response = model.invoke(messages)
-    return markdown(response.content, output_format='html')
-
-
-# Função ask_rag_local removida - modelo Ollama descontinuado
-
-
-def ask_rag_groq(message, chat_history=None):
-    """Pipeline RAG: busca contexto relevante e gera resposta usando Groq."""
-    
+def retrieve_context(message):
+    """Trechos da base de conhecimento usados como contexto, do mais relevante ao menos."""
     # Verificar se é uma consulta sobre painéis e usar busca especializada
     if is_panel_related_query(message):
         print("🎯 Consulta sobre painéis detectada - usando busca especializada")
-        context_results = enhanced_search_for_panels(message, k=8)
-        context = "\n\n".join(context_results)
+        context = enhanced_search_for_panels(message, k=8)
     else:
         # Busca semântica normal
-        vectorstore = get_vectorstore()
-        docs = vectorstore.similarity_search(message, k=10)
-        # Filtro avançado de relevância
-        embeddings = vectorstore._embedding_function
-        relevant_docs = filter_relevant_documents(message, docs, embeddings, top_n=5)
-        context = "\n".join([doc.page_content for doc in relevant_docs])
-    
-    # Geração de resposta
-    resposta = generate_answer_groq(context, message, chat_history=chat_history)
+        docs, doc_embeddings, question_embedding = retrieve_documents(message, k=6)
+        # Filtro avançado de relevância (reaproveita os vetores já armazenados no Chroma)
+        relevant_docs = filter_relevant_documents(
+            message, docs, top_n=5,
+            doc_embeddings=doc_embeddings, question_embedding=question_embedding
+        )
+        context = [doc.page_content for doc in relevant_docs]
+    return context
+
+
+# Função ask_rag_local removida - modelo Ollama descontinuado
+
+
+# ===== Pipeline assíncrono (servidor ASGI) =====
+# Busca no RAG, contagem de tokens e cache semântico são síncronos (Chroma, modelo de embeddings,
+# tokenizador): rodam no pool de threads, sem bloquear o loop de eventos.
+aget_cached_answer = sync_to_async(get_cached_answer, thread_sensitive=False)
+acache_answer = sync_to_async(cache_answer, thread_sensitive=False)
+aretrieve_context = sync_to_async(retrieve_context, thread_sensitive=False)
+abuild_messages = sync_to_async(build_messages, thread_sensitive=False)
+
+
+async def aanswer_question(message, chat_history=None, preferred=None):
+    """
+    Pipeline RAG: busca o contexto relevante e gera a resposta (HTML) no provedor escolhido pelo
+    roteador, que troca de provedor se o preferido falhar ou estiver sobrecarregado.
+    Levanta LLMUnavailableError se nenhum provedor responder.
+    """
+    preferred = preferred or getattr(settings, 'LLM_PROVIDER', 'databricks')
+    use_cache = not chat_history
+    if use_cache:
+        cached, question_embedding, kb_version = await aget_cached_answer(preferred, message)
+        if cached is not None:
+            print("♻️ Resposta reaproveitada do cache semântico")
+            return cached
+
+    context = await aretrieve_context(message)
+    # O roteador monta o prompt no orçamento de tokens de cada provedor que tentar
+    answer, provider = await ROUTER.acomplete(
+        lambda budget: abuild_messages(context, message, chat_history, budget=budget), preferred=preferred
+    )
+    resposta = markdown(answer, output_format='html')
+    if use_cache:
+        await acache_answer(provider, message, resposta, question_embedding, kb_version)
     return resposta
 
 
-def build_chat_history(chats, max_history=MAX_HISTORY):
+def build_chat_history_turns(chats, max_history=MAX_HISTORY):
     """
-    Monta o histórico de conversação limitado para o prompt do LLM.
+    Monta o histórico como lista de turnos (do mais antigo ao mais recente), para que o
+    empacotador de prompt inclua turnos inteiros até o orçamento de tokens.
     Se houver mais interações, sumariza as mais antigas.
     """
     if not chats:
-        return ""
+        return []
     # Se houver poucas interações, retorna todas
     if len(chats) <= max_history:
-        return "\n".join([
-            f"Usuário: {c.message}\nAssistente: {c.response}" for c in chats
-        ])
+        return [f"Usuário: {c.message}\nAssistente: {c.response}" for c in chats]
     # Sumariza as mais antigas e mantém as últimas max_history-1 completas
     old_chats = chats[:-max_history+1]
     recent_chats = chats[-max_history+1:]
@@ -113,12 +115,16 @@ def build_chat_history(chats, max_history=MAX_HISTORY):
     # (Opcional: implementar sumarização real com LLM ou heurística)
     history = [summary]
     history += [f"Usuário: {c.message}\nAssistente: {c.response}" for c in recent_chats]
-    return "\n".join(history)
+    return history
 
 
-@login_required
-def chatbot(request, conversation_id=None):
-    """View principal do chatbot - agora com suporte a conversas"""
+def build_chat_history(chats, max_history=MAX_HISTORY):
+    """Monta o histórico de conversação limitado para o prompt do LLM (texto único)."""
+    return "\n".join(build_chat_history_turns(chats, max_history=max_history))
+
+
+def render_chatbot(request, conversation_id=None):
+    """Página do chatbot com as mensagens da conversa indicada, da conversa ativa ou as antigas sem conversa."""
     
     # Se conversation_id for fornecido, carregar conversa específica
     if conversation_id:
@@ -137,53 +143,173 @@ def chatbot(request, conversation_id=None):
         else:
             # Fallback para chats antigos sem conversa
             chats = Chat.objects.filter(user=request.user, conversation__isnull=True)
+    
+    return render(request, 'chatbot_new.html', {
+        'chats': chats,
+        'current_conversation': current_conversation,
+    })
 
-    if request.method == 'POST':
-        message = request.POST.get('message')
-        llm_provider = request.POST.get('llm_provider', getattr(settings, 'LLM_PROVIDER', 'databricks'))
-        
-        # Se não há conversa ativa, criar nova
-        if not current_conversation:
-            current_conversation = Conversation.objects.create(
-                user=request.user,
-                is_active=True
-            )
-        
-        # Usar histórico da conversa atual
-        conversation_chats = current_conversation.chats.all()
-        chat_history = build_chat_history(list(conversation_chats.order_by('id')))
-        
-        if llm_provider == 'groq':
-            response = ask_rag_groq(message, chat_history=chat_history)
-        else:
-            # Databricks é o padrão
-            context = get_chat_history(chats=conversation_chats)
-            response = ask_ai(context=context, message=message)
 
-        # Criar novo chat associado à conversa
-        chat = Chat(
-            user=request.user,
-            conversation=current_conversation,
-            message=message,
-            response=response,
-        )
-        chat.save()
+async def aget_current_conversation(user, conversation_id=None):
+    """Conversa indicada, ou a conversa ativa mais recente (criada se não houver)."""
+    if conversation_id:
+        return await aget_object_or_404(Conversation, id=conversation_id, user=user)
+    conversation = await Conversation.objects.filter(user=user, is_active=True).afirst()
+    if conversation is None:
+        conversation = await Conversation.objects.acreate(user=user, is_active=True)
+    return conversation
 
-        # Marcar conversa como ativa e atualizada
-        current_conversation.is_active = True
-        current_conversation.save()
 
+@login_required
+async def chatbot(request, conversation_id=None):
+    """
+    View principal do chatbot - agora com suporte a conversas.
+    Assíncrona: enquanto aguarda o LLM, o processo continua atendendo outras requisições.
+    """
+    if request.method != 'POST':
+        # O template percorre os querysets: a página é montada fora do loop de eventos
+        return await sync_to_async(render_chatbot)(request, conversation_id)
+
+    user = await request.auser()
+    message = request.POST.get('message')
+    llm_provider = request.POST.get('llm_provider', getattr(settings, 'LLM_PROVIDER', 'databricks'))
+    
+    current_conversation = await aget_current_conversation(user, conversation_id)
+    
+    # Usar histórico da conversa atual
+    conversation_chats = [chat async for chat in current_conversation.chats.order_by('id')]
+    chat_history = build_chat_history_turns(conversation_chats)
+    
+    # O provedor escolhido é a preferência; o roteador troca de provedor se ele falhar
+    try:
+        response = await aanswer_question(message, chat_history=chat_history, preferred=llm_provider)
+    except LLMUnavailableError as e:
         return JsonResponse({
             'message': message,
-            'response': response,
+            'response': provider_error_message(e),
             'conversation_id': current_conversation.id,
+        }, status=503)
+
+    # Criar novo chat associado à conversa
+    chat = await Chat.objects.acreate(
+        user=user,
+        conversation=current_conversation,
+        message=message,
+        response=response,
+    )
+
+    # Marcar conversa como ativa e atualizada
+    current_conversation.is_active = True
+    await current_conversation.asave()
+
+    return JsonResponse({
+        'message': message,
+        'response': response,
+        'conversation_id': current_conversation.id,
+        'chat_id': chat.id,
+    })
+
+
+def sse_event(event, data):
+    """Formata um evento Server-Sent Events com dados JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def astream_chat_events(user, conversation, message, llm_provider, chat_history):
+    """
+    Gera os eventos SSE de uma resposta: "token" com cada trecho gerado e, no final, "done"
+    com a resposta em HTML e o chat gravado. A conversa só é gravada se o stream terminar;
+    se o cliente desconectar, o servidor cancela este gerador e a geração é interrompida.
+    """
+    started = time.perf_counter()
+    # O cache semântico só vale para perguntas sem histórico, cuja resposta não depende da conversa
+    use_cache = not chat_history
+    tokens = None
+    try:
+        response = None
+        if use_cache:
+            cached, question_embedding, kb_version = await aget_cached_answer(llm_provider, message)
+            if cached is not None:
+                print("♻️ Resposta reaproveitada do cache semântico")
+                response = cached
+
+        if response is None:
+            context = await aretrieve_context(message)
+            # O provedor escolhido é a preferência; o roteador troca de provedor se ele falhar
+            # e monta o prompt no orçamento de tokens de cada provedor que tentar
+            tokens = ROUTER.astream(
+                lambda budget: abuild_messages(context, message, chat_history, budget=budget), preferred=llm_provider
+            )
+            parts = []
+            answered_by = llm_provider
+            async for provider, delta in tokens:
+                if not parts:
+                    print(f"⚡ Primeiro token em {time.perf_counter() - started:.2f}s ({provider})")
+                answered_by = provider
+                parts.append(delta)
+                yield sse_event('token', {'text': delta})
+            response = markdown(''.join(parts), output_format='html')
+            if use_cache:
+                await acache_answer(answered_by, message, response, question_embedding, kb_version)
+
+        chat = await Chat.objects.acreate(
+            user=user,
+            conversation=conversation,
+            message=message,
+            response=response,
+        )
+        conversation.is_active = True
+        await conversation.asave()
+        print(f"✅ Resposta completa em {time.perf_counter() - started:.2f}s")
+        yield sse_event('done', {
+            'message': message,
+            'response': response,
+            'conversation_id': conversation.id,
             'chat_id': chat.id,
         })
-    
-    return render(request, 'chatbot_new.html', {
-        'chats': chats,
-        'current_conversation': current_conversation,
-    })
+    except (asyncio.CancelledError, GeneratorExit):
+        print(f"🔌 Cliente desconectou após {time.perf_counter() - started:.2f}s; geração interrompida")
+        raise
+    except LLMUnavailableError as e:
+        print(f"❌ Nenhum provedor respondeu: {e}")
+        yield sse_event('error', {'message': provider_error_message(e)})
+    except Exception as e:
+        print(f"❌ Erro no streaming da resposta: {e}")
+        yield sse_event('error', {'message': 'Desculpe, ocorreu um erro. Por favor, tente novamente.'})
+    finally:
+        if tokens is not None:
+            await tokens.aclose()
+
+
+@login_required
+async def chatbot_stream(request, conversation_id=None):
+    """
+    Versão em streaming (Server-Sent Events) do POST de views.chatbot: a resposta chega ao
+    navegador trecho a trecho enquanto o modelo a gera.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método não permitido'}, status=405)
+
+    message = request.POST.get('message', '').strip()
+    if not message:
+        return JsonResponse({'status': 'error', 'message': 'Mensagem é obrigatória'}, status=400)
+    llm_provider = request.POST.get('llm_provider', getattr(settings, 'LLM_PROVIDER', 'databricks'))
+
+    user = await request.auser()
+    current_conversation = await aget_current_conversation(
+        user, conversation_id or request.POST.get('conversation_id')
+    )
+    chat_history = build_chat_history_turns(
+        [chat async for chat in current_conversation.chats.order_by('id')]
+    )
+    response = StreamingHttpResponse(
+        astream_chat_events(user, current_conversation, message, llm_provider, chat_history),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Desativa o buffer de proxies reversos (nginx), que seguraria os eventos até o fim
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
@@ -513,7 +639,7 @@ def get_feedback_analytics(request):
 
 
 @login_required
-def regenerate_response(request):
+async def regenerate_response(request):
     """Regenera uma resposta do chatbot"""
     if request.method == 'POST':
         try:
@@ -528,7 +654,7 @@ def regenerate_response(request):
             
             # Verifica se o chat existe e pertence ao usuário
             try:
-                chat = Chat.objects.get(id=chat_id, user=request.user)
+                chat = await Chat.objects.aget(id=chat_id, user=await request.auser())
             except Chat.DoesNotExist:
                 return JsonResponse({
                     'status': 'error',
@@ -540,17 +666,12 @@ def regenerate_response(request):
             llm_provider = data.get('llm_provider', 'databricks')
             
             try:
-                # Busca semântica e gera nova resposta baseada no provedor selecionado
-                if llm_provider == 'groq':
-                    new_response = ask_rag_groq(message)
-                else:
-                    # Databricks é o padrão
-                    context = []  # Usar contexto vazio para regeneração simples
-                    new_response = ask_ai(context=context, message=message)
+                # Busca semântica e gera nova resposta, preferindo o provedor selecionado
+                new_response = await aanswer_question(message, preferred=llm_provider)
                 
                 # Atualiza a resposta no chat existente
                 chat.response = new_response
-                chat.save()
+                await chat.asave()
                 
                 return JsonResponse({
                     'status': 'success',
@@ -562,6 +683,11 @@ def regenerate_response(request):
                     }
                 })
                 
+            except LLMUnavailableError as e:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': provider_error_message(e)
+                }, status=503)
             except Exception as e:
                 return JsonResponse({
                     'status': 'error',
@@ -620,12 +746,29 @@ def copy_response(request):
 
 
 @login_required
-def chatbot_new(request, conversation_id=None):
+async def chatbot_new(request, conversation_id=None):
     """View redirecionada para o novo template do chatbot"""
-    return chatbot(request, conversation_id)
+    return await chatbot(request, conversation_id)
 
 
 @login_required
 def sobre(request):
     """View para a página Sobre o ChatCOTIN"""
     return render(request, 'sobre.html')
+
+
+@login_required
+def llm_stats(request):
+    """Pools de conexão, saúde dos provedores e caches deste processo; limites compartilhados (somente equipe)."""
+    if not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Acesso restrito'}, status=403)
+    return JsonResponse({
+        'status': 'success',
+        'data': {
+            'providers': pool_stats(),
+            'router': ROUTER.stats(),
+            'rate_limits': ROUTER.rate_limits(),
+            'caches': cache_stats(),
+            'answer_cache': ANSWER_CACHE.stats(),
+        }
+    })
@@ -8,9 +8,27 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
+import re
 
+from blacknoise import BlackNoise
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Arquivos estáticos servidos antes da cadeia de middlewares do Django, de forma assíncrona
+# (o WhiteNoiseMiddleware só roda de forma síncrona e faria cada requisição passar por uma thread).
+# Arquivos com hash no nome (gerados pelo collectstatic) recebem cache permanente.
+application = BlackNoise(
+    django_application,
+    immutable_file_test=lambda path: re.search(r'\.[0-9a-f]{12}\.\w+$', path) is not None,
+)
+if os.path.isdir(settings.STATIC_ROOT):
+    application.add(settings.STATIC_ROOT, settings.STATIC_URL.rstrip('/'))
+
+# Carrega o tokenizador do disco antes da primeira pergunta de cada worker
+from chatbot.context_packer import get_tokenizer  # noqa: E402
+
+get_tokenizer()
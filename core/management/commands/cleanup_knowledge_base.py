@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand
+import os
+
+from chatbot.ingestion import CHROMA_PERSIST_DIR
+from chatbot.knowledge_base import (
+    CHROMA_SQLITE_FILENAME, KB_KEEP_BACKUPS, KB_KEEP_PREVIOUS, active_collection_name, cleanup_knowledge_base,
+    collection_size, collections_in_use, list_backups, path_size,
+)
+
+
+def format_mb(size):
+    return f"{size / (1024 * 1024):,.1f} MB"
+
+
+class Command(BaseCommand):
+    help = 'Lista coleções e backups do ChromaDB com seus tamanhos, remove os antigos e compacta o SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--persist-dir',
+            default=CHROMA_PERSIST_DIR,
+            help='Diretório do ChromaDB (padrão: CHROMA_PERSIST_DIR)',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=KB_KEEP_PREVIOUS,
+            help=f'Coleções anteriores mantidas além da ativa (padrão: KB_KEEP_PREVIOUS={KB_KEEP_PREVIOUS})',
+        )
+        parser.add_argument(
+            '--keep-backups',
+            type=int,
+            default=KB_KEEP_BACKUPS,
+            help=f'Backups do diretório mantidos (padrão: KB_KEEP_BACKUPS={KB_KEEP_BACKUPS})',
+        )
+        parser.add_argument(
+            '--no-vacuum',
+            action='store_true',
+            help='Não compacta o SQLite do ChromaDB',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas lista o que seria removido',
+        )
+
+    def handle(self, *args, **options):
+        import chromadb
+
+        persist_directory = options['persist_dir']
+        if not os.path.isdir(persist_directory):
+            self.stdout.write(f'ℹ️  Nenhuma base em {persist_directory}')
+            return
+
+        active = active_collection_name(persist_directory)
+        in_use = collections_in_use(persist_directory)
+        client = chromadb.PersistentClient(path=persist_directory)
+        self.stdout.write(f'📚 Coleções em {persist_directory}:')
+        for collection in sorted(client.list_collections(), key=lambda c: c.name, reverse=True):
+            tags = [tag for tag, flag in (('ativa', collection.name == active),
+                                          ('em uso', collection.name in in_use)) if flag]
+            self.stdout.write(
+                f"  {collection.name:<40} {collection.count():>9,} chunks  "
+                f"{format_mb(collection_size(persist_directory, collection)):>12}"
+                + (f"  ({', '.join(tags)})" if tags else '')
+            )
+        sqlite_path = os.path.join(persist_directory, CHROMA_SQLITE_FILENAME)
+        if os.path.exists(sqlite_path):
+            self.stdout.write(f'  {CHROMA_SQLITE_FILENAME:<40} {"":>16}  {format_mb(os.path.getsize(sqlite_path)):>12}')
+
+        backups = list_backups(persist_directory)
+        if backups:
+            self.stdout.write('🗄️  Backups:')
+            for path in backups:
+                self.stdout.write(f'  {os.path.basename(path):<40} {"":>16}  {format_mb(path_size(path)):>12}')
+
+        result = cleanup_knowledge_base(
+            persist_directory,
+            keep_previous=options['keep'],
+            keep_backups=options['keep_backups'],
+            vacuum=not options['no_vacuum'],
+            dry_run=options['dry_run'],
+        )
+        removed = result['collections'] + [os.path.basename(path) for path in result['backups']]
+        if not removed:
+            self.stdout.write(self.style.SUCCESS('✅ Nada a remover'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"🔎 Seriam removidos: {', '.join(removed)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"🧹 Removidos: {', '.join(removed)}"))
+        if result['vacuumed_bytes'] is not None:
+            self.stdout.write(self.style.SUCCESS(f"🗜️  SQLite compactado: {format_mb(result['vacuumed_bytes'])} liberados"))
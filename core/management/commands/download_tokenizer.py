@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+import os
+
+from chatbot.context_packer import LLM_TOKENIZER, LLM_TOKENIZER_PATH
+
+
+class Command(BaseCommand):
+    help = 'Baixa o tokenizador do modelo (Hugging Face) para o arquivo local usado na contagem de tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            default=LLM_TOKENIZER,
+            help=f'Repositório do tokenizador no Hugging Face (padrão: {LLM_TOKENIZER})',
+        )
+        parser.add_argument(
+            '--path',
+            default=LLM_TOKENIZER_PATH,
+            help=f'Arquivo de destino (padrão: {LLM_TOKENIZER_PATH})',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Baixa novamente mesmo se o arquivo já existir',
+        )
+
+    def handle(self, *args, **options):
+        from tokenizers import Tokenizer
+
+        path = options['path']
+        if os.path.exists(path) and not options['force']:
+            self.stdout.write(f'✅ Tokenizador já disponível em {path}')
+            return
+
+        self.stdout.write(f"⬇️  Baixando tokenizador {options['model']}...")
+        tokenizer = Tokenizer.from_pretrained(options['model'])
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        tokenizer.save(tmp_path)
+        os.replace(tmp_path, path)
+        self.stdout.write(self.style.SUCCESS(f'✅ Tokenizador salvo em {path} ({tokenizer.get_vocab_size():,} tokens no vocabulário)'))
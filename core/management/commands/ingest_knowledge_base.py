@@ -0,0 +1,91 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot import ingestion
+from chatbot.knowledge_base import KB_AUTO_CLEANUP
+
+
+class Command(BaseCommand):
+    help = 'Atualiza a base de conhecimento a partir da pasta Docs/ (incremental, ou completa com --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Reconstrói toda a base em uma nova coleção, ignorando o manifesto',
+        )
+        parser.add_argument(
+            '--docs',
+            default=ingestion.DOCS_PATH,
+            help='Pasta com os documentos (padrão: Docs/)',
+        )
+        parser.add_argument(
+            '--persist-dir',
+            default=ingestion.CHROMA_PERSIST_DIR,
+            help='Diretório do ChromaDB (padrão: CHROMA_PERSIST_DIR)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=ingestion.CHUNK_SIZE,
+            help=f'Tamanho dos chunks em caracteres (padrão: {ingestion.CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--chunk-overlap',
+            type=int,
+            default=ingestion.CHUNK_OVERLAP,
+            help=f'Sobreposição entre chunks (padrão: {ingestion.CHUNK_OVERLAP})',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Processos para a extração paralela (padrão: INGEST_WORKERS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Chunks por lote de embedding/gravação (padrão: INGEST_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--no-publish',
+            action='store_true',
+            help='Não troca a coleção ativa (útil para comparar parâmetros)',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            default=KB_AUTO_CLEANUP,
+            help='Ao final, remove coleções e backups antigos e compacta o SQLite (padrão: KB_AUTO_CLEANUP)',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers']:
+            ingestion.INGEST_WORKERS = options['workers']
+        if options['batch_size']:
+            ingestion.INGEST_BATCH_SIZE = options['batch_size']
+
+        self.stdout.write(self.style.SUCCESS('🚀 CHATCOTIN - Atualização da Base de Conhecimento'))
+        self.stdout.write(f"📋 Formatos suportados: {', '.join(ingestion.supported_extensions())}")
+
+        stats = ingestion.IngestionStats()
+        result = ingestion.run_ingestion(
+            docs_path=options['docs'],
+            persist_directory=options['persist_dir'],
+            full=options['full'],
+            publish=not options['no_publish'],
+            chunk_size=options['chunk_size'],
+            chunk_overlap=options['chunk_overlap'],
+            stats=stats,
+        )
+        stats.report()
+        if result is None:
+            raise CommandError('Falha ao atualizar a base de conhecimento')
+
+        if result['changed']:
+            self.stdout.write(self.style.SUCCESS('\n🎉 ATUALIZAÇÃO CONCLUÍDA COM SUCESSO!'))
+            self.stdout.write(f"   📄 {result['files']} documentos indexados em {result['collection']}")
+            self.stdout.write(f"   💾 Dados salvos em: {options['persist_dir']}")
+            self.stdout.write(f"   📈 Relatório de desempenho: {result['report']}")
+
+        if options['cleanup'] and not options['no_publish']:
+            call_command('cleanup_knowledge_base', persist_dir=options['persist_dir'])
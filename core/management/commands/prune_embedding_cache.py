@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+import os
+
+from chatbot.embedding_cache import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_MB, EmbeddingCache
+
+
+class Command(BaseCommand):
+    help = 'Mostra e poda o cache de embeddings da ingestão (mantém as entradas usadas mais recentemente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-mb',
+            type=float,
+            default=EMBEDDING_CACHE_MAX_MB,
+            help=f'Tamanho máximo por modelo em MB (padrão: {EMBEDDING_CACHE_MAX_MB:g})',
+        )
+        parser.add_argument(
+            '--model',
+            help='Poda apenas o cache deste modelo',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas informa quantas entradas seriam removidas',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(EMBEDDING_CACHE_DIR):
+            self.stdout.write(f'ℹ️  Nenhum cache de embeddings em {EMBEDDING_CACHE_DIR}')
+            return
+
+        max_bytes = options['max_mb'] * 1024 * 1024
+        for name in sorted(os.listdir(EMBEDDING_CACHE_DIR)):
+            if not os.path.isdir(os.path.join(EMBEDDING_CACHE_DIR, name)):
+                continue
+            cache = EmbeddingCache(name, directory=EMBEDDING_CACHE_DIR)
+            if options['model'] and options['model'] not in (name, cache.model_name):
+                continue
+            before = cache.stats()
+            removed = cache.prune(max_bytes=max_bytes, dry_run=options['dry_run'])
+            self.stdout.write(f"🗃️  {name}: {before['entries']:,} entradas, {before['size_mb']} MB")
+            if not removed:
+                self.stdout.write('  ✅ Dentro do limite')
+            elif options['dry_run']:
+                self.stdout.write(self.style.WARNING(f'  🔎 {removed:,} entradas seriam removidas'))
+            else:
+                after = cache.stats()
+                self.stdout.write(self.style.SUCCESS(
+                    f"  🧹 {removed:,} entradas removidas ({after['entries']:,} restantes, {after['size_mb']} MB)"
+                ))
@@ -0,0 +1,148 @@
+from django.core.management.base import BaseCommand
+import os
+import threading
+import time
+
+from chatbot import ingestion
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Sem watchdog: verificação periódica da pasta
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class DocsEventHandler(FileSystemEventHandler):
+    """Sinaliza qualquer criação, alteração, remoção ou renomeação de arquivo suportado."""
+
+    def __init__(self, changed):
+        self.changed = changed
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        if any(path and ingestion.is_supported_file(path) for path in paths):
+            self.changed.set()
+
+
+def folder_snapshot(docs_path):
+    """(data de modificação, tamanho) de cada arquivo suportado da pasta."""
+    snapshot = {}
+    for filename in ingestion.supported_files(docs_path):
+        try:
+            stat = os.stat(os.path.join(docs_path, filename))
+        except OSError:
+            continue
+        snapshot[filename] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+class Command(BaseCommand):
+    help = 'Observa a pasta Docs/ e indexa incrementalmente os arquivos novos, alterados ou removidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--docs',
+            default=ingestion.DOCS_PATH,
+            help='Pasta observada (padrão: Docs/)',
+        )
+        parser.add_argument(
+            '--persist-dir',
+            default=ingestion.CHROMA_PERSIST_DIR,
+            help='Diretório do ChromaDB (padrão: CHROMA_PERSIST_DIR)',
+        )
+        parser.add_argument(
+            '--debounce',
+            type=float,
+            default=10.0,
+            help='Segundos sem novas alterações antes de indexar (padrão: 10)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Intervalo da verificação periódica, quando o watchdog não está disponível (padrão: 5)',
+        )
+        parser.add_argument(
+            '--polling',
+            action='store_true',
+            help='Força a verificação periódica mesmo com o watchdog instalado',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processos para a extração (padrão: 1, para não disputar CPU com a aplicação)',
+        )
+        parser.add_argument(
+            '--nice',
+            type=int,
+            default=10,
+            help='Reduz a prioridade do processo (padrão: 10; 0 para manter)',
+        )
+
+    def handle(self, *args, **options):
+        docs_path = options['docs']
+        ingestion.INGEST_WORKERS = options['workers']
+        if options['nice'] and hasattr(os, 'nice'):
+            os.nice(options['nice'])
+
+        changed = threading.Event()
+        stop = threading.Event()
+        observer = None
+        if Observer is not None and not options['polling']:
+            observer = Observer()
+            observer.schedule(DocsEventHandler(changed), docs_path, recursive=False)
+            observer.start()
+            self.stdout.write(f'👀 Observando {docs_path} (eventos do sistema de arquivos)')
+        else:
+            threading.Thread(
+                target=self.poll, args=(docs_path, options['poll_interval'], changed, stop),
+                name='docs-poller', daemon=True,
+            ).start()
+            self.stdout.write(f"👀 Observando {docs_path} (verificação a cada {options['poll_interval']:g}s)")
+
+        # Alterações feitas enquanto o observador estava parado
+        changed.set()
+        try:
+            while True:
+                changed.wait()
+                # Espera a rajada de alterações terminar (cópia de vários arquivos, salvamentos seguidos)
+                changed.clear()
+                while changed.wait(timeout=options['debounce']):
+                    changed.clear()
+                self.index(docs_path, options['persist_dir'])
+        except KeyboardInterrupt:
+            self.stdout.write('\n🛑 Observação encerrada')
+        finally:
+            stop.set()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def poll(self, docs_path, interval, changed, stop):
+        snapshot = folder_snapshot(docs_path)
+        while not stop.wait(interval):
+            current = folder_snapshot(docs_path)
+            if current != snapshot:
+                snapshot = current
+                changed.set()
+
+    def index(self, docs_path, persist_directory):
+        """Indexa as alterações na coleção ativa e publica a nova versão para os workers."""
+        self.stdout.write(f"\n🔄 Alterações detectadas em {docs_path} ({time.strftime('%H:%M:%S')})")
+        stats = ingestion.IngestionStats()
+        try:
+            result = ingestion.run_ingestion(docs_path=docs_path, persist_directory=persist_directory, stats=stats)
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'❌ Falha ao indexar: {e}'))
+            return
+        if result is None:
+            self.stderr.write(self.style.ERROR('❌ Falha ao indexar; nova tentativa na próxima alteração'))
+        elif result['changed']:
+            stats.report()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {result['collection']} publicada na versão {result['kb_version']}"
+            ))
@@ -36,7 +36,6 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Para servir arquivos estáticos em produção
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,6 +63,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -149,7 +149,8 @@ STATICFILES_DIRS = [
 # Para produção
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Configuração do WhiteNoise para servir arquivos estáticos
+# Arquivos comprimidos e com hash no nome gerados pelo collectstatic (WhiteNoise); em produção
+# são servidos pelo BlackNoise em core/asgi.py, fora da cadeia de middlewares
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Media files
@@ -172,9 +173,75 @@ DATABRICKS_MODEL_ENDPOINT = config('DATABRICKS_MODEL_ENDPOINT', default='')
 # Configurações do Groq
 GROQ_API_KEY = config('GROQ_API_KEY', default='')
 
+# Limite de tokens de cada resposta (max_tokens), também reservado pelo controle de admissão
+GROQ_MAX_TOKENS = config('GROQ_MAX_TOKENS', default=4096, cast=int)
+DATABRICKS_MAX_TOKENS = config('DATABRICKS_MAX_TOKENS', default=2048, cast=int)
+
 # Configuração do provedor de LLM padrão
 LLM_PROVIDER = config('LLM_PROVIDER', default='databricks')
 
+# Pool de conexões HTTP dos clientes de LLM (um cliente por processo, conexões keep-alive)
+LLM_HTTP_MAX_CONNECTIONS = config('LLM_HTTP_MAX_CONNECTIONS', default=100, cast=int)
+LLM_HTTP_MAX_KEEPALIVE = config('LLM_HTTP_MAX_KEEPALIVE', default=20, cast=int)
+LLM_HTTP_KEEPALIVE_EXPIRY = config('LLM_HTTP_KEEPALIVE_EXPIRY', default=60.0, cast=float)
+LLM_HTTP_CONNECT_TIMEOUT = config('LLM_HTTP_CONNECT_TIMEOUT', default=5.0, cast=float)
+LLM_HTTP_READ_TIMEOUT = config('LLM_HTTP_READ_TIMEOUT', default=120.0, cast=float)
+
+# Roteamento entre provedores de LLM (latência, disjuntor e requisições de cobertura)
+ROUTER_WINDOW_SIZE = config('ROUTER_WINDOW_SIZE', default=100, cast=int)
+ROUTER_WINDOW_SECONDS = config('ROUTER_WINDOW_SECONDS', default=300.0, cast=float)
+ROUTER_MIN_SAMPLES = config('ROUTER_MIN_SAMPLES', default=5, cast=int)
+ROUTER_LATENCY_TOLERANCE = config('ROUTER_LATENCY_TOLERANCE', default=1.5, cast=float)
+ROUTER_MAX_ERROR_RATE = config('ROUTER_MAX_ERROR_RATE', default=0.5, cast=float)
+ROUTER_BREAKER_ERRORS = config('ROUTER_BREAKER_ERRORS', default=3, cast=int)
+ROUTER_BREAKER_WINDOW = config('ROUTER_BREAKER_WINDOW', default=30.0, cast=float)
+ROUTER_BREAKER_COOLDOWN = config('ROUTER_BREAKER_COOLDOWN', default=30.0, cast=float)
+ROUTER_HEDGE = config('ROUTER_HEDGE', default=True, cast=bool)
+ROUTER_HEDGE_PERCENTILE = config('ROUTER_HEDGE_PERCENTILE', default=95, cast=int)
+ROUTER_HEDGE_MIN_DELAY = config('ROUTER_HEDGE_MIN_DELAY', default=2.0, cast=float)
+ROUTER_HEDGE_DEFAULT_DELAY = config('ROUTER_HEDGE_DEFAULT_DELAY', default=8.0, cast=float)
+
+# Controle de admissão: limites por minuto dos provedores (0 = sem limite), compartilhados entre os workers
+LLM_RATE_LIMIT = config('LLM_RATE_LIMIT', default=True, cast=bool)
+# Arquivo SQLite com o estado compartilhado (padrão: diretório temporário local da instância)
+LLM_RATE_LIMIT_DB = config('LLM_RATE_LIMIT_DB', default='')
+GROQ_RATE_LIMIT_RPM = config('GROQ_RATE_LIMIT_RPM', default=30, cast=int)
+GROQ_RATE_LIMIT_TPM = config('GROQ_RATE_LIMIT_TPM', default=12000, cast=int)
+DATABRICKS_RATE_LIMIT_RPM = config('DATABRICKS_RATE_LIMIT_RPM', default=0, cast=int)
+DATABRICKS_RATE_LIMIT_TPM = config('DATABRICKS_RATE_LIMIT_TPM', default=0, cast=int)
+LLM_ADMISSION_MAX_QUEUE = config('LLM_ADMISSION_MAX_QUEUE', default=50, cast=int)
+LLM_ADMISSION_TIMEOUT = config('LLM_ADMISSION_TIMEOUT', default=10.0, cast=float)
+LLM_RETRY_ATTEMPTS = config('LLM_RETRY_ATTEMPTS', default=2, cast=int)
+LLM_RETRY_BASE_DELAY = config('LLM_RETRY_BASE_DELAY', default=0.5, cast=float)
+LLM_RETRY_MAX_DELAY = config('LLM_RETRY_MAX_DELAY', default=8.0, cast=float)
+
+# Orçamento de tokens do prompt (contado com o tokenizador do modelo de destino)
+LLM_TOKENIZER = config('LLM_TOKENIZER', default='unsloth/Llama-3.3-70B-Instruct')
+LLM_TOKENIZER_PATH = config('LLM_TOKENIZER_PATH', default=str(BASE_DIR / 'tokenizers' / 'tokenizer.json'))
+LLM_TOKENIZER_MARGIN = config('LLM_TOKENIZER_MARGIN', default=0.1, cast=float)
+LLM_PROMPT_TOKEN_BUDGET = config('LLM_PROMPT_TOKEN_BUDGET', default=24000, cast=int)
+LLM_HISTORY_TOKEN_BUDGET = config('LLM_HISTORY_TOKEN_BUDGET', default=2000, cast=int)
+
+# Chunks fixados por intenção: quando a pergunta contém uma das palavras-chave,
+# o chunk do arquivo indicado (que contenha todos os trechos) é incluído no contexto.
+# Os IDs são resolvidos uma vez por processo e buscados diretamente pelo ID.
+RAG_PINNED_CHUNKS = {
+    'paineis': {
+        'keywords': [
+            'painéis', 'painel', 'panel', 'paineis',
+            'disponíveis', 'transparência', 'dashboards',
+            'compras governamentais', 'pncp', 'município',
+            'fornecedores', 'contratos públicos',
+        ],
+        'filename': 'resumo_fontes_transparencia_ativa.md',
+        'contains': ['Painel de Compras Governamentais'],
+    },
+}
+
+# Cache semântico de respostas (perguntas quase idênticas reaproveitam a resposta)
+ANSWER_CACHE_SIZE = config('ANSWER_CACHE_SIZE', default=512, cast=int)
+ANSWER_CACHE_THRESHOLD = config('ANSWER_CACHE_THRESHOLD', default=0.95, cast=float)
+
 # Configurações de segurança para produção
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
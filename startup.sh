@@ -26,10 +26,16 @@ else:
     print('Superuser já existe')
 "
 
+# Baixar o tokenizador usado na contagem de tokens (os workers só leem o arquivo local)
+echo "🔤 Verificando tokenizador..."
+python manage.py download_tokenizer || echo "⚠️ Tokenizador indisponível; a contagem de tokens será estimada"
+
 echo "✅ Setup completo! Iniciando servidor..."
 
-# Iniciar o servidor Gunicorn
-exec gunicorn core.wsgi:application \
+# Iniciar o servidor Gunicorn com workers ASGI (uvicorn): cada processo atende muitas
+# perguntas simultâneas, pois a espera pelo LLM não bloqueia o worker
+exec gunicorn core.asgi:application \
+    --worker-class uvicorn_worker.UvicornWorker \
     --bind 0.0.0.0:8000 \
     --workers 2 \
     --timeout 120 \